@@ -0,0 +1,28 @@
+"""MySQL/MariaDB backend with a bounded connection pool per process, see pool.py.
+
+Enabled with `"OPTIONS": {"pool": True}` or `{"pool": {"max_size": 10, "timeout": 10, "max_lifetime": 3600}}`,
+with `CONN_MAX_AGE = 0` so Django gives the connection back to the pool at the end of every request.
+"""
+
+from django.db.backends.mysql import base
+
+from .pool import ConnectionPool, get_pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    pool: ConnectionPool | None = None
+
+    def get_new_connection(self, conn_params):
+        conn_params = dict(conn_params)
+        if not (options := conn_params.pop("pool", None)):
+            return super().get_new_connection(conn_params)
+        options = options if isinstance(options, dict) else {}
+        key = tuple(conn_params.get(name) for name in ("host", "port", "unix_socket", "database", "user"))
+        self.pool = get_pool((self.alias, *key), lambda: ConnectionPool(**options))
+        return self.pool.checkout(lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+
+    def _close(self):
+        if self.connection is None or self.pool is None:
+            return super()._close()
+        # a connection closed inside a transaction (e.g. after an error) is not reused
+        self.pool.checkin(self.connection, reusable=not self.in_atomic_block)
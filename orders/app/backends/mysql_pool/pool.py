@@ -0,0 +1,179 @@
+"""Bounded pool of DB-API connections, shared by the threads of a process.
+
+Checking out takes an idle connection (the most recently returned one, so few connections stay warm) and pings it,
+connections that fail the ping or are older than `max_lifetime` are closed and replaced. A new connection is opened
+only while fewer than `max_size` are in use, otherwise the caller waits up to `timeout` seconds for one to be
+returned. Returned connections are rolled back before they are handed out again.
+
+Checkouts only ever block a thread: Django runs database code in threads under ASGI too (sync views and the async
+ORM both go through sync_to_async), never on the event loop.
+A connection that is never returned (its thread died without closing it) frees its slot once garbage collected.
+"""
+
+import threading
+import time
+import weakref
+from typing import Any, Callable
+
+from django.db.utils import OperationalError
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, max_size: int = 10, timeout: float = 10, max_lifetime: float = 3600):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self._idle: list[tuple[Any, float]] = []  # (connection, opened at)
+        self._opened_at: dict[int, float] = {}  # by id() of the checked out connections
+        self._leases: dict[int, weakref.finalize] = {}
+        self._condition = threading.Condition()
+        self.in_use = 0
+        self.waiting = 0
+        self.created = 0
+        self.recycled = 0  # closed because expired, broken, or lost
+        self.timeouts = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._condition:
+            return {
+                "in_use": self.in_use,
+                "idle": len(self._idle),
+                "waiting": self.waiting,
+                "created": self.created,
+                "recycled": self.recycled,
+                "timeouts": self.timeouts,
+            }
+
+    def _expired(self, opened_at: float) -> bool:
+        return bool(self.max_lifetime) and time.monotonic() - opened_at > self.max_lifetime
+
+    @staticmethod
+    def _is_alive(connection: Any) -> bool:
+        try:
+            connection.ping()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close(connection: Any) -> None:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _release_slot(self, recycled: bool = False) -> None:
+        with self._condition:
+            self.in_use -= 1
+            self.recycled += recycled
+            self._condition.notify()
+
+    def _lease(self, connection: Any, opened_at: float) -> Any:
+        key = id(connection)
+        self._opened_at[key] = opened_at
+        self._leases[key] = weakref.finalize(connection, self._lost, key)
+        return connection
+
+    def _lost(self, key: int) -> None:
+        """The connection was garbage collected while checked out"""
+        self._opened_at.pop(key, None)
+        self._leases.pop(key, None)
+        self._release_slot(recycled=True)
+
+    def checkout(self, connect: Callable[[], Any]) -> Any:
+        """A connection from the pool, or a new one opened with `connect`"""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._condition:
+                while not self._idle and self.in_use >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout(f"No database connection available after {self.timeout}s")
+                    self.waiting += 1
+                    try:
+                        self._condition.wait(remaining)
+                    finally:
+                        self.waiting -= 1
+                self.in_use += 1
+                idle = self._idle.pop() if self._idle else None
+
+            if idle is None:
+                try:
+                    connection = connect()
+                except BaseException:
+                    self._release_slot()
+                    raise
+                with self._condition:
+                    self.created += 1
+                return self._lease(connection, time.monotonic())
+
+            connection, opened_at = idle
+            if not self._expired(opened_at) and self._is_alive(connection):
+                return self._lease(connection, opened_at)
+            self._close(connection)
+            self._release_slot(recycled=True)
+
+    def checkin(self, connection: Any, reusable: bool = True) -> None:
+        """Take the connection back, it is closed instead of kept when not `reusable`, expired, or broken"""
+        key = id(connection)
+        if (lease := self._leases.pop(key, None)) is not None:
+            lease.detach()
+        opened_at = self._opened_at.pop(key, 0.0)
+        if reusable and not self._expired(opened_at):
+            try:
+                connection.rollback()
+            except Exception:
+                reusable = False
+        else:
+            reusable = False
+        if not reusable:
+            self._close(connection)
+        with self._condition:
+            self.in_use -= 1
+            if reusable:
+                self._idle.append((connection, opened_at))
+            else:
+                self.recycled += 1
+            self._condition.notify()
+
+    def close(self) -> None:
+        """Close the idle connections, checked out ones are closed when returned"""
+        with self._condition:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            self._close(connection)
+
+
+_pools: dict[tuple, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key: tuple, factory: Callable[[], ConnectionPool]) -> ConnectionPool:
+    with _pools_lock:
+        if (pool := _pools.get(key)) is None:
+            pool = _pools[key] = factory()
+        return pool
+
+
+def pool_stats() -> dict[str, dict[str, int]]:
+    """Stats of the pools of this process by database alias (pools of the same alias are summed)"""
+    with _pools_lock:
+        pools = list(_pools.items())
+    stats: dict[str, dict[str, int]] = {}
+    for (alias, *_), pool in pools:
+        for name, value in pool.stats().items():
+            alias_stats = stats.setdefault(alias, {})
+            alias_stats[name] = alias_stats.get(name, 0) + value
+    return stats
+
+
+def close_pools() -> None:
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close()
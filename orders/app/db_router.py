@@ -0,0 +1,200 @@
+"""Send reads to replica databases, and a client that just wrote back to the primary.
+
+`ReplicaRouter` sends reads of unmanaged models (the `taxed_article` and `order_details` views) and every read of the
+views decorated with `replica_reads` (the list endpoints) to one of the DATABASE_REPLICAS aliases, picked in turn
+(`round-robin`) or by the lowest recent query latency (`least-latency`). Everything else goes to the primary.
+
+Replicas lag behind the primary, so a client reads its own writes from the primary: views decorated with
+`pins_primary` send the rest of the request to the primary, and `ReplicaStickinessMiddleware` sets a cookie that
+keeps the next requests of the client on the primary for STICKY_SECONDS. Reads in a transaction of the primary stay
+on the primary too.
+Rows that are cached for every client (FullArticle.cacheable, behind the article cache) are loaded from the primary.
+"""
+
+import itertools
+import threading
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import wraps
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.http import HttpRequest
+
+STICKY_COOKIE = "db_primary"
+LATENCY_WEIGHT = 0.2  # of the last query in the moving average
+
+
+@dataclass
+class RoutingState:
+    replica_reads: bool = False
+    pinned: bool = False  # to the primary, for the rest of the request
+    wrote: bool = False  # through a `pins_primary` view, the client sticks to the primary
+
+
+_state: ContextVar[RoutingState | None] = ContextVar("db_routing_state", default=None)
+
+
+def _config() -> dict:
+    return getattr(settings, "DATABASE_REPLICAS", {})
+
+
+class ReplicaSelector:
+    def __init__(self):
+        self.latencies: dict[str, float] = {}  # moving average of the query latency, by alias
+        self._turns = itertools.count()
+        self._lock = threading.Lock()
+
+    def pick(self, aliases: list[str], selection: str) -> str:
+        if selection == "least-latency":
+            # replicas without queries yet come first, to be measured
+            return min(aliases, key=lambda alias: self.latencies.get(alias, 0.0))
+        with self._lock:
+            turn = next(self._turns)
+        return aliases[turn % len(aliases)]
+
+    def observe(self, alias: str, seconds: float) -> None:
+        previous = self.latencies.get(alias)
+        self.latencies[alias] = seconds if previous is None else previous + LATENCY_WEIGHT * (seconds - previous)
+
+
+selector = ReplicaSelector()
+
+
+def _record_latency(execute, sql, params, many, context):
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        selector.observe(context["connection"].alias, perf_counter() - start)
+
+
+def _install_latency_recorder(sender, connection, **kwargs) -> None:
+    if connection.alias != DEFAULT_DB_ALIAS and _record_latency not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_latency)
+
+
+def _in_transaction() -> bool:
+    """In a transaction of the primary, those of test cases aside"""
+    return any(not atomic._from_testcase for atomic in connections[DEFAULT_DB_ALIAS].atomic_blocks)
+
+
+class ReplicaRouter:
+    def __init__(self):
+        connection_created.connect(_install_latency_recorder, dispatch_uid="app.db_router")
+        for connection in connections.all(initialized_only=True):
+            _install_latency_recorder(None, connection)
+
+    def db_for_read(self, model, **hints):
+        config = _config()
+        if not (aliases := config.get("ALIASES")):
+            return None
+        state = _state.get()
+        if state is not None and state.pinned:
+            return DEFAULT_DB_ALIAS
+        if (model._meta.managed and not (state and state.replica_reads)) or _in_transaction():
+            return DEFAULT_DB_ALIAS
+        return selector.pick(aliases, config.get("SELECTION", "round-robin"))
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
+
+
+def _routed(view, update):
+    """Wrap `view` to run `update(state)` first"""
+
+    def enter():
+        state = _state.get()
+        if state is None:
+            # outside of the middleware, the state lasts for the view
+            return _state.set(update(RoutingState()))
+        update(state)
+
+    if iscoroutinefunction(view):
+
+        @wraps(view)
+        async def routed_view(*args, **kwargs):
+            token = enter()
+            try:
+                return await view(*args, **kwargs)
+            finally:
+                if token is not None:
+                    _state.reset(token)
+
+    else:
+
+        @wraps(view)
+        def routed_view(*args, **kwargs):
+            token = enter()
+            try:
+                return view(*args, **kwargs)
+            finally:
+                if token is not None:
+                    _state.reset(token)
+
+    return routed_view
+
+
+def replica_reads(view):
+    """The reads of the view go to a replica, unless the client sticks to the primary.
+    Put it above `paginate`: querysets are evaluated by the pagination
+    """
+
+    def update(state: RoutingState) -> RoutingState:
+        state.replica_reads = True
+        return state
+
+    return _routed(view, update)
+
+
+def pins_primary(view):
+    """The view writes: its reads, and those of the client for STICKY_SECONDS, go to the primary"""
+
+    def update(state: RoutingState) -> RoutingState:
+        state.pinned = state.wrote = True
+        return state
+
+    return _routed(view, update)
+
+
+class ReplicaStickinessMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def _stick(self, state: RoutingState, response):
+        if state.wrote and (seconds := _config().get("STICKY_SECONDS", 0)) > 0:
+            response.set_cookie(STICKY_COOKIE, "1", max_age=seconds, httponly=True, samesite="Lax")
+        return response
+
+    def __call__(self, request: HttpRequest):
+        if self.is_async:
+            return self.__acall__(request)
+        state = RoutingState(pinned=STICKY_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._stick(state, response)
+
+    async def __acall__(self, request: HttpRequest):
+        state = RoutingState(pinned=STICKY_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._stick(state, response)
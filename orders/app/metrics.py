@@ -0,0 +1,227 @@
+"""Request and SQL metrics by API operation, served in the Prometheus text format at /api/metrics.
+
+`MetricsMiddleware` times every request and labels it with the route it resolved to (e.g.
+`GET /api/inventory/article/<int:id>`), a DB execute wrapper counts and times the SQL queries run while serving it.
+The wrapper is installed on every new DB connection, and finds the request it works for through a context variable,
+so queries run by async views in sync_to_async threads are counted too.
+
+Memory is bounded: latencies go to fixed histogram buckets, and after MAX_OPERATIONS distinct operations the new
+ones are counted as `other`. Metrics are kept per process, every worker process has to be scraped.
+"""
+
+import threading
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpRequest, HttpResponse
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_OPERATIONS = 500
+OTHER_OPERATION = "other"
+
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    sql_seconds: float = 0.0
+
+
+@dataclass
+class OperationMetrics:
+    requests: dict[int, int] = field(default_factory=dict)  # by status code
+    latency_buckets: list[int] = field(default_factory=lambda: [0] * len(LATENCY_BUCKETS))
+    latency_sum: float = 0.0
+    latency_count: int = 0
+    queries: int = 0
+    sql_seconds: float = 0.0
+
+
+class MetricsRegistry:
+    def __init__(self, max_operations: int = MAX_OPERATIONS):
+        self.max_operations = max_operations
+        self.operations: dict[str, OperationMetrics] = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation: str, status: int, seconds: float, stats: RequestStats) -> None:
+        with self._lock:
+            if (metrics := self.operations.get(operation)) is None:
+                if len(self.operations) >= self.max_operations:
+                    operation = OTHER_OPERATION
+                metrics = self.operations.setdefault(operation, OperationMetrics())
+            metrics.requests[status] = metrics.requests.get(status, 0) + 1
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    metrics.latency_buckets[i] += 1
+                    break
+            metrics.latency_sum += seconds
+            metrics.latency_count += 1
+            metrics.queries += stats.queries
+            metrics.sql_seconds += stats.sql_seconds
+
+    def clear(self) -> None:
+        with self._lock:
+            self.operations.clear()
+
+    def render(self) -> str:
+        """The metrics in the Prometheus text exposition format"""
+        with self._lock:
+            operations = sorted(self.operations.items())
+            lines = [
+                "# HELP api_requests_total Requests by operation and status code.",
+                "# TYPE api_requests_total counter",
+            ]
+            for operation, metrics in operations:
+                for status, count in sorted(metrics.requests.items()):
+                    lines.append(f'api_requests_total{{operation="{_escape(operation)}",status="{status}"}} {count}')
+
+            lines += [
+                "# HELP api_request_duration_seconds Request latency by operation.",
+                "# TYPE api_request_duration_seconds histogram",
+            ]
+            for operation, metrics in operations:
+                label = f'operation="{_escape(operation)}"'
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, metrics.latency_buckets):
+                    cumulative += count
+                    lines.append(f'api_request_duration_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f'api_request_duration_seconds_bucket{{{label},le="+Inf"}} {metrics.latency_count}')
+                lines.append(f"api_request_duration_seconds_sum{{{label}}} {metrics.latency_sum}")
+                lines.append(f"api_request_duration_seconds_count{{{label}}} {metrics.latency_count}")
+
+            lines += [
+                "# HELP api_sql_queries_total SQL queries run while serving the operation.",
+                "# TYPE api_sql_queries_total counter",
+            ]
+            lines += [
+                f'api_sql_queries_total{{operation="{_escape(operation)}"}} {metrics.queries}'
+                for operation, metrics in operations
+            ]
+            lines += [
+                "# HELP api_sql_duration_seconds_total Time spent in SQL queries while serving the operation.",
+                "# TYPE api_sql_duration_seconds_total counter",
+            ]
+            lines += [
+                f'api_sql_duration_seconds_total{{operation="{_escape(operation)}"}} {metrics.sql_seconds}'
+                for operation, metrics in operations
+            ]
+        return "\n".join(lines + _article_cache_lines() + _db_pool_lines()) + "\n"
+
+
+def _escape(label_value: str) -> str:
+    return label_value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _article_cache_lines() -> list[str]:
+    from inventory.cache import article_cache
+
+    stats = article_cache.stats()
+    return [
+        "# HELP inventory_article_cache_hits_total Article lookups served from the cache.",
+        "# TYPE inventory_article_cache_hits_total counter",
+        f"inventory_article_cache_hits_total {stats['hits']}",
+        "# HELP inventory_article_cache_misses_total Article lookups that went to the database.",
+        "# TYPE inventory_article_cache_misses_total counter",
+        f"inventory_article_cache_misses_total {stats['misses']}",
+        "# HELP inventory_article_cache_entries Articles in the in-process cache.",
+        "# TYPE inventory_article_cache_entries gauge",
+        f"inventory_article_cache_entries {stats['entries']}",
+    ]
+
+
+DB_POOL_METRICS = {
+    # pool stat: (metric, type, help)
+    "in_use": ("db_pool_connections_in_use", "gauge", "Pooled connections checked out."),
+    "idle": ("db_pool_connections_idle", "gauge", "Pooled connections waiting to be checked out."),
+    "waiting": ("db_pool_waiting_threads", "gauge", "Threads waiting for a pooled connection."),
+    "created": ("db_pool_connections_created_total", "counter", "Connections opened by the pool."),
+    "recycled": ("db_pool_connections_recycled_total", "counter", "Pooled connections closed as expired or broken."),
+    "timeouts": ("db_pool_timeouts_total", "counter", "Checkouts that gave up waiting for a connection."),
+}
+
+
+def _db_pool_lines() -> list[str]:
+    from app.backends.mysql_pool.pool import pool_stats
+
+    stats = pool_stats()
+    if not stats:
+        return []
+    lines = []
+    for stat, (metric, kind, description) in DB_POOL_METRICS.items():
+        lines += [f"# HELP {metric} {description}", f"# TYPE {metric} {kind}"]
+        lines += [f'{metric}{{alias="{_escape(alias)}"}} {values[stat]}' for alias, values in stats.items()]
+    return lines
+
+
+registry = MetricsRegistry()
+_current_request: ContextVar[Optional[RequestStats]] = ContextVar("metrics_current_request", default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    if (stats := _current_request.get()) is None:
+        return execute(sql, params, many, context)
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.sql_seconds += perf_counter() - start
+
+
+def _install_query_recorder(sender, connection, **kwargs) -> None:
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _operation(request: HttpRequest) -> str:
+    if (match := getattr(request, "resolver_match", None)) is None:
+        return "unmatched"
+    return f"{request.method} /{match.route}"
+
+
+class MetricsMiddleware:
+    """Should be the first middleware, so the latency covers the other ones"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        connection_created.connect(_install_query_recorder, dispatch_uid="app.metrics")
+        for connection in connections.all(initialized_only=True):
+            _install_query_recorder(None, connection)
+
+    def __call__(self, request: HttpRequest):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current_request.set(stats)
+        start = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_request.reset(token)
+        registry.record(_operation(request), response.status_code, perf_counter() - start, stats)
+        return response
+
+    async def __acall__(self, request: HttpRequest):
+        stats = RequestStats()
+        token = _current_request.set(stats)
+        start = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_request.reset(token)
+        registry.record(_operation(request), response.status_code, perf_counter() - start, stats)
+        return response
+
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,42 @@
+"""JSON renderers of the API, picked with the API_JSON_RENDERER setting.
+
+`orjson` encodes large responses (e.g. a page of 1000 articles) several times faster than the standard library.
+Both render equivalent JSON: dates and times, decimals and the other types the standard library does not handle
+go through ninja's JSON encoder. The output is not byte for byte the same though: orjson writes non-ASCII characters
+as UTF-8 instead of `\\u` escapes, NaN and infinities as `null` instead of the invalid `NaN` and `Infinity`, and may
+write floats with a different number of digits.
+"""
+
+from typing import Any
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpRequest
+from ninja.renderers import BaseRenderer, JSONRenderer
+from ninja.responses import NinjaJSONEncoder
+
+
+class ORJSONRenderer(BaseRenderer):
+    media_type = "application/json"
+
+    def __init__(self):
+        try:
+            import orjson
+        except ImportError as e:
+            raise ImproperlyConfigured("API_JSON_RENDERER 'orjson' needs the orjson package") from e
+        self._dumps = orjson.dumps
+        self._option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        self._default = NinjaJSONEncoder().default
+
+    def render(self, request: HttpRequest, data: Any, *, response_status: int) -> Any:
+        return self._dumps(data, default=self._default, option=self._option)
+
+
+RENDERERS = {"json": JSONRenderer, "orjson": ORJSONRenderer}
+
+
+def renderer_from_settings() -> BaseRenderer:
+    name = getattr(settings, "API_JSON_RENDERER", "json")
+    if name not in RENDERERS:
+        raise ImproperlyConfigured(f"API_JSON_RENDERER should be one of {', '.join(RENDERERS)}, not {name!r}")
+    return RENDERERS[name]()
@@ -45,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'app.metrics.MetricsMiddleware',  # first, to time the whole request
+    'app.db_router.ReplicaStickinessMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -78,17 +80,70 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Connections come from a pool per process (app/backends/mysql_pool), returned at the end of every request
+# size it so that processes x DB_POOL_MAX_SIZE stays under the max_connections of the server
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        'ENGINE': 'app.backends.mysql_pool',
         'HOST': os.environ.get("DB_HOST", "0.0.0.0"),
         'NAME': os.environ.get("DB_NAME", "test_db"),
         'USER': os.environ.get("DB_USER", "root"),
         'PASSWORD': os.environ.get("DB_PASSWORD"),
         'PORT': os.environ.get("DB_PORT", "3309"),
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {
+            'pool': {
+                'max_size': int(os.environ.get("DB_POOL_MAX_SIZE", 10)),
+                'timeout': 10,
+                'max_lifetime': 3600,
+            },
+        },
+    }
+}
+
+
+# Read replicas (DB_REPLICAS: comma separated host:port), see app/db_router.py
+# reads of the views and of the list endpoints go to them, a client that wrote reads from the primary for a while
+
+DATABASE_REPLICAS = {
+    "ALIASES": [],
+    "SELECTION": os.environ.get("DB_REPLICA_SELECTION", "round-robin"),  # or "least-latency"
+    "STICKY_SECONDS": 5,
+}
+for i, replica in enumerate(filter(None, os.environ.get("DB_REPLICAS", "").split(",")), 1):
+    host, _, port = replica.partition(":")
+    DATABASES[f"replica{i}"] = {
+        **DATABASES["default"],
+        'HOST': host,
+        'PORT': port or DATABASES["default"]["PORT"],
+        'TEST': {'MIRROR': 'default'},
     }
+    DATABASE_REPLICAS["ALIASES"].append(f"replica{i}")
+
+DATABASE_ROUTERS = ["app.db_router.ReplicaRouter"]
+
+
+# Cache of single article lookups, see inventory/cache.py
+# use {"BACKEND": "django", "ALIAS": "default", "TTL": 30} to share it between worker processes
+
+INVENTORY_ARTICLE_CACHE = {
+    "BACKEND": "lru",
+    "MAX_ENTRIES": 10_000,
+    "TTL": 30,
 }
 
+# Past months of raw inventory audit rows to keep, older months are summarized by day (compact_inventory_audit)
+INVENTORY_AUDIT_KEEP_MONTHS = 3
+
+# Seconds the stock of an order line stays reserved after it was added, unless the order is checked out,
+# expired lines are removed by release_expired_reservations
+SALES_RESERVATION_SECONDS = 15 * 60
+
+# JSON renderer of the API, "json" (standard library) or "orjson" (faster on large responses, needs orjson),
+# see app/renderers.py
+API_JSON_RENDERER = os.environ.get("API_JSON_RENDERER", "json")
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
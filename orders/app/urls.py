@@ -20,12 +20,16 @@ from django.urls import path
 
 from ninja import NinjaAPI
 
-api = NinjaAPI()
+from .metrics import metrics_view
+from .renderers import renderer_from_settings
+
+api = NinjaAPI(renderer=renderer_from_settings())
 
 api.add_router("/inventory/", "inventory.api.router")
 api.add_router("/sales/", "sales.api.router")
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("api/metrics", metrics_view, name="metrics"),
     path("api/", api.urls),
 ]
@@ -0,0 +1,7 @@
+"""Benchmark suite of the API, run with `./manage.py benchmark`.
+
+The benchmark creates its own database (the test database settings, named `bench_<NAME>`), seeds it to a chosen
+scale, then runs fixed request scenarios through the Django test client (WSGI handler) or in-process ASGI.
+Latency percentiles, throughput and SQL queries per request are written to a JSON report, which can be compared
+with a stored baseline to catch regressions.
+"""
@@ -0,0 +1,133 @@
+"""Run the scenarios and compare the reports with a baseline"""
+
+import asyncio
+import random
+import statistics
+import threading
+from time import perf_counter
+
+from django.db import connections
+from django.test import AsyncClient, Client
+
+from app.metrics import registry
+
+from .scenarios import Request, Scenario
+from .seed import Dataset
+
+TRANSPORTS = ("wsgi", "asgi")
+
+
+def _run_wsgi(requests: list[Request], concurrency: int) -> list[tuple[Request, float, int]]:
+    """Send the requests through the WSGI handler, from `concurrency` threads with a client each"""
+    results: list[tuple[Request, float, int]] = []
+    pending = iter(requests)
+    lock = threading.Lock()
+
+    def worker():
+        client = Client()
+        try:
+            while True:
+                with lock:
+                    if (request := next(pending, None)) is None:
+                        return
+                start = perf_counter()
+                response = getattr(client, request.method)(request.path, query_params=request.params)
+                elapsed = perf_counter() - start
+                with lock:
+                    results.append((request, elapsed, response.status_code))
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _run_asgi(requests: list[Request], concurrency: int) -> list[tuple[Request, float, int]]:
+    """Send the requests through the ASGI handler, keeping `concurrency` of them in flight on one event loop"""
+
+    async def run():
+        client = AsyncClient()
+        pending = iter(requests)
+        results: list[tuple[Request, float, int]] = []
+
+        async def worker():
+            for request in pending:
+                start = perf_counter()
+                response = await getattr(client, request.method)(request.path, query_params=request.params)
+                results.append((request, perf_counter() - start, response.status_code))
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return results
+
+    return asyncio.run(run())
+
+
+def percentiles(latencies: list[float]) -> dict[str, float]:
+    """p50, p95 and p99 (ms) of the `latencies` (s), interpolated between the samples"""
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return {f"p{p}_ms": round(cuts[p - 1] * 1000, 3) for p in (50, 95, 99)}
+
+
+def run_scenario(
+    scenario: Scenario,
+    dataset: Dataset,
+    transport: str,
+    iterations: int,
+    warmup: int = 0,
+    concurrency: int = 1,
+    seed: int = 0,
+) -> dict:
+    """Latency percentiles (ms), throughput and SQL queries per request of `iterations` requests of the scenario.
+    Queries are counted by the metrics middleware, so they include every query run while serving the requests
+    """
+    run = _run_asgi if transport == "asgi" else _run_wsgi
+    scenario.setup(dataset)
+    rng = random.Random(seed)
+    requests = [scenario.request(rng, dataset) for _ in range(warmup + iterations)]
+
+    done = run(requests[:warmup], concurrency) if warmup else []
+    registry.clear()
+    start = perf_counter()
+    results = run(requests[warmup:], concurrency)
+    elapsed = perf_counter() - start
+    done += results
+    scenario.cleanup([request for request, _, status in done if status < 400])
+
+    operations = list(registry.operations.values())
+    served = sum(metrics.latency_count for metrics in operations)
+    return {
+        "requests": len(results),
+        "errors": sum(status >= 400 for _, _, status in results),
+        **percentiles([latency for _, latency, _ in results]),
+        "throughput_rps": round(len(results) / elapsed, 2) if elapsed else 0.0,
+        "queries_per_request": round(sum(metrics.queries for metrics in operations) / served, 2) if served else 0.0,
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> tuple[list[str], list[str]]:
+    """Compare the results of both reports, return (summary lines, regressions).
+    Latency and throughput may be off by `tolerance` (a fraction), queries per request may not grow
+    """
+    lines, regressions = [], []
+    for key, result in sorted(report["results"].items()):
+        if (base := baseline.get("results", {}).get(key)) is None:
+            lines.append(f"{key}: not in the baseline")
+            continue
+        lines.append(
+            f"{key}: p95 {base['p95_ms']} -> {result['p95_ms']} ms"
+            f", {base['throughput_rps']} -> {result['throughput_rps']} req/s"
+            f", {base['queries_per_request']} -> {result['queries_per_request']} queries/req"
+        )
+        if result["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{key}: p95 latency {base['p95_ms']} -> {result['p95_ms']} ms")
+        if result["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{key}: throughput {base['throughput_rps']} -> {result['throughput_rps']} req/s")
+        if result["queries_per_request"] > base["queries_per_request"]:
+            regressions.append(
+                f"{key}: queries per request {base['queries_per_request']} -> {result['queries_per_request']}"
+            )
+    return lines, regressions
@@ -0,0 +1,117 @@
+"""Fixed request scenarios, every scenario draws its requests from a seeded random generator"""
+
+import abc
+import random
+from collections import Counter
+from dataclasses import dataclass, field
+
+from inventory.models import InventoryArticle
+from sales.models import PurchaceOrder
+
+from .seed import Dataset
+
+PAGE_SIZE = 50
+HOT_STOCK = 1_000_000  # enough for every checkout of a run
+
+
+@dataclass(frozen=True)
+class Request:
+    method: str
+    path: str
+    params: dict = field(default_factory=dict)  # sent in the query string
+
+
+class Scenario(abc.ABC):
+    name: str
+
+    @classmethod
+    def variants(cls, options: dict) -> list[tuple[str, "Scenario"]]:
+        """(report name, scenario) of each run of the scenario asked for by the benchmark command `options`"""
+        return [(cls.name, cls())]
+
+    def setup(self, dataset: Dataset) -> None:
+        """Prepare the database before the requests are sent"""
+
+    @abc.abstractmethod
+    def request(self, rng: random.Random, dataset: Dataset) -> Request:
+        """The next request of the run, drawn from `rng`"""
+
+    def cleanup(self, done: list[Request]) -> None:
+        """Undo the changes of the successful requests, so runs on a kept database stay comparable"""
+
+
+class ListArticles(Scenario):
+    """A page of the catalog at a random offset"""
+
+    name = "list_articles"
+
+    def request(self, rng, dataset):
+        offset = rng.randrange(max(len(dataset.article_ids) - PAGE_SIZE, 1))
+        return Request("get", "/api/inventory/articles", {"limit": PAGE_SIZE, "offset": offset})
+
+
+class GetArticle(Scenario):
+    name = "get_article"
+
+    def request(self, rng, dataset):
+        return Request("get", f"/api/inventory/article/{rng.choice(dataset.article_ids)}")
+
+
+class UpdateOrder(Scenario):
+    """Add one unit of a random article to a random order"""
+
+    name = "update_order"
+
+    def request(self, rng, dataset):
+        _, reference = rng.choice(dataset.orders)
+        return Request(
+            "post",
+            f"/api/sales/order/updateitem/{reference}",
+            {"article_id": rng.choice(dataset.article_ids), "quantity_change": 1},
+        )
+
+    def cleanup(self, done):
+        added = Counter((request.path.rsplit("/", 1)[1], request.params["article_id"]) for request in done)
+        for (reference, article_id), quantity in added.items():
+            PurchaceOrder.objects.get(reference=reference).update_article(article_id=article_id, quantity=-quantity)
+
+
+class HotCheckout(UpdateOrder):
+    """Add one unit of the same article to a random order: every checkout competes for the stock of that article.
+    Its stock is split across `slots` rows (see InventoryArticle.shard), run it with increasing concurrency and slot
+    counts to see the throughput it gains
+    """
+
+    name = "hot_checkout"
+
+    def __init__(self, slots: int = 0):
+        self.slots = slots
+
+    @classmethod
+    def variants(cls, options):
+        return [(f"{cls.name}_{slots}_slots", cls(slots)) for slots in options.get("stock_slots") or [0]]
+
+    def setup(self, dataset):
+        InventoryArticle.set_stock(article_id=dataset.article_ids[0], quantity=HOT_STOCK)
+        InventoryArticle.shard(article_id=dataset.article_ids[0], slots=self.slots)
+
+    def request(self, rng, dataset):
+        _, reference = rng.choice(dataset.orders)
+        return Request(
+            "post",
+            f"/api/sales/order/updateitem/{reference}",
+            {"article_id": dataset.article_ids[0], "quantity_change": 1},
+        )
+
+
+class OrderDetails(Scenario):
+    name = "order_details"
+
+    def request(self, rng, dataset):
+        order_id, reference = rng.choice(dataset.orders)
+        return Request("get", f"/api/sales/order/view/{reference}", {"order_id": order_id})
+
+
+SCENARIOS: dict[str, type[Scenario]] = {
+    scenario.name: scenario for scenario in (ListArticles, GetArticle, UpdateOrder, HotCheckout, OrderDetails)
+}
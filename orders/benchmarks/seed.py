@@ -0,0 +1,271 @@
+"""Generate a deterministic catalog, price history, order and audit dataset, fast enough for millions of rows.
+
+Rows are generated in batches of articles (or orders) with a seeded random generator and explicit primary keys,
+then loaded with multi-row INSERTs, or with LOAD DATA LOCAL INFILE from temporary tab separated files.
+Orders pick their articles with a Zipf-like popularity: a few hot articles are in many orders.
+Line prices are set from the price history at order time with a single UPDATE, then the order totals are rebuilt.
+"""
+
+import random
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.db import connection, models
+from django.db.models import Max
+
+from inventory.models import Article, Category, InventoryArticle, InventoryAudit, PricedArticle
+from sales.models import CategoryTax, OrderArticle, PurchaceOrder, Tax
+
+
+@dataclass(frozen=True)
+class Scale:
+    articles: int
+    price_points: int  # per article
+    orders: int
+    lines_per_order: int = 5
+    categories: int = 50
+    audit_events: int = 0  # per article
+    zipf_exponent: float = 1.1
+    history_days: int = 365
+
+
+SCALES = {
+    "tiny": Scale(articles=200, price_points=3, orders=50, lines_per_order=3, categories=5),
+    "small": Scale(articles=10_000, price_points=5, orders=1_000),
+    "large": Scale(articles=1_000_000, price_points=20, orders=1_000_000, audit_events=10),
+}
+
+TAXES = {"standard": "0.210", "reduced": "0.100", "super-reduced": "0.040"}
+MAX_STOCK = 1_000
+
+
+@dataclass
+class Dataset:
+    """Ids the scenarios pick their requests from"""
+
+    article_ids: list[int]
+    orders: list[tuple[int, str]]  # (id, reference)
+
+    @classmethod
+    def load(cls) -> "Dataset":
+        return cls(
+            article_ids=list(Article.objects.order_by("id").values_list("id", flat=True)),
+            orders=list(PurchaceOrder.objects.order_by("id").values_list("id", "reference")),
+        )
+
+
+class InsertLoader:
+    """Multi-row INSERTs through the Django connection (mysqlclient turns executemany into multi-row statements)"""
+
+    def __init__(self, batch_size: int = 5_000):
+        self.batch_size = batch_size
+
+    def load(self, model: type[models.Model], columns: tuple[str, ...], rows: list[tuple]) -> None:
+        sql = (
+            f"INSERT INTO `{model._meta.db_table}` ({', '.join(f'`{column}`' for column in columns)}) "
+            f"VALUES ({', '.join(['%s'] * len(columns))})"
+        )
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), self.batch_size):
+                cursor.executemany(sql, rows[start : start + self.batch_size])
+
+    def close(self) -> None:
+        pass
+
+
+class LoadDataLoader:
+    """LOAD DATA LOCAL INFILE of temporary files, on a connection of its own with `local_infile` enabled.
+    The server must allow it too (`local_infile` is on by default in MariaDB)
+    """
+
+    def __init__(self):
+        params = {**connection.get_connection_params(), "local_infile": True}
+        params.pop("pool", None)  # a pooled connection would not have `local_infile`
+        self.connection = connection.get_new_connection(params)
+
+    def load(self, model: type[models.Model], columns: tuple[str, ...], rows: list[tuple]) -> None:
+        # generated values never contain tabs, new lines or backslashes
+        with tempfile.NamedTemporaryFile("w", suffix=".tsv", encoding="utf-8") as f:
+            f.writelines("\t".join(r"\N" if value is None else str(value) for value in row) + "\n" for row in rows)
+            f.flush()
+            with self.connection.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    LOAD DATA LOCAL INFILE %s INTO TABLE `{model._meta.db_table}` CHARACTER SET utf8mb4
+                    ({', '.join(f'`{column}`' for column in columns)})
+                    """,
+                    [f.name],
+                )
+            self.connection.commit()
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+LOADERS = {"insert": InsertLoader, "load-data": LoadDataLoader}
+
+
+def _next_id(model: type[models.Model]) -> int:
+    return (model.objects.aggregate(last=Max("pk"))["last"] or 0) + 1
+
+
+def _timestamp(when: datetime) -> str:
+    return when.replace(tzinfo=None).isoformat(" ")  # stored as naive UTC
+
+
+def _cents(cents: int) -> str:
+    return f"{cents // 100}.{cents % 100:02d}"
+
+
+def _seed_categories(scale: Scale, rng: random.Random, start: datetime, end: datetime) -> list[str]:
+    """Every category is taxed from before the history starts, a third of them change tax during the history"""
+    names = [f"category-{i}" for i in range(scale.categories)]
+    Category.objects.bulk_create([Category(name=name) for name in names], ignore_conflicts=True)
+    Tax.objects.bulk_create([Tax(reference=ref, value=value) for ref, value in TAXES.items()], ignore_conflicts=True)
+    category_taxes = [CategoryTax(category_id=name, tax_id=rng.choice(list(TAXES)), valid_from=start) for name in names]
+    category_taxes += [
+        CategoryTax(category_id=name, tax_id=rng.choice(list(TAXES)), valid_from=start + (end - start) * rng.random())
+        for name in names[: len(names) // 3]
+    ]
+    CategoryTax.objects.bulk_create(category_taxes)
+    return names
+
+
+def _seed_articles(
+    scale: Scale, rng: random.Random, loader, categories: list[str], start: datetime, end: datetime, batch_size: int
+) -> list[int]:
+    """Articles with their stock, price history and stock history, the first price of every article is at `start`"""
+    span = (end - start).total_seconds()
+    first_id = _next_id(Article)
+    article_ids = list(range(first_id, first_id + scale.articles))
+    for batch_start in range(0, scale.articles, batch_size):
+        ids = article_ids[batch_start : batch_start + batch_size]
+        created_at = _timestamp(start)
+        loader.load(
+            Article,
+            ("id", "date_created", "reference", "name", "description", "category_id"),
+            [
+                (id, created_at, f"seed-{id}", f"article-{id}", f"Generated article {id}", category)
+                for id, category in zip(ids, rng.choices(categories, k=len(ids)))
+            ],
+        )
+        stocks = [rng.randint(MAX_STOCK // 10, MAX_STOCK) for _ in ids]
+        loader.load(InventoryArticle, ("article_id", "quantity"), list(zip(ids, stocks)))
+
+        prices = []
+        for id in ids:
+            cents = rng.randint(100, 100_000)
+            offsets = sorted(rng.random() * span for _ in range(scale.price_points - 1))
+            prices.append((id, _cents(cents), _timestamp(start)))
+            for offset in offsets:
+                cents = max(1, round(cents * rng.uniform(0.9, 1.1)))
+                prices.append((id, _cents(cents), _timestamp(start + timedelta(seconds=offset))))
+        loader.load(PricedArticle, ("article_id", "price", "set_at"), prices)
+
+        if scale.audit_events:
+            events = []
+            for id, stock in zip(ids, stocks):
+                # walk back from the current stock
+                for offset in sorted((rng.random() * span for _ in range(scale.audit_events)), reverse=True):
+                    events.append((id, _timestamp(start + timedelta(seconds=offset)), stock))
+                    stock = max(0, stock + rng.randint(-20, 20))
+            loader.load(InventoryAudit, ("article_id", "event_date", "new_state"), events)
+    return article_ids
+
+
+def _zipf_cum_weights(n: int, exponent: float) -> list[float]:
+    return list(accumulate(1 / rank**exponent for rank in range(1, n + 1)))
+
+
+def _seed_orders(
+    scale: Scale, rng: random.Random, loader, article_ids: list[int], start: datetime, end: datetime, batch_size: int
+) -> int:
+    """Orders after the history start, with lines of popular articles, return the id of the first order"""
+    user, _ = get_user_model().objects.get_or_create(username="seed")
+    span = (end - start).total_seconds()
+    by_popularity = rng.sample(article_ids, len(article_ids))  # the hot articles are not the first ones
+    cum_weights = _zipf_cum_weights(len(by_popularity), scale.zipf_exponent)
+    first_id = _next_id(PurchaceOrder)
+    for batch_start in range(first_id, first_id + scale.orders, batch_size):
+        ids = range(batch_start, min(batch_start + batch_size, first_id + scale.orders))
+        loader.load(
+            PurchaceOrder,
+            ("id", "reference", "created_at", "created_by_id", "article_quantities", "total_pre_tax", "total_taxed"),
+            [
+                (
+                    id,
+                    f"seed-order-{id}",
+                    _timestamp(start + timedelta(seconds=rng.random() * span)),
+                    user.pk,
+                    "{}",
+                    0,
+                    0,
+                )
+                for id in ids
+            ],
+        )
+        picks = iter(rng.choices(by_popularity, cum_weights=cum_weights, k=len(ids) * scale.lines_per_order))
+        lines = []
+        for id in ids:
+            quantities: dict[int, int] = {}
+            for _ in range(scale.lines_per_order):
+                article_id = next(picks)
+                quantities[article_id] = quantities.get(article_id, 0) + rng.randint(1, 5)
+            lines += [(id, article_id, quantity) for article_id, quantity in quantities.items()]
+        loader.load(OrderArticle, ("purchace_order_id", "article_id", "quantity"), lines)
+    return first_id
+
+
+def _price_order_lines(first_order_id: int) -> None:
+    """Price and tax of the new lines at the time of their order"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE `{OrderArticle._meta.db_table}` `line`
+            JOIN `{PurchaceOrder._meta.db_table}` `o` ON (`o`.`id` = `line`.`purchace_order_id`)
+            JOIN `{Article._meta.db_table}` `article` ON (`article`.`id` = `line`.`article_id`)
+            SET
+                `line`.`unit_price` = (
+                    SELECT `price` FROM `{PricedArticle._meta.db_table}`
+                    WHERE `article_id` = `line`.`article_id` AND `set_at` <= `o`.`created_at`
+                    ORDER BY `set_at` DESC, `id` DESC
+                    LIMIT 1
+                )
+                , `line`.`tax_rate` = (
+                    SELECT `tax`.`value`
+                    FROM `{CategoryTax._meta.db_table}` `category_tax`
+                    JOIN `{Tax._meta.db_table}` `tax` ON (`tax`.`reference` = `category_tax`.`tax_id`)
+                    WHERE `category_tax`.`category_id` = `article`.`category_id`
+                        AND `category_tax`.`valid_from` <= `o`.`created_at`
+                    ORDER BY `category_tax`.`valid_from` DESC
+                    LIMIT 1
+                )
+            WHERE `line`.`purchace_order_id` >= %s
+            """,
+            [first_order_id],
+        )
+
+
+def seed(
+    scale: Scale, seed: int = 0, batch_size: int = 10_000, method: str = "insert", now: datetime | None = None
+) -> Dataset:
+    """Add `scale` rows to the database, the same seed on an empty database gives the same rows.
+    Set `now` to make the timestamps reproducible too
+    """
+    rng = random.Random(seed)
+    end = now or datetime.now(timezone.utc)
+    start = end - timedelta(days=scale.history_days)
+    loader = LOADERS[method]()
+    try:
+        categories = _seed_categories(scale, rng, start, end)
+        article_ids = _seed_articles(scale, rng, loader, categories, start, end, batch_size)
+        first_order_id = _seed_orders(scale, rng, loader, article_ids, start, end, batch_size)
+    finally:
+        loader.close()
+    _price_order_lines(first_order_id)
+    PurchaceOrder.rebuild_totals()
+    return Dataset.load()
+
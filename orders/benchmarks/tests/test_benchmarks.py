@@ -0,0 +1,132 @@
+"""Test Benchmarks:
+- latency percentiles: interpolated between the samples, a single sample is every percentile
+- baseline comparison: latency and throughput within the tolerance, queries per request may not grow
+- scenarios: the same seed draws the same requests, a scenario has to define its requests
+- seed generators: Zipf-like popularity weights, prices in cents
+- seeding the tiny scale: row counts of the scale, priced lines and consistent totals, the same seed gives the same rows
+"""
+
+import random
+from datetime import datetime, timezone
+
+import pytest
+from django.db import transaction
+
+from benchmarks.runner import compare, percentiles
+from benchmarks.scenarios import PAGE_SIZE, SCENARIOS, ListArticles, Scenario
+from benchmarks.seed import SCALES, Dataset, _cents, _zipf_cum_weights, seed
+from inventory.models import Article, InventoryArticle, PricedArticle
+from sales.models import OrderArticle, PurchaceOrder
+
+DATASET = Dataset(article_ids=list(range(1, 201)), orders=[(i, f"seed-order-{i}") for i in range(1, 51)])
+
+
+def result(p95_ms: float = 10.0, throughput_rps: float = 100.0, queries_per_request: float = 3.0) -> dict:
+    return {"p95_ms": p95_ms, "throughput_rps": throughput_rps, "queries_per_request": queries_per_request}
+
+
+def test_percentiles():
+    latencies = [i / 1000 for i in range(101, 0, -1)]  # 1 to 101 ms, unordered
+    assert percentiles(latencies) == {"p50_ms": 51.0, "p95_ms": 96.0, "p99_ms": 100.0}
+    assert percentiles([0.0125, 0.0135]) == {"p50_ms": 13.0, "p95_ms": 13.45, "p99_ms": 13.49}
+    assert percentiles([0.005]) == {"p50_ms": 5.0, "p95_ms": 5.0, "p99_ms": 5.0}
+
+
+def test_compare():
+    baseline = {"results": {"get_article/wsgi": result(), "list_articles/wsgi": result()}}
+    report = {
+        "results": {
+            "get_article/wsgi": result(p95_ms=11.9, throughput_rps=81.0),  # within 20%
+            "list_articles/wsgi": result(p95_ms=12.1, throughput_rps=79.0, queries_per_request=3.5),
+            "order_details/asgi": result(),
+        }
+    }
+    lines, regressions = compare(report, baseline, tolerance=0.2)
+    assert lines == [
+        "get_article/wsgi: p95 10.0 -> 11.9 ms, 100.0 -> 81.0 req/s, 3.0 -> 3.0 queries/req",
+        "list_articles/wsgi: p95 10.0 -> 12.1 ms, 100.0 -> 79.0 req/s, 3.0 -> 3.5 queries/req",
+        "order_details/asgi: not in the baseline",
+    ]
+    assert regressions == [
+        "list_articles/wsgi: p95 latency 10.0 -> 12.1 ms",
+        "list_articles/wsgi: throughput 100.0 -> 79.0 req/s",
+        "list_articles/wsgi: queries per request 3.0 -> 3.5",
+    ]
+    assert compare(report, report, tolerance=0)[1] == []
+
+
+@pytest.mark.parametrize("name", SCENARIOS)
+def test_scenario_requests_are_seeded(name):
+    (_, scenario), *_ = SCENARIOS[name].variants({})
+
+    def draw(seed: int) -> list:
+        rng = random.Random(seed)
+        return [scenario.request(rng, DATASET) for _ in range(20)]
+
+    assert draw(7) == draw(7)
+    assert draw(7) != draw(8)
+
+
+def test_list_articles_pages_stay_in_the_catalog():
+    rng = random.Random(0)
+    offsets = [ListArticles().request(rng, DATASET).params["offset"] for _ in range(500)]
+    assert 0 <= min(offsets) and max(offsets) + PAGE_SIZE <= len(DATASET.article_ids)
+
+
+def test_scenario_requests_are_required():
+    class NoRequests(Scenario):
+        name = "no_requests"
+
+    with pytest.raises(TypeError):
+        NoRequests()
+
+
+def test_seed_generators():
+    weights = _zipf_cum_weights(1000, 1.1)
+    assert weights[0] == 1
+    assert all(earlier < later for earlier, later in zip(weights, weights[1:]))
+    # the 10 most popular articles of 1000 get almost half of the picks
+    assert weights[9] / weights[-1] > 0.45
+    assert (_cents(5), _cents(100), _cents(123456)) == ("0.05", "1.00", "1234.56")
+
+
+def seeded_rows() -> dict[str, list]:
+    """The generated rows, without the auto-increment ids (a rolled back transaction does not give them back)"""
+    return {
+        "articles": list(Article.objects.order_by("id").values_list("id", "reference", "category_id")),
+        "stock": list(InventoryArticle.objects.order_by("article_id").values_list("article_id", "quantity")),
+        "prices": list(
+            PricedArticle.objects.order_by("article_id", "set_at").values_list("article_id", "price", "set_at")
+        ),
+        "orders": list(
+            PurchaceOrder.objects.order_by("id").values_list("id", "reference", "created_at", "total_taxed")
+        ),
+        "lines": list(
+            OrderArticle.objects.order_by("purchace_order_id", "article_id").values_list(
+                "purchace_order_id", "article_id", "quantity", "unit_price", "tax_rate"
+            )
+        ),
+    }
+
+
+@pytest.mark.django_db
+def test_seed_tiny_scale():
+    scale = SCALES["tiny"]
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    with transaction.atomic():
+        dataset = seed(scale, seed=3, now=now)
+        rows = seeded_rows()
+        transaction.set_rollback(True)
+    assert not Article.objects.exists()
+
+    assert len(rows["articles"]) == len(rows["stock"]) == scale.articles
+    assert len(rows["prices"]) == scale.articles * scale.price_points
+    assert len(rows["orders"]) == scale.orders
+    # articles drawn twice for an order are merged in one line
+    assert scale.orders <= len(rows["lines"]) <= scale.orders * scale.lines_per_order
+    assert all(unit_price is not None and tax_rate is not None for *_, unit_price, tax_rate in rows["lines"])
+    assert dataset.article_ids == [article_id for article_id, *_ in rows["articles"]]
+
+    seed(scale, seed=3, now=now)
+    assert seeded_rows() == rows
+    assert PurchaceOrder.totals_drift() == []
@@ -10,10 +10,12 @@ Sales:
     - PurchaceOrder: multiple creation dates
 """
 
+from django.conf import settings
 from django.utils.timezone import datetime, timedelta, make_aware
 import pytest
 from pytest_factoryboy import register
 
+from inventory.cache import article_cache
 from inventory.models import Category, Article, PricedArticle, InventoryArticle
 from sales.models import Tax, CategoryTax, PurchaceOrder
 
@@ -32,9 +34,28 @@ register(PurchaceOrderFactory)
 register(UserFactory)
 
 
+@pytest.fixture(scope="session")
+def django_db_modify_db_settings(django_db_modify_db_settings_parallel_suffix):
+    """A second schema of the test server stands in for a read replica, for the tests that ask for it.
+    Nothing replicates to it, the rows of a test are only in the schema they were written to
+    """
+    default = settings.DATABASES["default"]
+    test_name = default.get("TEST", {}).get("NAME") or f"test_{default['NAME']}"
+    settings.DATABASES["replica"] = {
+        **default,
+        "TEST": {**default.get("TEST", {}), "NAME": f"{test_name}_replica", "MIRROR": None},
+    }
+
+
 ######################
 ### Inventory
 ######################
+@pytest.fixture(autouse=True)
+def clear_article_cache():
+    """Tests reuse article ids, and transaction rollbacks never run the cache invalidations"""
+    article_cache.clear()
+
+
 @pytest.fixture(autouse=True)
 def product_category(db, category_factory: CategoryFactory) -> Category:
     category = category_factory.create()
@@ -71,6 +92,14 @@ def inventory_article_10(db, article1: Article, inventory_article_factory: Inven
     return item
 
 
+@pytest.fixture
+def priced_articles(db, article_factory: ArticleFactory, priced_article_factory: PricedArticleFactory) -> list[Article]:
+    articles = [article_factory.create(reference=f"priced-article-{i}") for i in range(5)]
+    for article in articles:
+        priced_article_factory.create(article=article)
+    return articles
+
+
 ######################
 ### Sales
 ######################
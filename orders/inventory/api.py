@@ -1,21 +1,54 @@
-from ninja import Router, Form
+from datetime import datetime, timedelta
+from typing import Iterator, Optional
+
+from asgiref.sync import sync_to_async
+from ninja import Router, Form, Query
 from ninja.errors import HttpError
 from ninja.pagination import paginate, LimitOffsetPagination
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.asgi import ASGIRequest
 from django.db.utils import IntegrityError
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from app.db_router import pins_primary, replica_reads
 
-from .models import Article, FullArticle, Category, StockAction
-from .schemas import CategorySchema, ArticleSchema, ArticleInput, ArticleCreateInput
+from . import export, importer
+from .cache import article_cache
+from .models import Article, FullArticle, Category, InventoryAudit, PricedArticle, StockAction
+from .pagination import KeysetPagination
+from .projection import project, schema_columns
+from .schemas import (
+    CategorySchema,
+    ArticleSchema,
+    ArticleInput,
+    ArticleCreateInput,
+    ArticleImportReport,
+    ArticleOrdering,
+    StockAdjustmentInput,
+    StockAdjustmentResult,
+    StockHistoryQuery,
+    StockHistoryBucket,
+    ArticleStockHistory,
+    TimeRangeQuery,
+    PriceSchema,
+    ArticlePriceSchema,
+)
 
 router = Router(tags=["Articles"])
 
+ARTICLE_COLUMNS = schema_columns(ArticleSchema)
+
 
 @router.get("/categories", response=list[CategorySchema])
+@replica_reads
 @paginate(LimitOffsetPagination)
-def list_categories(request):
+async def list_categories(request):
     return Category.objects.all()
 
 
 @router.post("/category/create")
+@pins_primary
 def create_category(request, category: Form[CategorySchema]):
     """Name will be converted to lower case"""
     try:
@@ -26,12 +59,31 @@ def create_category(request, category: Form[CategorySchema]):
 
 
 @router.get("/articles", response=list[ArticleSchema])
+@replica_reads
 @paginate(LimitOffsetPagination)
-def list_articles(request):
-    return FullArticle.objects.select_related("article__category").all()
+async def list_articles(request):
+    return project(FullArticle.objects.all(), ArticleSchema)
+
+
+ARTICLE_ORDERINGS = {
+    ArticleOrdering.id: ("article_id",),
+    ArticleOrdering.date_created: ("date_created", "article_id"),
+}
+
+
+@router.get("/articles/cursor", response=list[ArticleSchema])
+@replica_reads
+@paginate(KeysetPagination)
+async def list_articles_cursor(request, order_by: ArticleOrdering = ArticleOrdering.id):
+    """Like `/articles` but paginated with `next`/`previous` cursors, deep pages are as fast as the first one.
+
+    **with_count** adds the total number of articles, it is not computed by default because it scans the catalog.
+    """
+    return project(FullArticle.objects.order_by(*ARTICLE_ORDERINGS[order_by]), ArticleSchema)
 
 
 @router.post("/article/create")
+@pins_primary
 def create_article(request, data: Form[ArticleCreateInput]):
     try:
         Article.create_with_data(data=data)
@@ -40,7 +92,24 @@ def create_article(request, data: Form[ArticleCreateInput]):
         raise HttpError(400, err.args[0])
 
 
+@router.post("/articles/import", response=ArticleImportReport)
+@pins_primary
+def import_articles(
+    request,
+    format: importer.ImportFormat = importer.ImportFormat.ndjson,
+    batch_size: int = Query(1000, ge=1, le=10000),
+):
+    """Create many articles from the request body, streamed as NDJSON (one article per line)
+    or CSV (a header row then one article per row), with the same fields as `/article/create`.
+
+    Articles are written in batches of **batch_size**, rows with errors (e.g. duplicate reference) are reported and
+    skipped without aborting the import.
+    """
+    return importer.import_articles(request, format=format, batch_size=batch_size)
+
+
 @router.put("/article/update/{id}")
+@pins_primary
 def update_article(request, id: int, data: ArticleInput):
     if article := Article.objects.filter(pk=id).first():
         article.update_with_data(data=data)
@@ -48,14 +117,54 @@ def update_article(request, id: int, data: ArticleInput):
     raise HttpError(404, "Not found")
 
 
+def _streamed(request, parts: Iterator[bytes]):
+    """`parts` as an async iterator under ASGI, where Django would read a sync iterator in full before sending it.
+    Parts are still produced in the thread of the request, which holds its database connection
+    """
+    if not isinstance(request, ASGIRequest):
+        return parts
+
+    async def async_parts():
+        next_part = sync_to_async(next)
+        try:
+            while (part := await next_part(parts, None)) is not None:
+                yield part
+        finally:
+            await sync_to_async(parts.close)()
+
+    return async_parts()
+
+
+@router.get("/articles/export")
+def export_articles(
+    request,
+    format: export.ExportFormat = export.ExportFormat.ndjson,
+    chunk_size: int = Query(2000, ge=1, le=20000),
+):
+    """Download the whole catalog as NDJSON, CSV or Parquet, with the fields of `/articles`.
+
+    Rows are read **chunk_size** at a time from a server-side cursor and sent as soon as they are encoded, so the
+    export takes the same memory whatever the size of the catalog. Use it for full dumps instead of paging `/articles`
+    """
+    try:
+        # routed now, the rows are read after the view returned
+        parts = export.export_catalog(format, chunk_size=chunk_size, using=FullArticle.objects.all().db)
+    except ImproperlyConfigured as err:
+        raise HttpError(501, err.args[0])
+    response = StreamingHttpResponse(_streamed(request, parts), content_type=export.CONTENT_TYPES[format])
+    response["Content-Disposition"] = f'attachment; filename="catalog.{format}"'
+    return response
+
+
 @router.get("/article/{id}", response=ArticleSchema)
-def get_article(request, id: int):
-    if article := FullArticle.objects.filter(article_id=id).first():
+async def get_article(request, id: int):
+    if article := await article_cache.aget_or_load(id, FullArticle.cacheable(id, *ARTICLE_COLUMNS).afirst):
         return article
     raise HttpError(404, "Not found")
 
 
 @router.put("/article/price/update/{id}")
+@pins_primary
 def update_article_price(request, id: int, price: float):
     try:
         Article.update_price(article_id=id, price=price)
@@ -64,10 +173,85 @@ def update_article_price(request, id: int, price: float):
 
 
 @router.put("/article/stock/{action}/{id}")
+@pins_primary
 def update_article_stock(request, id: int, action: StockAction, amount: int):
     try:
         if Article.update_stock(article_id=id, action=action, amount=amount) > 0:
             return 200
         raise HttpError(404, "No matching articles")
-    except ValueError:
-        raise HttpError(400, "amount should be positive integer")
+    except ValueError as err:
+        raise HttpError(400, err.args[0])
+
+
+@router.put("/articles/stock", response=list[StockAdjustmentResult])
+@pins_primary
+def update_articles_stock(request, adjustments: list[StockAdjustmentInput]):
+    """Add or remove stock of many articles at once, all the changes are applied in a single transaction.
+
+    Each adjustment gets a **status**: `applied`, `not_found` when the article is not in the inventory,
+    or `rejected` when the amount is not positive or removing it would make the stock negative.
+    Adjustments of the same article are applied in order.
+    """
+    statuses = Article.update_stock_batch(
+        [(adjustment.article_id, adjustment.action, adjustment.amount) for adjustment in adjustments]
+    )
+    return [
+        StockAdjustmentResult(**adjustment.model_dump(), status=status) for adjustment, status in zip(adjustments, statuses)
+    ]
+
+
+STOCK_HISTORY_MAX_ARTICLES = 100
+PRICES_AS_OF_MAX_ARTICLES = 1000
+
+
+def _stock_history(article_ids: list[int], query: StockHistoryQuery) -> dict[int, list[dict]]:
+    end = query.end or timezone.now()
+    start = query.start or end - timedelta(days=1)
+    try:
+        return InventoryAudit.stock_history(article_ids, start=start, end=end, bucket=query.bucket)
+    except ValueError as err:
+        raise HttpError(400, err.args[0])
+
+
+@router.get("/article/{id}/stock-history", response=list[StockHistoryBucket])
+def article_stock_history(request, id: int, query: Query[StockHistoryQuery]):
+    """Stock level of the article over time, from **from** (a day before **to** by default) to **to** (now by default),
+    by **bucket** of time:
+    the `last`, `min` and `max` stock levels and the number of `changes` in the bucket.
+
+    Buckets are aligned on the Unix epoch (e.g. on the hour for `1h`), buckets without changes are left out.
+    """
+    if not Article.objects.filter(pk=id).exists():
+        raise HttpError(404, "Not found")
+    return _stock_history([id], query)[id]
+
+
+@router.get("/articles/stock-history", response=list[ArticleStockHistory])
+def articles_stock_history(
+    request, query: Query[StockHistoryQuery], ids: list[int] = Query(..., max_length=STOCK_HISTORY_MAX_ARTICLES)
+):
+    """Like `/article/{id}/stock-history` for many articles at once, unknown articles have no buckets"""
+    history = _stock_history(list(dict.fromkeys(ids)), query)
+    return [{"article_id": article_id, "buckets": buckets} for article_id, buckets in history.items()]
+
+
+@router.get("/article/{id}/prices", response=list[PriceSchema])
+@paginate(KeysetPagination)
+async def article_price_history(request, id: int, query: Query[TimeRangeQuery]):
+    """Prices of the article from **from** to **to** (excluded), most recent first"""
+    if not await Article.objects.filter(pk=id).aexists():
+        raise HttpError(404, "Not found")
+    prices = PricedArticle.objects.filter(article_id=id)
+    if query.start:
+        prices = prices.filter(set_at__gte=query.start)
+    if query.end:
+        prices = prices.filter(set_at__lt=query.end)
+    return prices.order_by("-set_at", "-id").values("id", "price", "set_at")
+
+
+@router.get("/articles/prices", response=list[ArticlePriceSchema])
+async def articles_price_as_of(
+    request, ids: list[int] = Query(..., max_length=PRICES_AS_OF_MAX_ARTICLES), at: Optional[datetime] = None
+):
+    """Price of each article at **at** (now by default), articles that had no price by then are left out"""
+    return [price async for price in PricedArticle.as_of(list(set(ids)), at or timezone.now())]
@@ -0,0 +1,128 @@
+"""Monthly partitions of the InventoryAudit table.
+
+Every stock change inserts an audit row, partitioning by month keeps the indexes of the table as small as a month
+of changes, and lets old months go with a DROP PARTITION instead of a huge DELETE.
+Partitions are named `p<YYYYMM>`, the last one (`pfuture`) catches rows after the last month.
+Before a month is dropped its rows are summarized in InventoryAuditDaily, one row per article and day.
+"""
+
+from datetime import date
+
+from django.db import connection
+
+from .models import InventoryAudit, InventoryAuditDaily
+
+FUTURE_PARTITION = "pfuture"
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, months: int) -> date:
+    years, month_index = divmod(month.month - 1 + months, 12)
+    return date(month.year + years, month_index + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"p{month:%Y%m}"
+
+
+def partition_month(name: str) -> date | None:
+    """The month of a partition, None for `pfuture`"""
+    if name == FUTURE_PARTITION:
+        return None
+    return date(int(name[1:5]), int(name[5:7]), 1)
+
+
+def _partition_definitions(first_month: date, last_month: date) -> list[str]:
+    definitions = []
+    month = first_month
+    while month <= last_month:
+        definitions.append(
+            f"PARTITION `{partition_name(month)}` VALUES LESS THAN ('{add_months(month, 1):%Y-%m-%d}')"
+        )
+        month = add_months(month, 1)
+    return definitions
+
+
+def partition_table_sql(first_month: date, last_month: date) -> str:
+    """Partition the table with one partition per month, the first one also holds everything older"""
+    definitions = _partition_definitions(first_month, last_month)
+    definitions.append(f"PARTITION `{FUTURE_PARTITION}` VALUES LESS THAN (MAXVALUE)")
+    return f"""
+    ALTER TABLE `{InventoryAudit._meta.db_table}`
+    PARTITION BY RANGE COLUMNS(`event_date`) (
+        {", ".join(definitions)}
+    )
+    """
+
+
+def list_partitions() -> list[str]:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT `PARTITION_NAME` FROM `information_schema`.`PARTITIONS`
+            WHERE `TABLE_SCHEMA` = DATABASE() AND `TABLE_NAME` = %s AND `PARTITION_NAME` IS NOT NULL
+            ORDER BY `PARTITION_ORDINAL_POSITION`
+            """,
+            [InventoryAudit._meta.db_table],
+        )
+        return [name for name, in cursor.fetchall()]
+
+
+def add_partitions(until: date) -> list[str]:
+    """Create the monthly partitions up to the month of `until`, return their names"""
+    months = [month for name in list_partitions() if (month := partition_month(name)) is not None]
+    first_month = add_months(max(months), 1) if months else month_start(until)
+    definitions = _partition_definitions(first_month, month_start(until))
+    if not definitions:
+        return []
+    definitions.append(f"PARTITION `{FUTURE_PARTITION}` VALUES LESS THAN (MAXVALUE)")
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            ALTER TABLE `{InventoryAudit._meta.db_table}`
+            REORGANIZE PARTITION `{FUTURE_PARTITION}` INTO ({", ".join(definitions)})
+            """
+        )
+    return [definition.split("`")[1] for definition in definitions[:-1]]
+
+
+def compact_partitions(before: date) -> list[str]:
+    """Summarize the partitions of the months before `before` in InventoryAuditDaily, then drop them.
+    Return the names of the dropped partitions. Summaries are upserted, so compaction can be run again after a failure
+    """
+    partitions = [
+        name
+        for name in list_partitions()
+        if (month := partition_month(name)) is not None and add_months(month, 1) <= month_start(before)
+    ]
+    with connection.cursor() as cursor:
+        for name in partitions:
+            cursor.execute(
+                f"""
+                INSERT INTO `{InventoryAuditDaily._meta.db_table}`
+                    (`article_id`, `day`, `closing_state`, `min_state`, `max_state`, `changes`)
+                SELECT
+                    `article_id`
+                    , DATE(`event_date`)
+                    , CAST(
+                        SUBSTRING_INDEX(GROUP_CONCAT(`new_state` ORDER BY `event_date` DESC, `id` DESC), ',', 1)
+                        AS UNSIGNED
+                    )
+                    , MIN(`new_state`)
+                    , MAX(`new_state`)
+                    , COUNT(*)
+                FROM `{InventoryAudit._meta.db_table}` PARTITION (`{name}`)
+                GROUP BY `article_id`, DATE(`event_date`)
+                ON DUPLICATE KEY UPDATE
+                    `closing_state` = VALUES(`closing_state`)
+                    , `min_state` = VALUES(`min_state`)
+                    , `max_state` = VALUES(`max_state`)
+                    , `changes` = VALUES(`changes`)
+                """
+            )
+            # DDL commits the summary
+            cursor.execute(f"ALTER TABLE `{InventoryAudit._meta.db_table}` DROP PARTITION `{name}`")
+    return partitions
@@ -0,0 +1,194 @@
+"""Read-through cache of single article lookups (FullArticle rows).
+
+Entries are invalidated after the transaction that changed the article commits, so readers never cache a value
+that is about to be rolled back. Tax changes invalidate every article of a category at once: entries remember the
+version of their category, and bumping that version makes them stale.
+The TTL is a safety net for what invalidation cannot see (e.g. a tax becoming valid as time passes, or the
+in-process backend of another worker process).
+
+Configured with the INVENTORY_ARTICLE_CACHE setting:
+    {"BACKEND": "lru", "MAX_ENTRIES": 10000, "TTL": 30}: in-process LRU, the default
+    {"BACKEND": "django", "ALIAS": "default", "TTL": 30}: any Django cache, shared between processes
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+class LRUBackend:
+    """Process-local least recently used cache, expired entries are dropped when read"""
+
+    def __init__(self, max_entries: int = 10_000):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, timeout: Optional[float]) -> None:
+        expires_at = float("inf") if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete_many(self, keys: list[str]) -> None:
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    async def aget(self, key: str) -> Any:
+        return self.get(key)
+
+    async def aset(self, key: str, value: Any, timeout: Optional[float]) -> None:
+        self.set(key, value, timeout)
+
+
+class DjangoCacheBackend:
+    """Any cache from the CACHES setting, clearing it clears the whole cache"""
+
+    def __init__(self, alias: str = "default"):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def __len__(self) -> int:
+        return 0  # unknown
+
+    def get(self, key: str) -> Any:
+        return self.cache.get(key)
+
+    def set(self, key: str, value: Any, timeout: Optional[float]) -> None:
+        self.cache.set(key, value, timeout)
+
+    def delete_many(self, keys: list[str]) -> None:
+        self.cache.delete_many(keys)
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+    async def aget(self, key: str) -> Any:
+        return await self.cache.aget(key)
+
+    async def aset(self, key: str, value: Any, timeout: Optional[float]) -> None:
+        await self.cache.aset(key, value, timeout)
+
+
+class ArticleCache:
+    """Cache article rows (dicts) by article id, rows should have an `article_category` key"""
+
+    def __init__(self, backend: LRUBackend | DjangoCacheBackend, ttl: float = 30):
+        self.backend = backend
+        self.ttl = ttl
+        # approximate under concurrency, good enough for monitoring
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_settings(cls) -> "ArticleCache":
+        config = getattr(settings, "INVENTORY_ARTICLE_CACHE", {})
+        if config.get("BACKEND", "lru") == "django":
+            backend = DjangoCacheBackend(config.get("ALIAS", "default"))
+        else:
+            backend = LRUBackend(config.get("MAX_ENTRIES", 10_000))
+        return cls(backend, ttl=config.get("TTL", 30))
+
+    @staticmethod
+    def _key(article_id: int) -> str:
+        return f"inventory:article:{article_id}"
+
+    @staticmethod
+    def _category_key(category: Optional[str]) -> str:
+        return f"inventory:category:{category}"
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.backend)}
+
+    @staticmethod
+    def _is_fresh(entry: Any, category_version: Any) -> bool:
+        # a missing category version (never set or evicted) cannot vouch for the entry
+        return entry is not None and category_version is not None and entry["version"] == category_version
+
+    def get_or_load(self, article_id: int, loader: Callable[[], Optional[dict]]) -> Optional[dict]:
+        """Return the cached row or the one returned by `loader`, missing articles (None) are not cached"""
+        entry = self.backend.get(self._key(article_id))
+        category_version = self.backend.get(self._category_key(entry["category"])) if entry is not None else None
+        if self._is_fresh(entry, category_version):
+            self.hits += 1
+            return entry["row"]
+        self.misses += 1
+        if (row := loader()) is not None:
+            category_key = self._category_key(row["article_category"])
+            if (version := self.backend.get(category_key)) is None:
+                version = uuid.uuid4().hex
+                self.backend.set(category_key, version, None)
+            self.backend.set(
+                self._key(article_id), {"row": row, "category": row["article_category"], "version": version}, self.ttl
+            )
+        return row
+
+    async def aget_or_load(
+        self, article_id: int, loader: Callable[[], Awaitable[Optional[dict]]]
+    ) -> Optional[dict]:
+        entry = await self.backend.aget(self._key(article_id))
+        category_version = None
+        if entry is not None:
+            category_version = await self.backend.aget(self._category_key(entry["category"]))
+        if self._is_fresh(entry, category_version):
+            self.hits += 1
+            return entry["row"]
+        self.misses += 1
+        if (row := await loader()) is not None:
+            category_key = self._category_key(row["article_category"])
+            if (version := await self.backend.aget(category_key)) is None:
+                version = uuid.uuid4().hex
+                await self.backend.aset(category_key, version, None)
+            await self.backend.aset(
+                self._key(article_id), {"row": row, "category": row["article_category"], "version": version}, self.ttl
+            )
+        return row
+
+    def invalidate(self, *article_ids: int) -> None:
+        """Drop the articles once the current transaction commits"""
+        keys = [self._key(article_id) for article_id in article_ids]
+        transaction.on_commit(lambda: self.backend.delete_many(keys), robust=True)
+
+    def invalidate_category(self, category: str) -> None:
+        """Drop every article of the category once the current transaction commits"""
+        transaction.on_commit(
+            lambda: self.backend.set(self._category_key(category), uuid.uuid4().hex, None), robust=True
+        )
+
+    def clear(self) -> None:
+        self.backend.clear()
+        self.hits = self.misses = 0
+
+
+article_cache = ArticleCache.from_settings()
@@ -0,0 +1,148 @@
+"""Catalog export as NDJSON, CSV or Parquet, encoded while it is read.
+
+The rows of the taxed_article view are read from an unbuffered cursor (MySQLdb SSCursor): the server sends them as
+they are fetched, where a regular cursor loads the whole result in memory with the first fetch. Each chunk of rows is
+encoded and handed over before the next one is fetched, so memory use depends on the chunk size and not on the size of
+the catalog. Rows have the fields of ArticleSchema, like the `/articles` pages.
+
+Parquet needs the pyarrow package (see requirements-parquet.txt), every chunk of rows is a row group.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+from decimal import Decimal
+from enum import StrEnum
+from typing import Any, Iterable, Iterator
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+
+from .models import FullArticle
+from .projection import schema_columns
+from .schemas import ArticleSchema
+
+FIELDS = tuple(ArticleSchema.model_fields)
+_encoder = DjangoJSONEncoder()  # dates and times as in the API responses
+
+
+class ExportFormat(StrEnum):
+    ndjson = "ndjson"
+    csv = "csv"
+    parquet = "parquet"
+
+
+CONTENT_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv",
+    ExportFormat.parquet: "application/vnd.apache.parquet",
+}
+
+
+def _unbuffered_cursor(connection):
+    """A cursor streaming its rows from the server, on MySQL. Nothing else can run on the connection until it is
+    closed, which is why only the export uses one
+    """
+    connection.ensure_connection()
+    if connection.vendor != "mysql":
+        return connection.cursor()
+    with connection.wrap_database_errors:
+        cursor = connection.connection.cursor(connection.Database.cursors.SSCursor)
+    return connection.make_debug_cursor(cursor) if connection.queries_logged else connection.make_cursor(cursor)
+
+
+def catalog_chunks(chunk_size: int, using: str | None = None) -> Iterator[list[tuple]]:
+    """The catalog in lists of up to `chunk_size` rows, ordered by article, with the values of FIELDS"""
+    queryset = FullArticle.objects.using(using).order_by("article_id").values_list(*schema_columns(ArticleSchema))
+    compiler = queryset.query.get_compiler(using=queryset.db)
+    sql, params = compiler.as_sql()
+    # the conversions of the values queryset (e.g. aware datetimes)
+    converters = compiler.get_converters([column for column, _, _ in compiler.select])
+    with _unbuffered_cursor(connections[queryset.db]) as cursor:
+        cursor.execute(sql, params)
+        while rows := cursor.fetchmany(chunk_size):
+            yield [tuple(row) for row in compiler.apply_converters(rows, converters)] if converters else list(rows)
+
+
+def _json_value(value: Any) -> Any:
+    return float(value) if isinstance(value, Decimal) else _encoder.default(value)
+
+
+def _ndjson(chunks: Iterable[list[tuple]]) -> Iterator[bytes]:
+    for chunk in chunks:
+        yield "".join(json.dumps(dict(zip(FIELDS, row)), default=_json_value) + "\n" for row in chunk).encode()
+
+
+def _csv_value(value: Any) -> Any:
+    return _encoder.default(value) if isinstance(value, datetime) else value
+
+
+def _csv(chunks: Iterable[list[tuple]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    for chunk in chunks:
+        writer.writerows([_csv_value(value) for value in row] for row in chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():  # the header of an empty catalog
+        yield buffer.getvalue().encode()
+
+
+class _Sink(io.RawIOBase):
+    """Output of the Parquet writer, taken out after every row group"""
+
+    def __init__(self):
+        self.parts: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        data, self.parts = b"".join(self.parts), []
+        return data
+
+
+def _parquet(chunks: Iterable[list[tuple]], pa, pq) -> Iterator[bytes]:
+    schema = pa.schema(
+        [
+            ("id", pa.int64()),
+            ("reference", pa.string()),
+            ("name", pa.string()),
+            ("description", pa.string()),
+            ("date_created", pa.timestamp("us", tz="UTC")),
+            ("price", pa.decimal128(28, 2)),
+            ("date_priced", pa.timestamp("us", tz="UTC")),
+            ("quantity", pa.int64()),
+            ("tax", pa.decimal128(6, 3)),
+            ("category", pa.string()),
+        ]
+    )
+    sink = _Sink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for chunk in chunks:
+            writer.write_batch(pa.RecordBatch.from_pylist([dict(zip(FIELDS, row)) for row in chunk], schema=schema))
+            yield sink.take()
+    yield sink.take()
+
+
+def export_catalog(format: ExportFormat, chunk_size: int = 2000, using: str | None = None) -> Iterator[bytes]:
+    """The catalog encoded in `format`, a part of the output per chunk of rows.
+    Nothing is read before the first part is asked for
+    """
+    chunks = catalog_chunks(chunk_size, using=using)
+    if format == ExportFormat.parquet:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImproperlyConfigured("Parquet exports need the pyarrow package") from e
+        return _parquet(chunks, pa, pq)
+    return _ndjson(chunks) if format == ExportFormat.ndjson else _csv(chunks)
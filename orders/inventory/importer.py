@@ -0,0 +1,90 @@
+"""Bulk article import from NDJSON or CSV streams.
+
+Input is read line by line and written in batches through `Article.bulk_create_with_data`,
+so memory use depends on the batch size and not on the size of the feed.
+Every batch is committed on its own, invalid rows are reported and skipped.
+"""
+
+import csv
+import json
+from enum import StrEnum
+from typing import Iterable, Iterator
+
+from pydantic import ValidationError
+
+from .models import Article
+from .schemas import ArticleCreateInput, ArticleImportError, ArticleImportReport
+
+
+class ImportFormat(StrEnum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+def _decoded(lines: Iterable[bytes | str]) -> Iterator[str]:
+    for line in lines:
+        yield line.decode("utf-8") if isinstance(line, bytes) else line
+
+
+def _records(
+    lines: Iterable[bytes | str], format: ImportFormat, report: ArticleImportReport
+) -> Iterator[tuple[int, dict]]:
+    """Yield `(line number, record)`, unparsable lines are added to the report"""
+    if format == ImportFormat.csv:
+        reader = csv.DictReader(_decoded(lines))
+        for record in reader:
+            yield reader.line_num, record
+        return
+
+    for line_num, line in enumerate(_decoded(lines), start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as err:
+            report.errors.append(ArticleImportError(line=line_num, error=f"Invalid JSON: {err}"))
+            continue
+        if not isinstance(record, dict):
+            report.errors.append(ArticleImportError(line=line_num, error="Expected a JSON object"))
+            continue
+        yield line_num, record
+
+
+def _validation_message(err: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in err.errors())
+
+
+def _flush(batch: list[tuple[int, ArticleCreateInput]], report: ArticleImportReport) -> None:
+    errors = Article.bulk_create_with_data([row for _, row in batch])
+    report.created += len(batch) - len(errors)
+    for i, error in sorted(errors.items()):
+        line_num, row = batch[i]
+        report.errors.append(ArticleImportError(line=line_num, reference=row.reference, error=error))
+
+
+def import_articles(
+    lines: Iterable[bytes | str], format: ImportFormat = ImportFormat.ndjson, batch_size: int = 1000
+) -> ArticleImportReport:
+    """Import one article per NDJSON line, or per CSV row after a header row.
+    Records have the ArticleCreateInput fields.
+    """
+    report = ArticleImportReport()
+    batch: list[tuple[int, ArticleCreateInput]] = []
+    for line_num, record in _records(lines, format, report):
+        try:
+            batch.append((line_num, ArticleCreateInput.model_validate(record)))
+        except ValidationError as err:
+            reference = record.get("reference")
+            report.errors.append(
+                ArticleImportError(
+                    line=line_num,
+                    reference=reference if isinstance(reference, str) else None,
+                    error=_validation_message(err),
+                )
+            )
+        if len(batch) >= batch_size:
+            _flush(batch, report)
+            batch = []
+    if batch:
+        _flush(batch, report)
+    return report
@@ -0,0 +1,37 @@
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from inventory import audit
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the coming monthly partitions of the inventory audit, "
+        "summarize the months past the retention horizon by article and day, then drop them"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--keep-months",
+            type=int,
+            default=getattr(settings, "INVENTORY_AUDIT_KEEP_MONTHS", 3),
+            help="Number of past months to keep besides the current one",
+        )
+        parser.add_argument(
+            "--premake-months",
+            type=int,
+            default=3,
+            help="Number of partitions to create ahead of the current month",
+        )
+
+    def handle(self, *args, **options):
+        this_month = audit.month_start(date.today())
+        if created := audit.add_partitions(until=audit.add_months(this_month, options["premake_months"])):
+            self.stdout.write(f"Created partitions: {', '.join(created)}")
+        compacted = audit.compact_partitions(before=audit.add_months(this_month, -options["keep_months"]))
+        if compacted:
+            self.stdout.write(self.style.SUCCESS(f"Compacted partitions: {', '.join(compacted)}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("No partitions to compact"))
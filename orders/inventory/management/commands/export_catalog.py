@@ -0,0 +1,44 @@
+import sys
+from pathlib import Path
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.export import ExportFormat, export_catalog
+
+
+class Command(BaseCommand):
+    help = "Export the catalog to an NDJSON, CSV or Parquet file, see the /inventory/articles/export endpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to write, use - to write to stdout")
+        parser.add_argument(
+            "--format",
+            choices=[f.value for f in ExportFormat],
+            help="Defaults to the file extension, or ndjson when writing to stdout",
+        )
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Rows read and written at a time")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if options["format"]:
+            format = ExportFormat(options["format"])
+        else:
+            format = next((f for f in ExportFormat if path.endswith(f".{f}")), ExportFormat.ndjson)
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size should be positive")
+        try:
+            parts = export_catalog(format, chunk_size=options["chunk_size"])
+        except ImproperlyConfigured as err:
+            raise CommandError(err.args[0])
+
+        if path == "-":
+            for part in parts:
+                sys.stdout.buffer.write(part)
+            sys.stdout.buffer.flush()
+            return
+        size = 0
+        with Path(path).open("wb") as output:
+            for part in parts:
+                size += output.write(part)
+        self.stdout.write(self.style.SUCCESS(f"Exported the catalog to {path} ({size} bytes)"))
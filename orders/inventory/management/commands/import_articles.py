@@ -0,0 +1,43 @@
+import sys
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.importer import ImportFormat, import_articles
+
+
+class Command(BaseCommand):
+    help = "Import articles from an NDJSON or CSV file, see the /inventory/articles/import endpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import, use - to read from stdin")
+        parser.add_argument(
+            "--format",
+            choices=[f.value for f in ImportFormat],
+            help="Defaults to the file extension, or ndjson when reading from stdin",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if options["format"]:
+            format = ImportFormat(options["format"])
+        elif path.endswith(".csv"):
+            format = ImportFormat.csv
+        else:
+            format = ImportFormat.ndjson
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size should be positive")
+
+        if path == "-":
+            report = import_articles(sys.stdin, format=format, batch_size=options["batch_size"])
+        else:
+            try:
+                with Path(path).open(newline="", encoding="utf-8") as lines:
+                    report = import_articles(lines, format=format, batch_size=options["batch_size"])
+            except FileNotFoundError:
+                raise CommandError(f"No such file: {path}")
+
+        for error in report.errors:
+            self.stderr.write(f"line {error.line} ({error.reference or '-'}): {error.error}")
+        self.stdout.write(self.style.SUCCESS(f"{report.created} articles created, {len(report.errors)} rows skipped"))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.models import CurrentPrice
+
+
+class Command(BaseCommand):
+    help = "Rebuild the current price of every article from the price history, or only report drift with --check"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report articles whose current price does not match the price history, fail if there are any",
+        )
+
+    def handle(self, *args, **options):
+        drifted = CurrentPrice.drift()
+        if options["check"]:
+            if drifted:
+                raise CommandError(f"{len(drifted)} articles drifted: {', '.join(map(str, drifted[:20]))}")
+            self.stdout.write(self.style.SUCCESS("Current prices match the price history"))
+            return
+        CurrentPrice.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Current prices rebuilt, {len(drifted)} articles had drifted"))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.models import InventoryArticle
+
+
+class Command(BaseCommand):
+    help = (
+        "Split the stock of hot articles (e.g. for a flash sale) across slots, "
+        "so concurrent checkouts of an article lock different rows"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("article_ids", nargs="+", type=int)
+        parser.add_argument(
+            "--slots", type=int, required=True, help="Number of slots, 0 puts the stock back in a single row"
+        )
+
+    def handle(self, *args, **options):
+        if not 0 <= options["slots"] <= 1000:
+            raise CommandError("--slots should be between 0 and 1000")
+        for article_id in options["article_ids"]:
+            try:
+                InventoryArticle.shard(article_id=article_id, slots=options["slots"])
+            except InventoryArticle.DoesNotExist:
+                raise CommandError(f"Article {article_id} is not in the inventory")
+        self.stdout.write(
+            self.style.SUCCESS(f"Stock of {len(options['article_ids'])} articles split across {options['slots']} slots")
+        )
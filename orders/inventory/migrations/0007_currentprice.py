@@ -0,0 +1,99 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:03
+
+import importlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from inventory.models import LATEST_PRICES_SQL
+
+TRIGGER_NAME_PREFIX = "current_price_"
+
+backfill_sql = f"""
+INSERT INTO `inventory_currentprice` (`article_id`, `price`, `set_at`)
+SELECT `article_id`, `price`, `set_at` FROM ({LATEST_PRICES_SQL}) AS `latest`;
+"""
+
+# A newer price replaces the current one, an older one (e.g. backdated) is ignored
+create_triggers_sql = f"""
+CREATE TRIGGER IF NOT EXISTS `{TRIGGER_NAME_PREFIX}insert`
+AFTER INSERT
+    ON `inventory_pricedarticle`
+FOR EACH ROW
+    INSERT INTO `inventory_currentprice` (`article_id`, `price`, `set_at`)
+    VALUES (NEW.article_id, NEW.price, NEW.set_at)
+    ON DUPLICATE KEY UPDATE
+        `price` = IF(NEW.set_at >= `set_at`, NEW.price, `price`),
+        `set_at` = GREATEST(NEW.set_at, `set_at`);
+
+CREATE TRIGGER IF NOT EXISTS `{TRIGGER_NAME_PREFIX}update`
+AFTER UPDATE
+    ON `inventory_pricedarticle`
+FOR EACH ROW
+    REPLACE INTO `inventory_currentprice` (`article_id`, `price`, `set_at`)
+    SELECT `article_id`, `price`, `set_at`
+    FROM `inventory_pricedarticle`
+    WHERE `article_id` = NEW.article_id
+    ORDER BY `set_at` DESC, `id` DESC
+    LIMIT 1;
+"""
+
+drop_triggers_sql = "\n".join(
+    f"""DROP TRIGGER IF EXISTS `{TRIGGER_NAME_PREFIX}{triggerer}`;""" for triggerer in ("insert", "update")
+)
+
+create_view_sql = """
+CREATE OR REPLACE VIEW `taxed_article` AS
+    WITH `recent_taxes` AS (
+        SELECT * FROM `sales_categorytax`
+        LEFT JOIN `sales_tax`
+            ON (`sales_tax`.`reference` = `sales_categorytax`.`tax_id`)
+        WHERE (`category_id`, `valid_from`) IN (
+            SELECT `category_id`, MAX(`valid_from`)
+            FROM `sales_categorytax`
+            WHERE `valid_from` <= CURRENT_TIMESTAMP
+            GROUP BY `category_id`
+        )
+    ) SELECT
+        `inventory_currentprice`.`article_id`
+        , `inventory_currentprice`.`price`
+        , `inventory_currentprice`.`set_at`
+        , `inventory_inventoryarticle`.`quantity` AS `quantity`
+        , `inventory_article`.`date_created` AS `date_created`
+        , `inventory_article`.`reference` AS `reference`
+        , `inventory_article`.`name` AS `name`
+        , `inventory_article`.`description` AS `description`
+        , `recent_taxes`.`value` AS `tax`
+        , `recent_taxes`.`category_id` AS `category`
+    FROM `inventory_currentprice`
+    INNER JOIN `inventory_article`
+        ON (`inventory_currentprice`.`article_id` = `inventory_article`.`id`)
+    LEFT OUTER JOIN `inventory_inventoryarticle`
+        ON (`inventory_currentprice`.`article_id` = `inventory_inventoryarticle`.`article_id`)
+    LEFT OUTER JOIN `recent_taxes`
+        ON (`inventory_article`.`category_id` = `recent_taxes`.`category_id`);
+"""
+
+# the previous definition, scanning the price history for the most recent price
+previous_view_sql = importlib.import_module("inventory.migrations.0004_taxes").create_sql
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_inventoryaudit_db_trigger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrentPrice',
+            fields=[
+                ('article', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='current_price', serialize=False, to='inventory.article')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=28)),
+                ('set_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.RunSQL(backfill_sql, reverse_sql=migrations.RunSQL.noop),
+        migrations.RunSQL(create_triggers_sql, reverse_sql=drop_triggers_sql),
+        migrations.RunSQL(create_view_sql, reverse_sql=previous_view_sql),
+    ]
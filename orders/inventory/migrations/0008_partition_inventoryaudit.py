@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:16
+
+from datetime import date
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from inventory.audit import add_months, month_start, partition_table_sql
+
+TABLE = "inventory_inventoryaudit"
+PREMADE_MONTHS = 3
+
+
+def partition(apps, schema_editor):
+    """One partition per month since the oldest audit row, and a few months ahead"""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"SELECT MIN(`event_date`) FROM `{TABLE}`")
+        oldest = cursor.fetchone()[0]
+    this_month = month_start(date.today())
+    first_month = month_start(oldest.date()) if oldest else this_month
+    # the partitioning column must be part of every unique key
+    schema_editor.execute(f"ALTER TABLE `{TABLE}` DROP PRIMARY KEY, ADD PRIMARY KEY (`id`, `event_date`)")
+    schema_editor.execute(partition_table_sql(first_month, add_months(this_month, PREMADE_MONTHS)))
+
+
+def unpartition(apps, schema_editor):
+    schema_editor.execute(f"ALTER TABLE `{TABLE}` REMOVE PARTITIONING")
+    schema_editor.execute(f"ALTER TABLE `{TABLE}` DROP PRIMARY KEY, ADD PRIMARY KEY (`id`)")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_currentprice'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='inventoryaudit',
+            name='article',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.PROTECT, to='inventory.article'),
+        ),
+        migrations.AlterField(
+            model_name='inventoryaudit',
+            name='event_date',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.CreateModel(
+            name='InventoryAuditDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('closing_state', models.PositiveIntegerField()),
+                ('min_state', models.PositiveIntegerField()),
+                ('max_state', models.PositiveIntegerField()),
+                ('changes', models.PositiveIntegerField()),
+                ('article', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='inventory.article')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('article', 'day'), name='unique_audit_article_day')],
+            },
+        ),
+        migrations.RunPython(partition, reverse_code=unpartition),
+    ]
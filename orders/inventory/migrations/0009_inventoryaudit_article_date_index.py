@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_partition_inventoryaudit'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventoryaudit',
+            index=models.Index(fields=['article', 'event_date'], name='inventory_audit_article_date'),
+        ),
+        migrations.AlterField(
+            model_name='inventoryaudit',
+            name='article',
+            field=models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.PROTECT, to='inventory.article'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_inventoryaudit_article_date_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pricedarticle',
+            index=models.Index(fields=['article', 'set_at'], name='inventory_price_article_date'),
+        ),
+        migrations.AlterField(
+            model_name='pricedarticle',
+            name='article',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='inventory.article'),
+        ),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:41
+
+import importlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+initial_audit = importlib.import_module("inventory.migrations.0006_inventoryaudit_db_trigger")
+previous_view = importlib.import_module("inventory.migrations.0007_currentprice")
+
+TRIGGERERS = ["update", "insert"]
+TRIGGER_NAME_PREFIX = "audit_inventory_articles_"
+SLOT_TRIGGER_NAME = "audit_stock_slots_update"
+
+
+def article_stock_sql(row: str) -> str:
+    """Total stock of an article from its inventory `row`, slots included.
+    SUM() is a DECIMAL, the total is cast back to an integer like the `quantity` column
+    """
+    return f"""CAST({row}.`quantity` + IF({row}.`slots` > 0, (
+            SELECT COALESCE(SUM(`slot`.`quantity`), 0) FROM `inventory_stockslot` `slot`
+            WHERE `slot`.`article_id` = {row}.`article_id`
+        ), 0) AS UNSIGNED)"""
+
+
+# 0006 named its triggers after the literal prefix, replace them with triggers auditing the stock slots included.
+# Slot changes are audited too, except while InventoryArticle._spread balances them (the article row update does)
+drop_audit_sql = "\n".join(
+    [f"DROP TRIGGER IF EXISTS `TRIGGER_NAME_PREFIX{triggerer}`;" for triggerer in TRIGGERERS]
+    + [f"DROP TRIGGER IF EXISTS `{TRIGGER_NAME_PREFIX}{triggerer}`;" for triggerer in TRIGGERERS]
+)
+
+create_audit_sql = "\n".join(f"""
+CREATE TRIGGER IF NOT EXISTS `{TRIGGER_NAME_PREFIX}{triggerer}`
+AFTER {triggerer.upper()}
+    ON `inventory_inventoryarticle`
+FOR EACH ROW
+    INSERT INTO `inventory_inventoryaudit` (`event_date`, `new_state`, `article_id`)
+    VALUES (
+        CURRENT_TIMESTAMP(6), {article_stock_sql("NEW")}, NEW.article_id
+    );
+""" for triggerer in TRIGGERERS) + f"""
+CREATE TRIGGER IF NOT EXISTS `{SLOT_TRIGGER_NAME}`
+AFTER UPDATE
+    ON `inventory_stockslot`
+FOR EACH ROW
+    INSERT INTO `inventory_inventoryaudit` (`event_date`, `new_state`, `article_id`)
+    SELECT CURRENT_TIMESTAMP(6), {article_stock_sql("`inventory`")}, NEW.article_id
+    FROM `inventory_inventoryarticle` `inventory`
+    WHERE `inventory`.`article_id` = NEW.article_id AND @inventory_stock_spreading IS NULL;
+"""
+
+drop_slot_trigger_sql = f"DROP TRIGGER IF EXISTS `{SLOT_TRIGGER_NAME}`;"
+
+# the stock of sharded articles is the sum of their slots, only those pay for the subquery
+create_view_sql = previous_view.create_view_sql.replace(
+    """, `inventory_inventoryarticle`.`quantity` AS `quantity`""",
+    f""", {article_stock_sql("`inventory_inventoryarticle`")} AS `quantity`""",
+)
+assert create_view_sql != previous_view.create_view_sql
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_pricedarticle_article_date_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventoryarticle',
+            name='slots',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='StockSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.PositiveSmallIntegerField()),
+                ('quantity', models.PositiveIntegerField()),
+                ('article', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, to='inventory.article')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('article', 'slot'), name='unique_stock_slot')],
+            },
+        ),
+        migrations.RunSQL(drop_audit_sql, reverse_sql=initial_audit.create_sql),
+        migrations.RunSQL(create_audit_sql, reverse_sql=drop_audit_sql + "\n" + drop_slot_trigger_sql),
+        migrations.RunSQL(create_view_sql, reverse_sql=previous_view.create_view_sql),
+    ]
@@ -1,14 +1,17 @@
-from enum import StrEnum
+import random
+from datetime import datetime, timedelta, timezone as dt_timezone
 
-from django.db import models, transaction
-from django.db.utils import IntegrityError
+from django.db import DEFAULT_DB_ALIAS, connection, models, transaction
+from django.db.utils import DataError, IntegrityError
+from django.utils import timezone
 
-from .schemas import ArticleInput, ArticleCreateInput
+from .cache import article_cache
+from .schemas import ArticleInput, ArticleCreateInput, StockAction, StockAdjustmentStatus
 
-
-class StockAction(StrEnum):
-    add = "add"
-    remove = "remove"
+STOCK_BATCH_SIZE = 1000
+"Maximum number of articles locked or updated by a single statement in batch stock updates"
+STOCK_HISTORY_MAX_BUCKETS = 10_000
+"Maximum number of buckets of a stock history query, the window divided by the bucket size"
 
 
 class Category(models.Model):
@@ -47,10 +50,7 @@ class Article(models.Model):
                 price=data.price,
             )
         if data.quantity is not None:
-            InventoryArticle.objects.update_or_create(
-                article=self,
-                defaults={"quantity": data.quantity},
-            )
+            InventoryArticle.set_stock(article_id=self.pk, quantity=data.quantity)
 
     def update_with_data(self, data: ArticleInput):
         with transaction.atomic():
@@ -59,6 +59,7 @@ class Article(models.Model):
                 setattr(self, i, getattr(data, i) or getattr(self, i))
             self.save()
             self.update_related(data)
+            article_cache.invalidate(self.pk)
 
     @classmethod
     def create_with_data(cls, data: ArticleCreateInput):
@@ -69,7 +70,6 @@ class Article(models.Model):
                     name=data.name,
                     description=data.description,
                 )
-                article.save()
                 article.update_related(data)
                 return article
         except IntegrityError as e:
@@ -78,21 +78,152 @@ class Article(models.Model):
                     raise ValueError(f"Deplicate reference: {data.reference}")
             raise e
 
+    @classmethod
+    def bulk_create_with_data(cls, rows: list[ArticleCreateInput]) -> dict[int, str]:
+        """Like create_with_data for many articles at once, with a constant number of queries.
+        Returns the errors by position in `rows`, every other row is created.
+        """
+        errors = {}
+        existing = {
+            reference.lower()
+            for reference in cls.objects.filter(reference__in=[row.reference for row in rows]).values_list(
+                "reference", flat=True
+            )
+        }
+        valid = {}
+        for i, row in enumerate(rows):
+            # references are unique regardless of their case
+            if row.reference.lower() in existing:
+                errors[i] = f"Duplicate reference: {row.reference}"
+            else:
+                existing.add(row.reference.lower())
+                valid[i] = row
+        if not valid:
+            return errors
+
+        try:
+            with transaction.atomic():
+                Category.objects.bulk_create(
+                    [Category(name=name) for name in {row.category_name.lower() for row in valid.values()}],
+                    ignore_conflicts=True,
+                )
+                cls.objects.bulk_create(
+                    cls(
+                        reference=row.reference,
+                        name=row.name,
+                        description=row.description,
+                        category_id=row.category_name.lower(),
+                    )
+                    for row in valid.values()
+                )
+                ids = dict(
+                    cls.objects.filter(reference__in=[row.reference for row in valid.values()]).values_list(
+                        "reference", "id"
+                    )
+                )
+                PricedArticle.objects.bulk_create(
+                    PricedArticle(article_id=ids[row.reference], price=row.price) for row in valid.values()
+                )
+                InventoryArticle.objects.bulk_create(
+                    (InventoryArticle(article_id=ids[row.reference], quantity=row.quantity) for row in valid.values()),
+                    update_conflicts=True,
+                    update_fields=["quantity"],
+                )
+        except (DataError, IntegrityError):
+            # Someone else took one of the references since we checked, or the database rejected a value:
+            # find the rows row by row
+            for i, row in valid.items():
+                try:
+                    cls.create_with_data(row)
+                except ValueError as err:
+                    errors[i] = err.args[0]
+                except (DataError, IntegrityError) as err:
+                    errors[i] = f"Rejected by the database: {err.args[-1]}"
+        return errors
+
     @classmethod
     def update_stock(cls, article_id: int, action: StockAction, amount: int) -> int:
         if not amount > 0:
             raise ValueError("amount should be positive integer")
         quantity = models.F("quantity")
         if action == StockAction.add:
-            stock_update = quantity + amount
+            stock_update, delta = quantity + amount, amount
         else:
-            stock_update = quantity - amount
-        return InventoryArticle.objects.filter(article_id=article_id).update(quantity=stock_update)
+            stock_update, delta = quantity - amount, -amount
+        updated = InventoryArticle.objects.filter(article_id=article_id, slots=0).update(quantity=stock_update)
+        if not updated:
+            updated = InventoryArticle.adjust_sharded_stock(article_id=article_id, delta=delta)
+        # after the write: in autocommit the invalidation runs right away, a reload before the UPDATE would cache
+        # the old stock
+        article_cache.invalidate(article_id)
+        return updated
+
+    @classmethod
+    def update_stock_batch(cls, adjustments: list[tuple[int, StockAction, int]]) -> list[StockAdjustmentStatus]:
+        """Apply many `(article_id, action, amount)` stock changes in one transaction, return the status of each one.
+
+        The stock of the affected articles is locked and the changes are checked in order against it:
+        an adjustment that would make the stock negative is rejected and does not stop the following ones.
+        Writing the result takes one UPDATE per STOCK_BATCH_SIZE changed articles, plus one per sharded article.
+        """
+        statuses = []
+        article_ids = sorted({article_id for article_id, _, _ in adjustments})
+        with transaction.atomic():
+            stock, slots = {}, {}
+            # lock in article_id order so concurrent batches cannot deadlock each other
+            for i in range(0, len(article_ids), STOCK_BATCH_SIZE):
+                for article_id, quantity, article_slots in (
+                    InventoryArticle.objects.select_for_update()
+                    .filter(article_id__in=article_ids[i : i + STOCK_BATCH_SIZE])
+                    .order_by("article_id")
+                    .values_list("article_id", "quantity", "slots")
+                ):
+                    stock[article_id] = quantity
+                    if article_slots:
+                        slots[article_id] = article_slots
+            if slots:
+                for article_id, quantity in (
+                    StockSlot.objects.select_for_update()
+                    .filter(article_id__in=slots)
+                    .order_by("article_id", "slot")
+                    .values_list("article_id", "quantity")
+                ):
+                    stock[article_id] += quantity
+
+            deltas = dict.fromkeys(stock, 0)
+            for article_id, action, amount in adjustments:
+                if article_id not in stock:
+                    statuses.append(StockAdjustmentStatus.not_found)
+                    continue
+                delta = amount if action == StockAction.add else -amount
+                if amount <= 0 or stock[article_id] + deltas[article_id] + delta < 0:
+                    statuses.append(StockAdjustmentStatus.rejected)
+                    continue
+                deltas[article_id] += delta
+                statuses.append(StockAdjustmentStatus.applied)
+
+            changed = sorted(article_id for article_id, delta in deltas.items() if delta)
+            for article_id in changed:
+                if article_id in slots:
+                    InventoryArticle._spread(article_id, slots[article_id], stock[article_id] + deltas[article_id])
+            unsharded = [article_id for article_id in changed if article_id not in slots]
+            for i in range(0, len(unsharded), STOCK_BATCH_SIZE):
+                chunk = unsharded[i : i + STOCK_BATCH_SIZE]
+                InventoryArticle.objects.filter(article_id__in=chunk).update(
+                    quantity=models.F("quantity")
+                    + models.Case(
+                        *(models.When(article_id=article_id, then=deltas[article_id]) for article_id in chunk),
+                        default=0,
+                    )
+                )
+            article_cache.invalidate(*changed)
+        return statuses
 
     @classmethod
     def update_price(cls, article_id: int, price: float):
         try:
             PricedArticle.objects.create(article_id=article_id, price=price)
+            article_cache.invalidate(article_id)
         except IntegrityError:
             raise cls.DoesNotExist()
 
@@ -106,13 +237,9 @@ class PricedArticleRecent(models.Manager):
             .get_queryset()
             .extra(
                 where=[
-                    """EXISTS (SELECT 1 FROM `inventory_pricedarticle` ts
-                    WHERE (
-                    `inventory_pricedarticle`.`article_id`, `inventory_pricedarticle`.`set_at`
-                    ) IN (
-                        SELECT `article_id`, max(`set_at`)
-                        FROM `inventory_pricedarticle`
-                        GROUP BY `article_id`)
+                    """EXISTS (SELECT 1 FROM `inventory_currentprice` cp
+                    WHERE `cp`.`article_id` = `inventory_pricedarticle`.`article_id`
+                        AND `cp`.`set_at` = `inventory_pricedarticle`.`set_at`
                     )"""
                 ]
             )
@@ -124,44 +251,408 @@ class PricedArticle(models.Model):
     Use PricedArticle.recents to get objects filtered by most recent price change
     """
 
-    article = models.ForeignKey(Article, on_delete=models.CASCADE)
+    article = models.ForeignKey(Article, on_delete=models.CASCADE, db_index=False)
     price = models.DecimalField(max_digits=28, decimal_places=2, db_index=True)
     set_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     objects = models.Manager()
     recents = PricedArticleRecent()
 
+    class Meta:
+        indexes = [
+            # price history of an article, also serves the article foreign key
+            models.Index(fields=["article", "set_at"], name="inventory_price_article_date"),
+        ]
+
     def __str__(self) -> str:
         # it would be nice to print self.article.reference, but that will cause a new DB call unless select related is set
         return f"Priced Article: {self.article_id}: {self.price}"  # type: ignore
 
+    @classmethod
+    def as_of(cls, article_ids: list[int], when: datetime) -> models.QuerySet:
+        """The price of each article at `when`, articles without a price by then are left out.
+        Finding each price is a descending scan of the (article, set_at) index that stops at the first row
+        """
+        price_at = (
+            cls.objects.filter(article=models.OuterRef("pk"), set_at__lte=when).order_by("-set_at", "-id").values("pk")
+        )
+        price_ids = Article.objects.filter(pk__in=article_ids).values(price_id=models.Subquery(price_at[:1]))
+        return cls.objects.filter(pk__in=price_ids).values("article_id", "price", "set_at").order_by("article_id")
+
+
+LATEST_PRICES_SQL = """
+    SELECT `article_id`, `price`, `set_at`
+    FROM (
+        SELECT
+            `article_id`, `price`, `set_at`
+            , ROW_NUMBER() OVER (PARTITION BY `article_id` ORDER BY `set_at` DESC, `id` DESC) AS `recency`
+        FROM `inventory_pricedarticle`
+    ) AS `ranked_prices`
+    WHERE `recency` = 1
+"""
+
+
+class CurrentPrice(models.Model):
+    """Most recent PricedArticle of each article, kept up to date by DB triggers on PricedArticle inserts and updates.
+    Reading it is a primary key lookup, finding `max(set_at)` in the price history is a scan of the whole history
+    """
+
+    article = models.OneToOneField(Article, primary_key=True, on_delete=models.CASCADE, related_name="current_price")
+    price = models.DecimalField(max_digits=28, decimal_places=2)
+    set_at = models.DateTimeField()
+
+    def __str__(self) -> str:
+        return f"Current price: {self.article_id}: {self.price}"  # type: ignore
+
+    def save(self, *args, **kwargs) -> None:
+        raise AttributeError("This table content is managed by a DB trigger")
+
+    @classmethod
+    def drift(cls) -> list[int]:
+        """Article ids whose current price does not match their price history"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT `latest`.`article_id`
+                FROM ({LATEST_PRICES_SQL}) AS `latest`
+                LEFT JOIN `inventory_currentprice` `cp` ON (`cp`.`article_id` = `latest`.`article_id`)
+                WHERE `cp`.`article_id` IS NULL OR `cp`.`price` <> `latest`.`price` OR `cp`.`set_at` <> `latest`.`set_at`
+                UNION ALL
+                SELECT `cp`.`article_id`
+                FROM `inventory_currentprice` `cp`
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM `inventory_pricedarticle` WHERE `article_id` = `cp`.`article_id`
+                )
+                """
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    @classmethod
+    def rebuild(cls) -> None:
+        """Recompute every current price from the price history, the table stays readable while rebuilding"""
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO `inventory_currentprice` (`article_id`, `price`, `set_at`)
+                SELECT `article_id`, `price`, `set_at` FROM ({LATEST_PRICES_SQL}) AS `latest`
+                ON DUPLICATE KEY UPDATE `price` = VALUES(`price`), `set_at` = VALUES(`set_at`)
+                """
+            )
+            cursor.execute(
+                """
+                DELETE FROM `inventory_currentprice`
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM `inventory_pricedarticle`
+                    WHERE `inventory_pricedarticle`.`article_id` = `inventory_currentprice`.`article_id`
+                )
+                """
+            )
+
 
 class InventoryArticle(models.Model):
     """Add inventory awareness to Article
     Once the article is added to inventory it should not be deleted from the database, the quantity should be set to 0
+
+    The stock of a hot article can be split across StockSlot rows (see `shard`), so concurrent reservations lock
+    different rows instead of queuing on this one. Its stock is then `quantity` (0 once sharded) plus its slots.
     """
 
     article = models.OneToOneField(Article, on_delete=models.PROTECT)
     quantity = models.PositiveIntegerField()
+    slots = models.PositiveSmallIntegerField(default=0)
+    "Number of StockSlot rows holding the stock, 0 when it is all in `quantity`"
 
     def __str__(self) -> str:
         return f"InventoryArticle {self.article_id}:{self.quantity}"  # type: ignore
 
+    @classmethod
+    def reserve(cls, article_id: int, quantity: int) -> bool:
+        """Take `quantity` out of the stock if there is enough of it, return False otherwise.
+        A single conditional UPDATE, the affected row count is the stock check, so there is no read-modify-write race.
+        The stock of sharded articles is taken from their slots, which are only looked at when the article has some
+        """
+        reserved = (
+            cls.objects.filter(article_id=article_id, quantity__gte=quantity).update(
+                quantity=models.F("quantity") - quantity
+            )
+            > 0
+        ) or (
+            cls.objects.filter(article_id=article_id, slots__gt=0).exists()
+            and StockSlot.take(article_id=article_id, quantity=quantity)
+        )
+        if reserved:
+            article_cache.invalidate(article_id)
+        return reserved
+
+    @classmethod
+    def restock(cls, article_id: int, quantity: int) -> int:
+        """Put `quantity` back in the stock, return the number of updated rows.
+        Sharded articles get it back in one of their slots, picked at random
+        """
+        updated = cls.objects.filter(article_id=article_id, slots=0).update(quantity=models.F("quantity") + quantity)
+        if not updated:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    UPDATE `{StockSlot._meta.db_table}` SET `quantity` = `quantity` + %s
+                    WHERE `article_id` = %s AND `slot` = FLOOR(%s * ({SLOT_COUNT_SQL}))
+                    """,
+                    [quantity, article_id, random.random(), article_id],
+                )
+                updated = cursor.rowcount
+        article_cache.invalidate(article_id)
+        return updated
+
+    @classmethod
+    def set_stock(cls, article_id: int, quantity: int) -> None:
+        """Set the stock of the article, add it to the inventory if needed"""
+        with transaction.atomic():
+            inventory, created = cls.objects.select_for_update().get_or_create(
+                article_id=article_id, defaults={"quantity": quantity}
+            )
+            if inventory.slots:
+                cls._spread(article_id, inventory.slots, quantity)
+            elif not created:
+                cls.objects.filter(article_id=article_id).update(quantity=quantity)
+        article_cache.invalidate(article_id)
+
+    @classmethod
+    def adjust_sharded_stock(cls, article_id: int, delta: int) -> int:
+        """Add `delta` (negative to remove) to the stock of a sharded article and balance its slots again,
+        return the number of updated articles (0 when the article is not sharded)
+        """
+        with transaction.atomic():
+            inventory = cls.objects.select_for_update().filter(article_id=article_id, slots__gt=0).first()
+            if inventory is None:
+                return 0
+            stock = inventory.quantity + sum(
+                StockSlot.objects.select_for_update().filter(article_id=article_id).values_list("quantity", flat=True)
+            )
+            if stock + delta < 0:
+                raise ValueError(f"Not enough stock to remove {-delta}")
+            cls._spread(article_id, inventory.slots, stock + delta)
+        article_cache.invalidate(article_id)
+        return 1
+
+    @classmethod
+    def shard(cls, article_id: int, slots: int) -> None:
+        """Split the stock of the article evenly across `slots` StockSlot rows, 0 puts it all back in `quantity`.
+        Sharding an article whose stock changes once in a while costs more than it saves: every reservation that
+        finds no stock in `quantity` tries the slots too
+        """
+        with transaction.atomic():
+            inventory = cls.objects.select_for_update().get(article_id=article_id)
+            stock = inventory.quantity + sum(
+                StockSlot.objects.select_for_update().filter(article_id=article_id).values_list("quantity", flat=True)
+            )
+            StockSlot.objects.filter(article_id=article_id, slot__gte=slots).delete()
+            StockSlot.objects.bulk_create(
+                [StockSlot(article_id=article_id, slot=slot, quantity=0) for slot in range(slots)],
+                ignore_conflicts=True,
+            )
+            cls._spread(article_id, slots, stock)
+        article_cache.invalidate(article_id)
+
+    @classmethod
+    def _spread(cls, article_id: int, slots: int, stock: int) -> None:
+        """Set the stock of the locked article, split evenly across `slots` slots (or all in `quantity` when 0).
+        The slot updates are not audited one by one, the update of the article row audits the resulting stock
+        """
+        if slots:
+            share, rest = divmod(stock, slots)
+            with connection.cursor() as cursor:
+                cursor.execute("SET @inventory_stock_spreading = 1")
+                try:
+                    StockSlot.objects.filter(article_id=article_id).update(
+                        quantity=models.Case(models.When(slot__lt=rest, then=share + 1), default=share)
+                    )
+                finally:
+                    cursor.execute("SET @inventory_stock_spreading = NULL")
+        cls.objects.filter(article_id=article_id).update(slots=slots, quantity=0 if slots else stock)
+
+
+# number of slots of the article given as query parameter
+SLOT_COUNT_SQL = f"SELECT `slots` FROM `{InventoryArticle._meta.db_table}` WHERE `article_id` = %s"
+
+
+class StockSlot(models.Model):
+    """A share of the stock of a sharded article, see InventoryArticle.shard"""
+
+    article = models.ForeignKey(Article, on_delete=models.PROTECT, db_index=False)
+    slot = models.PositiveSmallIntegerField()
+    quantity = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            # also serves the article foreign key
+            models.UniqueConstraint(fields=["article", "slot"], name="unique_stock_slot"),
+        ]
+
+    def __str__(self) -> str:
+        return f"StockSlot {self.article_id}#{self.slot}:{self.quantity}"  # type: ignore
+
+    @classmethod
+    def take(cls, article_id: int, quantity: int) -> bool:
+        """Take `quantity` from the slots of the article if they have enough of it, return False otherwise.
+
+        The first slot with enough stock from a random one on is locked, skipping the slots locked by other
+        transactions, so concurrent reservations of the article do not wait for each other. When every such slot is
+        locked, or no single slot has enough, all the slots of the article are locked and taken from in order
+        """
+        random_start = (f"FLOOR(%s * ({SLOT_COUNT_SQL}))", [random.random(), article_id])
+        with transaction.atomic(savepoint=False), connection.cursor() as cursor:
+            for start, start_params in (random_start, ("0", [])):
+                cursor.execute(
+                    f"""
+                    SELECT `id` FROM `{cls._meta.db_table}`
+                    WHERE `article_id` = %s AND `quantity` >= %s AND `slot` >= {start}
+                    ORDER BY `slot`
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                    """,
+                    [article_id, quantity, *start_params],
+                )
+                if row := cursor.fetchone():
+                    return cls.objects.filter(pk=row[0]).update(quantity=models.F("quantity") - quantity) > 0
+
+            locked = cls.objects.select_for_update().filter(article_id=article_id).order_by("slot")
+            slots = list(locked.values_list("pk", "quantity"))
+            if sum(stock for _, stock in slots) < quantity:
+                return False
+            taken = {}
+            for pk, stock in slots:
+                if quantity == 0:
+                    break
+                taken[pk] = min(stock, quantity)
+                quantity -= taken[pk]
+            cls.objects.filter(pk__in=taken).update(
+                quantity=models.F("quantity")
+                - models.Case(*(models.When(pk=pk, then=amount) for pk, amount in taken.items()), default=0)
+            )
+            return True
+
 
 class InventoryAudit(models.Model):
-    """Keep track of all changes in inventory.
-    Ideally we should use a DB trigger"""
+    """Keep track of all changes in inventory, rows are inserted by DB triggers.
+    The table is partitioned by month of event_date (see inventory/audit.py), partitioned tables cannot have foreign
+    keys and their primary key is (id, event_date)
+    """
 
-    article = models.ForeignKey(Article, on_delete=models.PROTECT)
-    event_date = models.DateTimeField(auto_now=True, db_index=True)
+    article = models.ForeignKey(Article, on_delete=models.PROTECT, db_constraint=False, db_index=False)
+    event_date = models.DateTimeField(auto_now=True)
     new_state = models.PositiveIntegerField()  # should match InventoryArticle.quantity
 
+    class Meta:
+        indexes = [
+            # also serves the article foreign key
+            models.Index(fields=["article", "event_date"], name="inventory_audit_article_date"),
+        ]
+
     def __str__(self) -> str:
         return f"InventoryArticleLog {self.article_id}@{self.event_date}"  # type: ignore
 
     def save(self, *args, **kwargs) -> None:
         raise AttributeError("This table content is managed by a DB trigger")
 
+    @classmethod
+    def stock_history(
+        cls, article_ids: list[int], start: datetime, end: datetime, bucket: timedelta
+    ) -> dict[int, list[dict]]:
+        """Stock changes of the articles from `start` to `end` (excluded), summarized by bucket of time:
+        the last, min and max stock levels and the number of changes. Buckets are aligned on the Unix epoch,
+        buckets without changes are left out.
+
+        Compacted months only have InventoryAuditDaily rows, they are summarized with buckets of whole days, where a
+        day counts in the bucket of its start (UTC). Finer buckets over compacted days raise a ValueError
+        """
+        bucket_seconds = int(bucket.total_seconds())
+        if bucket_seconds < 1:
+            raise ValueError("bucket should be at least one second")
+        start, end = (timezone.make_aware(when) if timezone.is_naive(when) else when for when in (start, end))
+        if (end - start).total_seconds() / bucket_seconds > STOCK_HISTORY_MAX_BUCKETS:
+            raise ValueError(f"Too many buckets, at most {STOCK_HISTORY_MAX_BUCKETS} are allowed")
+        origin = datetime.fromtimestamp(start.timestamp() // bucket_seconds * bucket_seconds, tz=dt_timezone.utc)
+
+        history: dict[int, list[dict]] = {article_id: [] for article_id in article_ids}
+        if not article_ids:
+            return history
+        # the days starting in [start, end)
+        first_day, last_day = (
+            (when.astimezone(dt_timezone.utc) - timedelta(microseconds=1)).date() + timedelta(days=1)
+            for when in (start, end)
+        )
+        daily = InventoryAuditDaily.objects.filter(article_id__in=article_ids, day__gte=first_day, day__lt=last_day)
+        if bucket_seconds % (24 * 3600) and (compacted := daily.order_by("-day").values_list("day", flat=True).first()):
+            raise ValueError(f"Stock history until {compacted} is kept by day, use buckets of whole days")
+
+        in_articles = ", ".join(["%s"] * len(article_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT
+                    `article_id`
+                    , FLOOR(TIMESTAMPDIFF(SECOND, %s, `at`) / %s) AS `bucket`
+                    , CAST(SUBSTRING_INDEX(GROUP_CONCAT(`last` ORDER BY `at` DESC, `id` DESC), ',', 1) AS UNSIGNED)
+                    , MIN(`min`)
+                    , MAX(`max`)
+                    , CAST(SUM(`changes`) AS UNSIGNED)
+                FROM (
+                    SELECT
+                        `article_id`, `event_date` AS `at`, `id`
+                        , `new_state` AS `last`, `new_state` AS `min`, `new_state` AS `max`, 1 AS `changes`
+                    FROM `{cls._meta.db_table}`
+                    WHERE `article_id` IN ({in_articles}) AND `event_date` >= %s AND `event_date` < %s
+                    UNION ALL
+                    SELECT
+                        `article_id`, TIMESTAMP(`day`), `id`, `closing_state`, `min_state`, `max_state`, `changes`
+                    FROM `{InventoryAuditDaily._meta.db_table}`
+                    WHERE `article_id` IN ({in_articles}) AND `day` >= %s AND `day` < %s
+                ) AS `events`
+                GROUP BY `article_id`, `bucket`
+                ORDER BY `article_id`, `bucket`
+                """,
+                [
+                    connection.ops.adapt_datetimefield_value(origin),
+                    bucket_seconds,
+                    *article_ids,
+                    connection.ops.adapt_datetimefield_value(start),
+                    connection.ops.adapt_datetimefield_value(end),
+                    *article_ids,
+                    first_day,
+                    last_day,
+                ],
+            )
+            for article_id, bucket_index, last, min_state, max_state, changes in cursor.fetchall():
+                history[article_id].append(
+                    {
+                        "start": origin + bucket * int(bucket_index),
+                        "last": last,
+                        "min": min_state,
+                        "max": max_state,
+                        "changes": changes,
+                    }
+                )
+        return history
+
+
+class InventoryAuditDaily(models.Model):
+    """InventoryAudit rows of an article, summarized by day once their partition is compacted"""
+
+    article = models.ForeignKey(Article, on_delete=models.PROTECT)
+    day = models.DateField()
+    closing_state = models.PositiveIntegerField()  # the last new_state of the day
+    min_state = models.PositiveIntegerField()
+    max_state = models.PositiveIntegerField()
+    changes = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["article", "day"], name="unique_audit_article_day"),
+        ]
+
+    def __str__(self) -> str:
+        return f"InventoryAuditDaily {self.article_id}@{self.day}: {self.closing_state}"  # type: ignore
+
 
 class FullArticle(models.Model):
     """Readonly model, for articles with extra awareness of prices, taxes and inventory status"""
@@ -183,6 +674,16 @@ class FullArticle(models.Model):
     tax = models.DecimalField(max_digits=6, decimal_places=3)
     category = models.SlugField()  # It is not worth it to make this a FK, we don't really want to traverse the ORM via this model, this is the whole point of the FullArticle model
 
+    @classmethod
+    def cacheable(cls, article_id: int, *fields: str) -> models.QuerySet:
+        """The article as a dict of `fields` (all by default), with its category (the `category` column is only set
+        for taxed categories), see inventory.cache.
+        Read from the primary: a row loaded from a lagging replica would be cached, and served, for the whole TTL"""
+        return cls.objects.using(DEFAULT_DB_ALIAS).filter(article_id=article_id).values(
+            *(fields or (field.attname for field in cls._meta.concrete_fields)),
+            article_category=models.F("article__category"),
+        )
+
     def __str__(self) -> str:
         the_tax = f"+{self.tax * 100:.2f}%" if self.tax else ""
         return f"{self.reference}(@{self.price}{the_tax})"
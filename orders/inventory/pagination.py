@@ -0,0 +1,175 @@
+"""Keyset (a.k.a. cursor) pagination.
+
+`LimitOffsetPagination` makes the database build and discard every row before the offset, and counts the whole
+queryset on every page. Keyset pagination remembers the ordering values of the last row that was sent and asks for
+the rows that come after it, so the cost of a page does not depend on how deep the client is paging.
+"""
+
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from math import inf
+from typing import Any, List, Optional
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.db.models import Q, QuerySet
+from ninja import Field, Schema
+from ninja.conf import settings
+from ninja.errors import HttpError
+from ninja.pagination import AsyncPaginationBase
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        return datetime.fromisoformat(value["dt"])
+    return value
+
+
+def _fits_field(model: type[models.Model], name: str, value: Any) -> bool:
+    """Whether a decoded cursor value has the type of the ordering field it is compared to."""
+    try:
+        field = model._meta.pk if name == "pk" else model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return True  # annotations are left to the database
+    if field.is_relation:
+        field = field.target_field
+    if isinstance(field, models.DateTimeField):
+        return isinstance(value, datetime)
+    if isinstance(field, models.IntegerField):
+        return isinstance(value, int) and not isinstance(value, bool)
+    if isinstance(field, models.FloatField):
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if isinstance(field, (models.CharField, models.TextField)):
+        return isinstance(value, str)
+    return value is not None and not isinstance(value, (list, dict))
+
+
+class KeysetPagination(AsyncPaginationBase):
+    """Paginate over a stable ordering, the last ordering field should be unique (usually the primary key).
+
+    The ordering is taken from the queryset's `order_by()`, falling back to `ordering`.
+    The cursor is an opaque token made of the ordering values of the row at the edge of the page,
+    `next` and `previous` are `None` when there is nothing more to fetch in that direction.
+    Counting is expensive on large tables, so it only happens when the client asks for it with `with_count=true`.
+    """
+
+    class Input(Schema):
+        cursor: Optional[str] = None
+        page_size: int = Field(
+            settings.PAGINATION_PER_PAGE,
+            ge=1,
+            le=settings.PAGINATION_MAX_LIMIT if settings.PAGINATION_MAX_LIMIT != inf else None,
+        )
+        with_count: bool = False
+
+    class Output(Schema):
+        items: List[Any]
+        count: Optional[int] = None
+        next: Optional[str] = None
+        previous: Optional[str] = None
+
+        def __init_subclass__(cls, **kwargs: Any) -> None:
+            # ninja names paginated responses `Paged<ItemSchema>` whatever the paginator is,
+            # keep keyset pages from overriding the limit/offset ones in the OpenAPI components
+            cls.__name__ = cls.__qualname__ = f"Keyset{cls.__name__}"
+            super().__init_subclass__(**kwargs)
+
+    def __init__(self, *, ordering: tuple[str, ...] = ("pk",), **kwargs: Any) -> None:
+        self.ordering = ordering
+        super().__init__(**kwargs)
+
+    @staticmethod
+    def encode_cursor(ordering: tuple[str, ...], item: Any, reverse: bool) -> str:
+        fields = [field.lstrip("-") for field in ordering]
+        if isinstance(item, dict):
+            values = [item[field] for field in fields]
+        else:
+            values = [getattr(item, field) for field in fields]
+        payload = {"o": ordering, "k": [_encode_value(value) for value in values], "r": reverse}
+        return urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(ordering: tuple[str, ...], cursor: str, model: type[models.Model]) -> tuple[list, bool]:
+        try:
+            payload = json.loads(urlsafe_b64decode(cursor.encode()))
+            values = [_decode_value(value) for value in payload["k"]]
+            reverse = bool(payload["r"])
+            cursor_ordering = tuple(payload["o"])
+        except (ValueError, TypeError, KeyError):
+            raise HttpError(400, "Invalid cursor")
+        if cursor_ordering != ordering or len(values) != len(ordering):
+            raise HttpError(400, "Cursor does not match the requested ordering")
+        # a tampered value would only fail in the database
+        if not all(_fits_field(model, field.lstrip("-"), value) for field, value in zip(ordering, values)):
+            raise HttpError(400, "Invalid cursor")
+        return values, reverse
+
+    @staticmethod
+    def _seek(queryset: QuerySet, ordering: tuple[str, ...], values: list, reverse: bool) -> QuerySet:
+        """Rows strictly after (or before when reversing) `values` in the ordering:
+        `(a > x) OR (a = x AND b > y) OR ...`
+        """
+        fields = [field.lstrip("-") for field in ordering]
+        condition = Q()
+        for i, field in enumerate(ordering):
+            descending = field.startswith("-") != reverse
+            term = Q(**{f"{fields[i]}__{'lt' if descending else 'gt'}": values[i]})
+            for previous_field, previous_value in zip(fields[:i], values[:i]):
+                term &= Q(**{previous_field: previous_value})
+            condition |= term
+        return queryset.filter(condition)
+
+    def _page_queryset(self, queryset: QuerySet, pagination: Input) -> tuple[tuple[str, ...], QuerySet, bool, bool]:
+        ordering = tuple(queryset.query.order_by) or self.ordering
+        if pagination.cursor:
+            values, reverse = self.decode_cursor(ordering, pagination.cursor, queryset.model)
+        else:
+            values, reverse = None, False
+        if values is not None:
+            queryset = self._seek(queryset, ordering, values, reverse)
+        if reverse:
+            queryset = queryset.order_by(*(field[1:] if field.startswith("-") else f"-{field}" for field in ordering))
+        else:
+            queryset = queryset.order_by(*ordering)
+        # one extra row tells us if there is another page without counting
+        return ordering, queryset[: pagination.page_size + 1], values is not None, reverse
+
+    def _page(
+        self,
+        ordering: tuple[str, ...],
+        rows: list,
+        pagination: Input,
+        has_cursor: bool,
+        reverse: bool,
+        count: Optional[int],
+    ) -> dict:
+        has_more = len(rows) > pagination.page_size
+        rows = rows[: pagination.page_size]
+        if reverse:
+            rows.reverse()
+        has_next = has_cursor if reverse else has_more
+        has_previous = has_more if reverse else has_cursor
+        return {
+            "items": rows,
+            "count": count,
+            "next": self.encode_cursor(ordering, rows[-1], reverse=False) if rows and has_next else None,
+            "previous": self.encode_cursor(ordering, rows[0], reverse=True) if rows and has_previous else None,
+        }
+
+    def paginate_queryset(self, queryset: QuerySet, pagination: Input, **params: Any) -> Any:
+        ordering, page, has_cursor, reverse = self._page_queryset(queryset, pagination)
+        count = self._items_count(queryset) if pagination.with_count else None
+        return self._page(ordering, list(page), pagination, has_cursor, reverse, count)
+
+    async def apaginate_queryset(self, queryset: QuerySet, pagination: Input, **params: Any) -> Any:
+        ordering, page, has_cursor, reverse = self._page_queryset(queryset, pagination)
+        count = await self._aitems_count(queryset) if pagination.with_count else None
+        return self._page(ordering, [row async for row in page], pagination, has_cursor, reverse, count)
+
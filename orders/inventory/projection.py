@@ -0,0 +1,46 @@
+"""Fetch only what a response schema serializes.
+
+Endpoints returning model instances make Django select every column (plus those of `select_related` tables) and
+build a model instance per row, then the schema reads a handful of attributes. Projecting the queryset on the
+columns of the schema with `.values()` selects just those, and rows are plain dicts the schema validates directly.
+Only flat schemas can be projected: every field must be a column (or annotation) named by the field or its alias.
+
+ninja validates every row of a response through a `DjangoGetter` wrapper (for resolvers, dotted attributes and
+related managers), which costs more than the query on large pages. Read-only schemas of projected rows derive from
+`RowSchema`, which hands dicts to pydantic directly.
+
+Rows are still validated field by field, even though they come from the database: validation is what converts the
+column values (e.g. a `Decimal` price or total to a float) and maps aliased columns to fields, so a page of rows
+serializes exactly like a page of model instances. Skipping it with `model_construct()` would hand raw column values
+to the serializer and leave aliases unresolved.
+"""
+
+from typing import Any
+
+from django.db.models import QuerySet
+from ninja import Schema
+from pydantic import ValidationInfo, model_validator
+
+
+class RowSchema(Schema):
+    """Schema of `.values()` rows: dicts are validated as they are, anything else goes through ninja as usual"""
+
+    @model_validator(mode="wrap")
+    @classmethod
+    def _run_root_validator(cls, values: Any, handler, info: ValidationInfo) -> Any:
+        # private parts of ninja's Schema, django-ninja is pinned to the minor version they were checked against
+        if isinstance(values, dict) and not cls._ninja_resolvers:
+            return handler(values)
+        return Schema._run_root_validator.__func__(cls, values, handler, info)
+
+
+def schema_columns(schema: type[Schema]) -> tuple[str, ...]:
+    """The column read by each field of the schema: its alias, or its name"""
+    return tuple(
+        field.alias if isinstance(field.alias, str) else name for name, field in schema.model_fields.items()
+    )
+
+
+def project(queryset: QuerySet, schema: type[Schema], **expressions) -> QuerySet:
+    """`queryset.values()` of the schema columns, `expressions` are added as extra columns"""
+    return queryset.values(*schema_columns(schema), **expressions)
@@ -1,9 +1,13 @@
+import re
+from enum import StrEnum
 from typing import Optional, Annotated, TypeVar
-from pydantic import WrapValidator
+from pydantic import BeforeValidator, WrapValidator
 from pydantic_core import PydanticUseDefault
-from datetime import datetime
+from datetime import datetime, timedelta
 from ninja import Schema, Field
 
+from .projection import RowSchema
+
 
 def _empty_str_to_default(v, handler, info):
     # https://django-ninja.dev/guides/input/form-params/
@@ -15,12 +19,42 @@ def _empty_str_to_default(v, handler, info):
 T = TypeVar("T")
 EmptyStrToDefault = Optional[Annotated[T, WrapValidator(_empty_str_to_default)]]
 
+DURATION_UNITS = {"": "seconds", "s": "seconds", "m": "minutes", "h": "hours", "d": "days"}
+
+
+def _short_duration(v):
+    # "90" or "90s", "15m", "1h", "7d", anything else is left to pydantic (e.g. ISO 8601)
+    if isinstance(v, str) and (match := re.fullmatch(r"(\d+)([smhd]?)", v)):
+        return timedelta(**{DURATION_UNITS[match[2]]: int(match[1])})
+    return v
+
+
+ShortDuration = Annotated[timedelta, BeforeValidator(_short_duration)]
+
+
+class StockAction(StrEnum):
+    add = "add"
+    remove = "remove"
+
+
+class ArticleOrdering(StrEnum):
+    id = "id"
+    date_created = "date_created"
+
+
+class StockAdjustmentStatus(StrEnum):
+    applied = "applied"
+    not_found = "not_found"
+    "the article is not in the inventory"
+    rejected = "rejected"
+    "the amount is not positive or there is not enough stock to remove"
+
 
 class CategorySchema(Schema):
     name: str
 
 
-class ArticleSchema(Schema):
+class ArticleSchema(RowSchema):
     """FullArticle Schema"""
 
     id: int = Field(..., alias="article_id")
@@ -35,13 +69,18 @@ class ArticleSchema(Schema):
     category: Optional[str]
 
 
+# Article.reference, Article.name and Category.name are SlugFields: 50 characters, letters, digits, "-" or "_"
+SLUG_LENGTH = 50
+SLUG_PATTERN = r"^[-a-zA-Z0-9_]+$"
+
+
 class ArticleCreateInput(Schema):
-    reference: str
-    name: str
+    reference: str = Field(..., max_length=SLUG_LENGTH, pattern=SLUG_PATTERN)
+    name: str = Field(..., max_length=SLUG_LENGTH)
     description: str
-    price: float
-    quantity: int
-    category_name: str
+    price: float = Field(..., ge=0)
+    quantity: int = Field(..., ge=0)
+    category_name: str = Field(..., max_length=SLUG_LENGTH, pattern=SLUG_PATTERN)
 
 
 class ArticleInput(Schema):
@@ -53,3 +92,58 @@ class ArticleInput(Schema):
     price: EmptyStrToDefault[float] = None
     quantity: EmptyStrToDefault[int] = None
     category_name: EmptyStrToDefault[str] = None
+
+
+class ArticleImportError(Schema):
+    line: int
+    reference: Optional[str] = None
+    error: str
+
+
+class ArticleImportReport(Schema):
+    created: int = 0
+    errors: list[ArticleImportError] = []
+
+
+class StockAdjustmentInput(Schema):
+    article_id: int
+    action: StockAction
+    amount: int
+
+
+class StockAdjustmentResult(StockAdjustmentInput):
+    status: StockAdjustmentStatus
+
+
+class TimeRangeQuery(Schema):
+    start: Optional[datetime] = Field(None, alias="from")
+    end: Optional[datetime] = Field(None, alias="to", description="Excluded")
+
+
+class StockHistoryQuery(TimeRangeQuery):
+    bucket: ShortDuration = Field(timedelta(hours=1), description="e.g. 30s, 15m, 1h, 1d")
+
+
+class StockHistoryBucket(RowSchema):
+    start: datetime
+    last: int
+    min: int
+    max: int
+    changes: int
+
+
+class ArticleStockHistory(RowSchema):
+    article_id: int
+    buckets: list[StockHistoryBucket]
+
+
+class PriceSchema(RowSchema):
+    id: int
+    price: float
+    set_at: datetime
+
+
+class ArticlePriceSchema(RowSchema):
+    article_id: int
+    price: float
+    set_at: datetime
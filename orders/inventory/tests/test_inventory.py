@@ -8,10 +8,29 @@
 - create an inventory product
     - update inventory product quantity
     - check inventory auditing: we should have two for creation and updating
+    - stock history: audit rows summarized by bucket of time (last, min, max, changes), for one or many articles,
+      by day over compacted months
+    - compacting audit partitions: rows summarized by article and day, the partition dropped, new months created
 - test price changes:
   - create multiple prices with different pricing times
   - check we have all prices
   - check full product price matches most recent price
+  - current price follows the most recent price, even when prices are backdated
+  - current price drift is detected and fixed by rebuilding
+  - price history of an article in a time range, most recent first, paginated with cursors
+  - price of many articles at a given time
+- sharded stock: split evenly across slots, reservations spanning slots, totals summed in FullArticle and the audit
+- batch stock updates: applied in order, rejected when stock would be negative, audited once per changed article
+- list endpoints select only the columns of their response schema, without joins
+- articles paginated with cursors, cursors of another ordering or with values of the wrong type are rejected
+- rows validated directly by RowSchema serialize like model instances, the orjson renderer output parses like json's
+  (the private ninja hooks RowSchema relies on are still there)
+- article cache: hits after the first lookup, invalidated after writes once they commit, LRU eviction and expiry
+- metrics: requests, latency and SQL queries by API operation in the Prometheus format
+- read replicas: views and list endpoints read from the replica, a client that wrote reads from the primary
+- connection pool: returned connections are reused, broken or expired ones replaced, checkouts time out when full
+- bulk import articles from NDJSON and CSV, bad rows are reported without stopping the import
+- catalog export as NDJSON, CSV and Parquet, streamed a chunk of rows at a time from an unbuffered cursor
 - check the full product:
     - only priced articles result in fullarticles
     - priced but not inventoried will make a fullarticle with quantity None
@@ -20,10 +39,31 @@
         In sales we will add category tax and check that fullartcle got it
 """
 
+import json
+from base64 import urlsafe_b64encode
+from datetime import date, timedelta
+
 import pytest
 from django.db.models import ProtectedError
 from django.db.utils import IntegrityError
-from inventory.models import PricedArticle, InventoryAudit, Article, Category, FullArticle
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from ninja import Schema
+from ninja.renderers import JSONRenderer
+from app.renderers import ORJSONRenderer
+from django.core.management.base import CommandError
+from django.utils import timezone
+from app.backends.mysql_pool.pool import ConnectionPool, PoolTimeout
+from app.db_router import ReplicaRouter, ReplicaSelector
+from app.metrics import registry
+from inventory import audit, export, importer
+from inventory.cache import LRUBackend, article_cache
+from inventory.models import PricedArticle, InventoryAudit, Article, Category, FullArticle, CurrentPrice, StockAction
+from inventory.models import InventoryArticle, InventoryAuditDaily, StockSlot
+from inventory.projection import RowSchema, project
+from inventory.schemas import ArticleSchema, StockAdjustmentStatus
 
 
 def test_new_category_raises(db, product_category):
@@ -91,6 +131,89 @@ def test_inventory_item_change_audit(db, inventory_article_10):
     assert InventoryAudit.objects.count() == 2
 
 
+def test_stock_history_api(client, inventory_article_10):
+    for quantity in (7, 12):
+        inventory_article_10.quantity = quantity
+        inventory_article_10.save()
+    now = timezone.now()
+    window = {"from": (now - timedelta(hours=1)).isoformat(), "to": (now + timedelta(hours=1)).isoformat()}
+
+    url = f"/api/inventory/article/{inventory_article_10.article_id}/stock-history"
+    response = client.get(url, window | {"bucket": "1d"})
+    assert response.status_code == 200
+    assert [
+        {key: bucket[key] for key in ("last", "min", "max", "changes")} for bucket in response.json()
+    ] == [{"last": 12, "min": 7, "max": 12, "changes": 3}]
+
+    response = client.get(
+        "/api/inventory/articles/stock-history",
+        window | {"bucket": "1d", "ids": [inventory_article_10.article_id, inventory_article_10.article_id + 1000]},
+    )
+    assert [(history["article_id"], len(history["buckets"])) for history in response.json()] == [
+        (inventory_article_10.article_id, 1),
+        (inventory_article_10.article_id + 1000, 0),
+    ]
+
+    response = client.get(url, {"from": (now - timedelta(days=1)).isoformat(), "bucket": "1s"})
+    assert response.status_code == 400
+
+
+def test_sharded_stock(inventory_article_10, priced_article_recent, django_assert_num_queries):
+    article_id = inventory_article_10.article_id
+    InventoryArticle.shard(article_id=article_id, slots=3)
+    slots = StockSlot.objects.filter(article_id=article_id).order_by("slot")
+    assert list(slots.values_list("quantity", flat=True)) == [4, 3, 3]
+    assert InventoryArticle.objects.get(article_id=article_id).quantity == 0
+    assert FullArticle.objects.get(article_id=article_id).quantity == 10
+    # balancing the slots is audited once
+    assert list(InventoryAudit.objects.order_by("id").values_list("new_state", flat=True)) == [10, 10]
+
+    assert InventoryArticle.reserve(article_id=article_id, quantity=3)
+    assert InventoryArticle.reserve(article_id=article_id, quantity=5)  # more than any slot has, taken from several
+    assert not InventoryArticle.reserve(article_id=article_id, quantity=3)
+    assert InventoryArticle.restock(article_id=article_id, quantity=4) == 1
+    assert Article.update_stock_batch([(article_id, StockAction.remove, 1)]) == [StockAdjustmentStatus.applied]
+    with pytest.raises(ValueError):
+        Article.update_stock(article_id=article_id, action=StockAction.remove, amount=6)
+    assert FullArticle.objects.get(article_id=article_id).quantity == 5
+    assert InventoryAudit.objects.order_by("-id").values_list("new_state", flat=True).first() == 5
+
+    InventoryArticle.shard(article_id=article_id, slots=0)
+    assert InventoryArticle.objects.get(article_id=article_id).quantity == 5
+    assert not slots.exists()
+    # out of stock and not sharded: the conditional UPDATE and the slots check, the slots are not locked
+    with django_assert_num_queries(2):
+        assert not InventoryArticle.reserve(article_id=article_id, quantity=6)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_compact_inventory_audit(inventory_article_10):
+    """Partitions are dropped (DDL), so this test cannot run in a rolled back transaction"""
+    inventory_article_10.quantity = 7
+    inventory_article_10.save()
+    this_month = audit.month_start(date.today())
+
+    assert audit.compact_partitions(before=this_month) == []  # nothing older than this month
+    compacted = audit.compact_partitions(before=audit.add_months(this_month, 1))
+    assert audit.partition_name(this_month) in compacted
+    assert InventoryAudit.objects.count() == 0
+    daily = InventoryAuditDaily.objects.get()
+    assert (daily.article_id, daily.day) == (inventory_article_10.article_id, date.today())
+    assert (daily.closing_state, daily.min_state, daily.max_state, daily.changes) == (7, 7, 10, 2)
+
+    # the compacted month is still in the stock history, by day
+    now = timezone.now()
+    window = {"start": now - timedelta(days=2), "end": now + timedelta(days=1)}
+    history = InventoryAudit.stock_history([daily.article_id], bucket=timedelta(days=1), **window)[daily.article_id]
+    assert [(bucket["last"], bucket["min"], bucket["max"], bucket["changes"]) for bucket in history] == [(7, 7, 10, 2)]
+    with pytest.raises(ValueError, match="buckets of whole days"):
+        InventoryAudit.stock_history([daily.article_id], bucket=timedelta(hours=1), **window)
+
+    until = audit.add_months(this_month, 12)
+    assert audit.partition_name(until) in audit.add_partitions(until=until)
+    assert audit.list_partitions()[-2:] == [audit.partition_name(until), audit.FUTURE_PARTITION]
+
+
 def test_non_inventory_item_can_be_deleted(db, article1):
     article1.delete()
 
@@ -123,3 +246,466 @@ def test_fullarticle_recent_price(db, article1, priced_article_old, priced_artic
 def test_fullarticle_no_cat_no_tax(db, priced_article_recent):
     fl = FullArticle.objects.filter(category__isnull=True).first()
     assert fl.tax is None
+
+
+def test_current_price_is_most_recent(db, article1, priced_article_old, priced_article_recent):
+    current = CurrentPrice.objects.get(article=article1)
+    assert float(current.price) == priced_article_recent.price
+    assert current.set_at == priced_article_recent.set_at
+
+
+def test_current_price_follows_backdating(db, article1, priced_article_old):
+    """priced_article_old is inserted now and then moved 10 weeks back"""
+    assert CurrentPrice.objects.get(article=article1).set_at == priced_article_old.set_at
+
+
+def test_priced_article_recents(db, article1, priced_article_old, priced_article_recent):
+    assert list(PricedArticle.recents.filter(article=article1)) == [priced_article_recent]
+
+
+def test_current_price_update_price(db, article1, priced_article_recent):
+    Article.update_price(article_id=article1.pk, price=99.5)
+    assert float(CurrentPrice.objects.get(article=article1).price) == 99.5
+
+
+def test_current_price_drift_rebuild(db, article1, priced_article_old, priced_article_recent):
+    assert CurrentPrice.drift() == []
+    CurrentPrice.objects.filter(article=article1).update(price=1)
+    assert CurrentPrice.drift() == [article1.pk]
+    with pytest.raises(CommandError, match="1 articles drifted"):
+        call_command("rebuild_current_prices", check=True)
+    call_command("rebuild_current_prices")
+    assert CurrentPrice.drift() == []
+    assert float(CurrentPrice.objects.get(article=article1).price) == priced_article_recent.price
+
+
+def test_metrics_api(client, article1, priced_article_recent):
+    registry.clear()
+    for _ in range(2):
+        client.get(f"/api/inventory/article/{article1.pk}")
+    client.get(f"/api/inventory/article/{article1.pk + 1000}")
+
+    metrics = client.get("/api/metrics").content.decode()
+    operation = 'operation="GET /api/inventory/article/<id>"'
+    assert f'api_requests_total{{{operation},status="200"}} 2' in metrics
+    assert f'api_requests_total{{{operation},status="404"}} 1' in metrics
+    assert f'api_request_duration_seconds_count{{{operation}}} 3' in metrics
+    # the second lookup is served by the article cache
+    assert f"api_sql_queries_total{{{operation}}} 2" in metrics
+    assert "inventory_article_cache_hits_total 1" in metrics
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_replica_reads(client, settings, inventory_article_10, priced_article_recent):
+    settings.DATABASE_REPLICAS = {"ALIASES": ["replica"], "SELECTION": "round-robin", "STICKY_SECONDS": 5}
+    router = ReplicaRouter()
+    assert router.db_for_read(FullArticle) == "replica"
+    assert router.db_for_read(Article) == "default"
+    with transaction.atomic():
+        assert router.db_for_read(FullArticle) == "default"
+
+    # the replica schema is empty, nothing replicates to it
+    assert client.get("/api/inventory/articles").json()["count"] == 0
+    response = client.put(f"/api/inventory/article/stock/add/{inventory_article_10.article_id}?amount=1")
+    assert response.status_code == 200
+    assert response.cookies["db_primary"]["max-age"] == 5
+    assert client.get("/api/inventory/articles").json()["count"] == 1
+    assert Client().get("/api/inventory/articles").json()["count"] == 0
+    # the shared article cache is loaded from the primary, whoever asks
+    assert Client().get(f"/api/inventory/article/{inventory_article_10.article_id}").json()["quantity"] == 11
+
+
+def test_replica_selection():
+    selector = ReplicaSelector()
+    assert [selector.pick(["a", "b"], "round-robin") for _ in range(4)] == ["a", "b", "a", "b"]
+    selector.observe("a", 0.010)
+    selector.observe("b", 0.002)
+    assert selector.pick(["a", "b"], "least-latency") == "b"
+    selector.observe("b", 0.100)  # the moving average of b goes above a
+    assert selector.pick(["a", "b"], "least-latency") == "a"
+
+
+class FakeConnection:
+    def __init__(self):
+        self.alive = True
+        self.closed = False
+
+    def ping(self):
+        if not self.alive:
+            raise OSError("gone")
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def test_connection_pool():
+    pool = ConnectionPool(max_size=2, timeout=0.1, max_lifetime=3600)
+    first, second = pool.checkout(FakeConnection), pool.checkout(FakeConnection)
+    with pytest.raises(PoolTimeout):
+        pool.checkout(FakeConnection)
+
+    pool.checkin(first)
+    assert pool.checkout(FakeConnection) is first
+    second.alive = False
+    pool.checkin(second)
+    third = pool.checkout(FakeConnection)
+    assert third is not second and second.closed
+    # a connection closed inside a transaction is not reused
+    pool.checkin(third, reusable=False)
+    assert third.closed
+    assert pool.stats() == {"in_use": 1, "idle": 0, "waiting": 0, "created": 3, "recycled": 2, "timeouts": 1}
+
+    pool.max_lifetime = 0.001
+    pool.checkin(first)
+    assert first.closed and pool.stats()["idle"] == 0
+
+
+def test_article_price_history_api(client, article1, priced_article_old, priced_article_recent):
+    url = f"/api/inventory/article/{article1.pk}/prices"
+    page = client.get(url, {"page_size": 1}).json()
+    assert [price["id"] for price in page["items"]] == [priced_article_recent.pk]
+    page = client.get(url, {"page_size": 1, "cursor": page["next"]}).json()
+    assert [price["id"] for price in page["items"]] == [priced_article_old.pk]
+    assert page["next"] is None
+
+    page = client.get(url, {"to": (priced_article_recent.set_at - timedelta(days=1)).isoformat()}).json()
+    assert [price["id"] for price in page["items"]] == [priced_article_old.pk]
+    assert client.get(f"/api/inventory/article/{article1.pk + 1000}/prices").status_code == 404
+
+
+def test_articles_price_as_of_api(client, article1, priced_article_old, priced_article_recent, priced_articles):
+    at = (priced_article_recent.set_at - timedelta(days=1)).isoformat()
+    ids = [article1.pk, priced_articles[0].pk]
+    prices = client.get("/api/inventory/articles/prices", {"ids": ids, "at": at}).json()
+    assert [(price["article_id"], price["price"]) for price in prices] == [(article1.pk, priced_article_old.price)]
+    prices = client.get("/api/inventory/articles/prices", {"ids": ids}).json()
+    assert [(price["article_id"], price["price"]) for price in prices] == [
+        (article1.pk, priced_article_recent.price),
+        (priced_articles[0].pk, 14.44),  # the factory price
+    ]
+
+
+def test_get_article_api(client, article1, priced_article_recent, inventory_article_10):
+    response = client.get(f"/api/inventory/article/{article1.pk}")
+    assert response.status_code == 200
+    assert response.json()["quantity"] == inventory_article_10.quantity
+    assert response.json()["price"] == priced_article_recent.price
+
+
+def test_get_article_api_not_found(client, article1):
+    """Unpriced articles have no FullArticle"""
+    assert client.get(f"/api/inventory/article/{article1.pk}").status_code == 404
+
+
+def test_list_articles_api(client, priced_articles):
+    page = client.get("/api/inventory/articles", {"limit": 2, "offset": 1}).json()
+    assert page["count"] == len(priced_articles)
+    assert [item["id"] for item in page["items"]] == [article.pk for article in priced_articles[1:3]]
+
+
+def test_list_articles_selects_schema_columns(client, priced_articles):
+    with CaptureQueriesContext(connection) as queries:
+        page = client.get("/api/inventory/articles", {"limit": 2}).json()
+    page_sql = next(query["sql"] for query in queries if "LIMIT" in query["sql"])
+    assert "JOIN" not in page_sql
+    assert "`taxed_article`.`article_id`" in page_sql and "`taxed_article`.`set_at`" in page_sql
+    assert set(page["items"][0]) == set(ArticleSchema.model_fields)
+
+
+def test_row_schema_matches_model_instances(priced_articles):
+    articles = FullArticle.objects.order_by("article_id")
+    from_rows = [ArticleSchema.model_validate(row).model_dump() for row in project(articles, ArticleSchema)]
+    assert from_rows == [ArticleSchema.model_validate(article).model_dump() for article in articles]
+
+
+def test_row_schema_ninja_hooks():
+    """RowSchema overrides a private validator of ninja's Schema and reads its resolvers, django-ninja is pinned to
+    the minor version this was checked against: a release changing them fails here
+    """
+    assert Schema.__pydantic_decorators__.model_validators["_run_root_validator"].info.mode == "wrap"
+    assert callable(Schema._run_root_validator.__func__)
+    assert list(RowSchema.__pydantic_decorators__.model_validators) == ["_run_root_validator"]
+
+    class Labelled(RowSchema):
+        name: str
+        label: str = ""
+
+        @staticmethod
+        def resolve_label(obj):
+            return obj["name"].upper()
+
+    assert RowSchema._ninja_resolvers == {}
+    assert set(Labelled._ninja_resolvers) == {"label"}
+    assert Labelled.model_validate({"name": "book"}).label == "BOOK"  # schemas with resolvers go through ninja
+
+
+def test_orjson_renderer_matches_json(priced_articles):
+    pytest.importorskip("orjson")
+    rows = [ArticleSchema.model_validate(row).model_dump() for row in project(FullArticle.objects.all(), ArticleSchema)]
+    data = {"items": rows, "count": len(rows)}
+    rendered = ORJSONRenderer().render(None, data, response_status=200)
+    assert json.loads(rendered) == json.loads(JSONRenderer().render(None, data, response_status=200))
+
+
+def test_get_article_cached(client, article1, priced_article_recent, inventory_article_10):
+    for _ in range(3):
+        client.get(f"/api/inventory/article/{article1.pk}")
+    assert article_cache.stats()["misses"] == 1
+    assert article_cache.stats()["hits"] == 2
+
+
+def test_get_article_cache_invalidated_by_stock_update(
+    client, article1, priced_article_recent, inventory_article_10, django_capture_on_commit_callbacks
+):
+    client.get(f"/api/inventory/article/{article1.pk}")
+    with django_capture_on_commit_callbacks(execute=True):
+        Article.update_stock(article_id=article1.pk, action=StockAction.add, amount=5)
+    assert client.get(f"/api/inventory/article/{article1.pk}").json()["quantity"] == 15
+
+
+@pytest.mark.django_db(transaction=True)
+def test_get_article_cache_invalidated_after_stock_write(
+    monkeypatch, article1, priced_article_recent, inventory_article_10
+):
+    """In autocommit the invalidation runs at once, it must come after the UPDATE"""
+    stock_when_invalidated = []
+    delete_many = article_cache.backend.delete_many
+
+    def record_stock(keys):
+        stock_when_invalidated.append(InventoryArticle.objects.get(article_id=article1.pk).quantity)
+        delete_many(keys)
+
+    monkeypatch.setattr(article_cache.backend, "delete_many", record_stock)
+    Article.update_stock(article_id=article1.pk, action=StockAction.add, amount=5)
+    InventoryArticle.reserve(article_id=article1.pk, quantity=3)
+    InventoryArticle.restock(article_id=article1.pk, quantity=1)
+    assert stock_when_invalidated == [15, 12, 13]
+
+
+def test_get_article_cache_invalidated_by_price_update(
+    client, article1, priced_article_recent, django_capture_on_commit_callbacks
+):
+    client.get(f"/api/inventory/article/{article1.pk}")
+    with django_capture_on_commit_callbacks(execute=True):
+        Article.update_price(article_id=article1.pk, price=1.25)
+    assert client.get(f"/api/inventory/article/{article1.pk}").json()["price"] == 1.25
+
+
+def test_lru_backend_eviction_and_expiry():
+    backend = LRUBackend(max_entries=2)
+    backend.set("a", 1, None)
+    backend.set("b", 2, None)
+    backend.get("a")
+    backend.set("c", 3, None)  # evicts b, the least recently used
+    assert (backend.get("a"), backend.get("b"), backend.get("c")) == (1, None, 3)
+    backend.set("d", 4, -1)
+    assert backend.get("d") is None
+
+
+def test_articles_cursor_walks_all_pages(client, priced_articles):
+    seen = []
+    page = client.get("/api/inventory/articles/cursor", {"page_size": 2}).json()
+    assert page["previous"] is None
+    assert page["count"] is None
+    seen += [item["id"] for item in page["items"]]
+    while page["next"]:
+        page = client.get("/api/inventory/articles/cursor", {"page_size": 2, "cursor": page["next"]}).json()
+        seen += [item["id"] for item in page["items"]]
+    assert seen == [article.pk for article in priced_articles]
+
+
+def test_articles_cursor_previous_page(client, priced_articles):
+    first = client.get("/api/inventory/articles/cursor", {"page_size": 2}).json()
+    second = client.get("/api/inventory/articles/cursor", {"page_size": 2, "cursor": first["next"]}).json()
+    back = client.get("/api/inventory/articles/cursor", {"page_size": 2, "cursor": second["previous"]}).json()
+    assert back["items"] == first["items"]
+    assert back["previous"] is None
+
+
+def test_articles_cursor_by_date_created(client, priced_articles):
+    page = client.get(
+        "/api/inventory/articles/cursor", {"page_size": 3, "order_by": "date_created", "with_count": True}
+    ).json()
+    assert page["count"] == len(priced_articles)
+    page = client.get(
+        "/api/inventory/articles/cursor", {"page_size": 3, "order_by": "date_created", "cursor": page["next"]}
+    ).json()
+    assert [item["id"] for item in page["items"]] == [article.pk for article in priced_articles[3:]]
+    assert page["next"] is None
+
+
+def test_articles_cursor_rejects_foreign_cursor(client, priced_articles):
+    page = client.get("/api/inventory/articles/cursor", {"page_size": 2}).json()
+    response = client.get(
+        "/api/inventory/articles/cursor", {"page_size": 2, "order_by": "date_created", "cursor": page["next"]}
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize(
+    "ordering, values",
+    [
+        (["article_id"], ["1"]),
+        (["article_id"], [[1]]),
+        (["article_id"], [True]),
+        (["article_id"], [None]),
+        (["article_id"], [{"dt": "2024-01-01T00:00:00+00:00"}]),
+        (["date_created", "article_id"], [1, 1]),
+    ],
+)
+def test_articles_cursor_rejects_mistyped_values(client, priced_articles, ordering, values):
+    payload = json.dumps({"o": ordering, "k": values, "r": False}).encode()
+    order_by = "date_created" if ordering[0] == "date_created" else "id"
+    response = client.get(
+        "/api/inventory/articles/cursor",
+        {"page_size": 2, "order_by": order_by, "cursor": urlsafe_b64encode(payload).decode()},
+    )
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
+
+
+def test_import_articles_ndjson(client, article1):
+    body = "\n".join(
+        [
+            '{"reference": "imported-1", "name": "one", "description": "", "price": 1.5, "quantity": 3, '
+            '"category_name": "Imported"}',
+            '{"reference": "imported-2", "name": "two", "description": "", "price": 2, "quantity": 0, '
+            '"category_name": "imported"}',
+            f'{{"reference": "{article1.reference}", "name": "dup", "description": "", "price": 1, "quantity": 1, '
+            '"category_name": "imported"}',
+            '{"reference": "IMPORTED-1", "name": "dup", "description": "", "price": 1, "quantity": 1, '
+            '"category_name": "imported"}',
+            '{"reference": "imported-3", "name": "no-price"}',
+            "not json",
+            f'{{"reference": "{"x" * 51}", "name": "long", "description": "", "price": 1, "quantity": 1, '
+            '"category_name": "imported"}',
+            '{"reference": "imported-4", "name": "spaced", "description": "", "price": 1, "quantity": 1, '
+            '"category_name": "not a slug"}',
+        ]
+    )
+    response = client.post(
+        "/api/inventory/articles/import?batch_size=2", data=body, content_type="application/x-ndjson"
+    )
+    assert response.status_code == 200
+    report = response.json()
+    assert report["created"] == 2
+    assert [error["line"] for error in report["errors"]] == [3, 4, 5, 6, 7, 8]
+    assert report["errors"][0]["error"] == f"Duplicate reference: {article1.reference}"
+    assert report["errors"][1]["error"] == "Duplicate reference: IMPORTED-1"
+    # values that do not fit the slug columns are reported before reaching the database
+    assert report["errors"][4]["error"].startswith("reference: String should have at most 50 characters")
+    assert report["errors"][5]["error"].startswith("category_name: String should match pattern")
+
+    imported = FullArticle.objects.filter(reference__startswith="imported-").order_by("reference")
+    assert [(float(a.price), a.quantity) for a in imported] == [(1.5, 3), (2.0, 0)]
+    assert set(Article.objects.filter(reference__startswith="imported-").values_list("category", flat=True)) == {
+        "imported"
+    }
+
+
+def test_import_articles_rejected_by_database(db):
+    """A value the database rejects fails the batch, its rows are then created one by one and the bad one reported"""
+    lines = [
+        '{"reference": "fits", "name": "one", "description": "", "price": 1, "quantity": 1, "category_name": "books"}',
+        '{"reference": "too-expensive", "name": "two", "description": "", "price": 1e30, "quantity": 1, '
+        '"category_name": "books"}',
+    ]
+    report = importer.import_articles(lines)
+    assert report.created == 1
+    assert [(error.line, error.reference) for error in report.errors] == [(2, "too-expensive")]
+    assert report.errors[0].error.startswith("Rejected by the database")
+    assert list(Article.objects.values_list("reference", flat=True)) == ["fits"]
+
+
+def test_import_articles_csv_command(db, tmp_path):
+    feed = tmp_path / "feed.csv"
+    feed.write_text(
+        "reference,name,description,price,quantity,category_name\n"
+        "csv-1,one,first,10.25,5,books\n"
+        "csv-2,two,second,,5,books\n"
+    )
+    call_command("import_articles", str(feed))
+    assert FullArticle.objects.filter(reference="csv-1", quantity=5, price=10.25).exists()
+    assert Article.objects.get(reference="csv-1").category_id == "books"
+    assert not Article.objects.filter(reference="csv-2").exists()
+
+
+def test_export_catalog_api(client, priced_articles, priced_article_recent, inventory_article_10):
+    InventoryArticle.shard(article_id=inventory_article_10.article_id, slots=3)  # stock summed in the view
+    response = client.get("/api/inventory/articles/export", {"chunk_size": 2})
+    assert response.status_code == 200
+    assert response.streaming
+    lines = b"".join(response.streaming_content).decode().splitlines()
+    expected = client.get("/api/inventory/articles", {"limit": len(priced_articles) + 1}).json()["items"]
+    assert [json.loads(line) for line in lines] == expected
+    # integers stay integers, 10.0 would compare equal once parsed
+    stocked = next(line for line in lines if f'"id": {inventory_article_10.article_id},' in line)
+    assert '"quantity": 10,' in stocked
+
+    response = client.get("/api/inventory/articles/export", {"format": "csv", "chunk_size": 2})
+    assert response["Content-Type"] == "text/csv"
+    lines = b"".join(response.streaming_content).decode().splitlines()
+    assert lines[0].split(",") == list(ArticleSchema.model_fields)
+    assert len(lines) == len(priced_articles) + 2
+
+
+def test_export_catalog_uses_unbuffered_cursor(priced_articles):
+    raw_cursors = []
+
+    def record_cursor(execute, sql, params, many, context):
+        cursor = context["cursor"].cursor  # MySQLdb cursor, or the MySQL backend wrapper of one
+        raw_cursors.append(type(getattr(cursor, "cursor", cursor)).__name__)
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(record_cursor):
+        chunks = list(export.catalog_chunks(chunk_size=2))
+        list(FullArticle.objects.values_list("article_id", flat=True).iterator(chunk_size=2))
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    assert [row[0] for chunk in chunks for row in chunk] == sorted(article.pk for article in priced_articles)
+    # only the export streams, other iterators keep a regular cursor
+    assert raw_cursors == ["SSCursor", "Cursor"]
+
+
+def test_export_catalog_parquet_command(priced_articles, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    output = tmp_path / "catalog.parquet"
+    call_command("export_catalog", str(output), "--chunk-size", "2")
+    parquet = pq.ParquetFile(output)
+    assert parquet.metadata.num_rows == len(priced_articles)
+    assert parquet.num_row_groups == (len(priced_articles) + 1) // 2
+    assert parquet.schema_arrow.names == list(ArticleSchema.model_fields)
+
+
+def test_update_stock_batch(db, inventory_article_10, django_assert_max_num_queries):
+    article_id = inventory_article_10.article_id
+    audits = InventoryAudit.objects.count()
+    with django_assert_max_num_queries(4):
+        statuses = Article.update_stock_batch(
+            [
+                (article_id, StockAction.remove, 8),
+                (article_id, StockAction.remove, 5),  # only 2 left
+                (article_id, StockAction.add, 1),
+                (article_id, StockAction.add, 0),
+                (article_id + 1000, StockAction.add, 1),
+            ]
+        )
+    assert statuses == ["applied", "rejected", "applied", "rejected", "not_found"]
+    inventory_article_10.refresh_from_db()
+    assert inventory_article_10.quantity == 3
+    assert InventoryAudit.objects.count() == audits + 1
+
+
+def test_update_articles_stock_api(client, inventory_article_10):
+    response = client.put(
+        "/api/inventory/articles/stock",
+        data=[{"article_id": inventory_article_10.article_id, "action": "add", "amount": 5}],
+        content_type="application/json",
+    )
+    assert response.json() == [
+        {"article_id": inventory_article_10.article_id, "action": "add", "amount": 5, "status": "applied"}
+    ]
+    inventory_article_10.refresh_from_db()
+    assert inventory_article_10.quantity == 15
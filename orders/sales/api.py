@@ -3,20 +3,25 @@ from ninja.pagination import paginate, LimitOffsetPagination
 from ninja.errors import HttpError
 from django.db.utils import IntegrityError
 
+from app.db_router import pins_primary, replica_reads
+from inventory.cache import article_cache
 from inventory.models import Category
-from .models import Tax, CategoryTax, PurchaceOrder, DetailedPurchaceOrder
-from .schemas import TaxSchema, CategoryTaxScheme, OrderSchema, OrderBasicSchema
+from inventory.projection import project
+from .models import Tax, CategoryTax, PurchaceOrder
+from .schemas import TaxSchema, CategoryTaxScheme, OrderSchema, OrderBasicSchema, OrderCreateInput
 
 router = Router(tags=["Orders"])
 
 
 @router.get("/taxes", response=list[TaxSchema])
+@replica_reads
 @paginate(LimitOffsetPagination)
 def list_taxes(request):
     return Tax.objects.all()
 
 
 @router.post("/taxes/add")
+@pins_primary
 def add_tax(request, tax: Form[TaxSchema]):
     tax, created = Tax.objects.get_or_create(
         reference=tax.reference,
@@ -28,6 +33,7 @@ def add_tax(request, tax: Form[TaxSchema]):
 
 
 @router.post("/taxes/assign")
+@pins_primary
 def assign_tax(request, data: Form[CategoryTaxScheme]):
     if tax := Tax.objects.filter(reference=data.tax).first():
         if cat := Category.objects.filter(name=data.category).first():
@@ -36,18 +42,21 @@ def assign_tax(request, data: Form[CategoryTaxScheme]):
                 tax=tax,
                 valid_from=data.valid_from,
             )
+            article_cache.invalidate_category(cat.name)
             return 201
         raise HttpError(404, "Cateory not found")
     raise HttpError(404, "Tax not found")
 
 
 @router.get("orders", response=list[OrderBasicSchema])
+@replica_reads
 @paginate(LimitOffsetPagination)
-def list_orders(request):
-    return PurchaceOrder.objects.all()
+async def list_orders(request):
+    return project(PurchaceOrder.objects.all(), OrderBasicSchema)
 
 
 @router.post("order/create")
+@pins_primary
 def create_order(request, reference: str):
     try:
         PurchaceOrder.objects.create(
@@ -59,7 +68,29 @@ def create_order(request, reference: str):
         raise HttpError(400, "Duplicate")
 
 
+@router.post("order/createwithlines", response={201: OrderSchema})
+@pins_primary
+def create_order_with_lines(request, data: OrderCreateInput):
+    """Create the order with all its lines at once, and return its totals.
+
+    The stock of every line is reserved, or none when an article is not in the inventory or out of stock.
+    Lines of the same article are merged
+    """
+    try:
+        order = PurchaceOrder.create_with_lines(
+            reference=data.reference,
+            created_by_id=1,  # assuming super user was created
+            lines=[(line.article_id, line.quantity) for line in data.lines],
+        )
+    except IntegrityError:
+        raise HttpError(400, "Duplicate")
+    except ValueError as e:
+        raise HttpError(400, e.args[0])
+    return 201, order.get_details()
+
+
 @router.post("order/updateitem/{reference}")
+@pins_primary
 def update_order(request, reference: str, article_id: int, quantity_change: int):
     """Add or remove items from an order.
     
@@ -76,8 +107,23 @@ def update_order(request, reference: str, article_id: int, quantity_change: int)
     raise HttpError(404, "Order not found")
 
 
+@router.post("order/checkout/{reference}", response=OrderSchema)
+@pins_primary
+def checkout_order(request, reference: str):
+    """Confirm the order: its articles stay reserved for good, instead of going back to the stock
+    SALES_RESERVATION_SECONDS after they were added
+    """
+    if order := PurchaceOrder.objects.filter(reference=reference).first():
+        try:
+            order.checkout()
+        except ValueError as e:
+            raise HttpError(400, e.args[0])
+        return order.get_details()
+    raise HttpError(404, "Order not found")
+
+
 @router.get("order/view/{reference}", response=OrderSchema)
-def order_details(request, order_id: int):
-    if order := DetailedPurchaceOrder.aggregate_order(order_id):
+async def order_details(request, order_id: int):
+    if order := await PurchaceOrder.details(order_id).afirst():
         return order
     raise HttpError(404, "Not found")
@@ -0,0 +1,100 @@
+import json
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from benchmarks.runner import TRANSPORTS, compare, run_scenario
+from benchmarks.scenarios import SCENARIOS
+from benchmarks.seed import Dataset, seed
+from inventory.models import Article
+from .seed_data import add_scale_arguments, scale_from_options
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a benchmark database (bench_<NAME>) and run the API scenarios through WSGI and ASGI, "
+        "write latency percentiles, throughput and queries per request to a JSON report"
+    )
+
+    def add_arguments(self, parser):
+        add_scale_arguments(parser)
+        parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="Run only these scenarios")
+        parser.add_argument("--transport", action="append", choices=TRANSPORTS, help="Run only these transports")
+        parser.add_argument("--iterations", type=int, default=1000, help="Measured requests per scenario")
+        parser.add_argument("--warmup", type=int, default=50, help="Requests sent before measuring")
+        parser.add_argument("--concurrency", type=int, default=1, help="Requests in flight (threads under WSGI)")
+        parser.add_argument(
+            "--stock-slots",
+            action="append",
+            type=int,
+            help="Run hot_checkout with the stock of its article split across this many slots (0 by default)",
+        )
+        parser.add_argument("--output", default="benchmark.json", help="Where to write the JSON report")
+        parser.add_argument("--baseline", help="JSON report to compare with, fail on regressions")
+        parser.add_argument(
+            "--tolerance", type=float, default=0.2, help="Allowed latency and throughput change (0.2 = 20%%)"
+        )
+        parser.add_argument(
+            "--keepdb", action="store_true", help="Keep the benchmark database, and reuse it if already seeded"
+        )
+
+    def handle(self, *args, **options):
+        if options["iterations"] < 1:
+            raise CommandError("--iterations should be positive")
+        scale = scale_from_options(options)
+
+        settings.DEBUG = False  # DEBUG keeps every query in memory
+        setup_test_environment(debug=False)
+        settings.DATABASE_REPLICAS = {}  # replicas do not have the benchmark database
+        connection.settings_dict["TEST"]["NAME"] = f"bench_{connection.settings_dict['NAME']}"
+        old_name = connection.settings_dict["NAME"]
+        verbosity = options["verbosity"]
+        connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, keepdb=options["keepdb"])
+        try:
+            if options["keepdb"] and Article.objects.exists():
+                self.stdout.write("Reusing the seeded benchmark database")
+                dataset = Dataset.load()
+            else:
+                self.stdout.write(f"Seeding {scale}")
+                dataset = seed(scale, seed=options["seed"], method=options["method"])
+            report = {
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "scale": {"name": options["scale"], **vars(scale)},
+                "seed": options["seed"],
+                "iterations": options["iterations"],
+                "concurrency": options["concurrency"],
+                "results": {},
+            }
+            scenarios = [SCENARIOS[name] for name in options["scenario"] or SCENARIOS]
+            for name, scenario in (variant for scenario in scenarios for variant in scenario.variants(options)):
+                for transport in options["transport"] or TRANSPORTS:
+                    result = run_scenario(
+                        scenario,
+                        dataset,
+                        transport,
+                        iterations=options["iterations"],
+                        warmup=options["warmup"],
+                        concurrency=options["concurrency"],
+                        seed=options["seed"],
+                    )
+                    report["results"][f"{name}/{transport}"] = result
+                    self.stdout.write(f"{name}/{transport}: {json.dumps(result)}")
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=verbosity, keepdb=options["keepdb"])
+            teardown_test_environment()
+
+        with open(options["output"], "w") as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                lines, regressions = compare(report, json.load(f), options["tolerance"])
+            for line in lines:
+                self.stdout.write(line)
+            if regressions:
+                raise CommandError(f"{len(regressions)} regressions: {'; '.join(regressions)}")
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from sales.models import PurchaceOrder
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored totals of every order from the order_details view, or only report drift with --check"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report orders whose stored totals do not match the order_details view, fail if there are any",
+        )
+
+    def handle(self, *args, **options):
+        drifted = PurchaceOrder.totals_drift()
+        if options["check"]:
+            if drifted:
+                raise CommandError(f"{len(drifted)} orders drifted: {', '.join(map(str, drifted[:20]))}")
+            self.stdout.write(self.style.SUCCESS("Order totals match the order_details view"))
+            return
+        PurchaceOrder.rebuild_totals()
+        self.stdout.write(self.style.SUCCESS(f"Order totals rebuilt, {len(drifted)} orders had drifted"))
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from sales.models import StockReservation
+
+
+class Command(BaseCommand):
+    help = (
+        "Give the stock of the order lines whose reservation expired back to the inventory and remove the lines, "
+        "once or every --interval seconds"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Expired reservations released per batch")
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Keep running, sweeping every INTERVAL seconds (by default, release what is expired and exit)",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            released, skipped = 0, set()
+            while True:
+                locked = len(skipped)
+                batch = StockReservation.release_expired(batch_size=options["batch_size"], skipped=skipped)
+                released += batch
+                # a batch of orders locked by line changes releases nothing, the sweep goes on past them
+                if not batch and len(skipped) == locked:
+                    break
+            if released or not options["interval"]:
+                self.stdout.write(self.style.SUCCESS(f"Released {released} order lines"))
+            if not options["interval"]:
+                return
+            close_old_connections()
+            time.sleep(options["interval"])
@@ -0,0 +1,61 @@
+from dataclasses import replace
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from benchmarks.seed import LOADERS, SCALES, seed
+from inventory.models import InventoryAudit, PricedArticle
+from sales.models import OrderArticle
+
+SCALE_OPTIONS = {
+    # option: Scale field
+    "articles": "articles",
+    "price_points_per_article": "price_points",
+    "orders": "orders",
+    "lines_per_order": "lines_per_order",
+    "audit_events_per_article": "audit_events",
+    "zipf_exponent": "zipf_exponent",
+}
+
+
+def add_scale_arguments(parser) -> None:
+    parser.add_argument("--scale", choices=SCALES, default="small", help="Preset, the other options override it")
+    parser.add_argument("--articles", type=int)
+    parser.add_argument("--price-points-per-article", type=int)
+    parser.add_argument("--orders", type=int)
+    parser.add_argument("--lines-per-order", type=int, help="Articles drawn for each order")
+    parser.add_argument("--audit-events-per-article", type=int, help="Stock changes in the history of each article")
+    parser.add_argument("--zipf-exponent", type=float, help="Skew of the article popularity in orders")
+    parser.add_argument("--seed", type=int, default=0, help="The same seed on an empty database gives the same rows")
+    parser.add_argument(
+        "--method",
+        choices=LOADERS,
+        default="insert",
+        help="Multi-row INSERTs, or LOAD DATA LOCAL INFILE (faster, the server must allow local_infile)",
+    )
+
+
+def scale_from_options(options):
+    overrides = {field: options[option] for option, field in SCALE_OPTIONS.items() if options[option] is not None}
+    return replace(SCALES[options["scale"]], **overrides)
+
+
+class Command(BaseCommand):
+    help = "Add a generated catalog, price history, stock history and orders to the database, in batches"
+
+    def add_arguments(self, parser):
+        add_scale_arguments(parser)
+        parser.add_argument("--batch-size", type=int, default=10_000, help="Articles or orders generated per batch")
+
+    def handle(self, *args, **options):
+        scale = scale_from_options(options)
+        self.stdout.write(f"Seeding {scale}")
+        start = perf_counter()
+        dataset = seed(scale, seed=options["seed"], batch_size=options["batch_size"], method=options["method"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Seeded in {perf_counter() - start:.1f}s, the database has {len(dataset.article_ids)} articles"
+                f", {PricedArticle.objects.count()} prices, {len(dataset.orders)} orders"
+                f", {OrderArticle.objects.count()} order lines, {InventoryAudit.objects.count()} audit rows"
+            )
+        )
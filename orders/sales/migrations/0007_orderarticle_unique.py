@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_currentprice'),
+        ('sales', '0006_alter_tax_value'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='orderarticle',
+            constraint=models.UniqueConstraint(fields=('purchace_order', 'article'), name='unique_order_article'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:12
+
+from django.db import migrations, models
+
+from sales.models import ORDER_TOTALS_SQL
+
+backfill_sql = f"""
+UPDATE `sales_purchaceorder` `o`
+JOIN ({ORDER_TOTALS_SQL}) `expected` ON (`expected`.`id` = `o`.`id`)
+SET
+    `o`.`article_quantities` = `expected`.`articles`
+    , `o`.`total_pre_tax` = `expected`.`total_pre_tax`
+    , `o`.`total_taxed` = `expected`.`total_taxed`;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0007_orderarticle_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchaceorder',
+            name='article_quantities',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.AddField(
+            model_name='purchaceorder',
+            name='total_pre_tax',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=28),
+        ),
+        migrations.AddField(
+            model_name='purchaceorder',
+            name='total_taxed',
+            field=models.DecimalField(decimal_places=5, default=0, max_digits=28),
+        ),
+        migrations.RunSQL(backfill_sql, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:13
+
+import importlib
+
+from django.db import migrations, models
+
+from sales.models import ORDER_TOTALS_SQL
+
+# existing lines are priced with the current price, taxed with the tax at order time
+backfill_sql = """
+UPDATE `sales_orderarticle`
+JOIN `sales_purchaceorder` ON (`sales_purchaceorder`.`id` = `sales_orderarticle`.`purchace_order_id`)
+JOIN `inventory_article` ON (`inventory_article`.`id` = `sales_orderarticle`.`article_id`)
+LEFT JOIN `inventory_currentprice` ON (`inventory_currentprice`.`article_id` = `sales_orderarticle`.`article_id`)
+SET
+    `sales_orderarticle`.`unit_price` = `inventory_currentprice`.`price`
+    , `sales_orderarticle`.`tax_rate` = (
+        SELECT `sales_tax`.`value`
+        FROM `sales_categorytax`
+        JOIN `sales_tax` ON (`sales_tax`.`reference` = `sales_categorytax`.`tax_id`)
+        WHERE `sales_categorytax`.`category_id` = `inventory_article`.`category_id`
+            AND `sales_categorytax`.`valid_from` <= `sales_purchaceorder`.`created_at`
+        ORDER BY `sales_categorytax`.`valid_from` DESC
+        LIMIT 1
+    );
+"""
+
+# lines without a price or a tax are left out, as the joins of the previous definition did
+create_view_sql = """
+CREATE OR REPLACE VIEW `order_details` AS
+    SELECT
+        `sales_purchaceorder`.`id`
+        , `sales_purchaceorder`.`reference`
+        , `sales_purchaceorder`.`created_at`
+        , `sales_purchaceorder`.`created_by_id`
+        , `sales_orderarticle`.`article_id`
+        , `inventory_article`.`reference` AS `article_reference`
+        , `sales_orderarticle`.`quantity`
+        , `sales_orderarticle`.`unit_price` AS `price`
+        , `sales_orderarticle`.`tax_rate` AS `tax_value`
+    FROM `sales_purchaceorder`
+    JOIN `sales_orderarticle` ON (`sales_orderarticle`.`purchace_order_id` = `sales_purchaceorder`.`id`)
+    JOIN `inventory_article` ON (`inventory_article`.`id` = `sales_orderarticle`.`article_id`)
+    WHERE `sales_orderarticle`.`unit_price` IS NOT NULL AND `sales_orderarticle`.`tax_rate` IS NOT NULL;
+"""
+
+# the previous definition, joining every price and tax of the history
+previous_view_sql = importlib.import_module("sales.migrations.0003_prices_and_taxes").create_sql
+
+rebuild_totals_sql = f"""
+UPDATE `sales_purchaceorder` `o`
+LEFT JOIN ({ORDER_TOTALS_SQL}) `expected` ON (`expected`.`id` = `o`.`id`)
+SET
+    `o`.`article_quantities` = COALESCE(`expected`.`articles`, '{{}}')
+    , `o`.`total_pre_tax` = COALESCE(`expected`.`total_pre_tax`, 0)
+    , `o`.`total_taxed` = COALESCE(`expected`.`total_taxed`, 0);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_currentprice'),
+        ('sales', '0008_purchaceorder_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderarticle',
+            name='tax_rate',
+            field=models.DecimalField(decimal_places=3, max_digits=6, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderarticle',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=28, null=True),
+        ),
+        migrations.RunSQL(backfill_sql, reverse_sql=migrations.RunSQL.noop),
+        migrations.RunSQL(create_view_sql, reverse_sql=previous_view_sql),
+        migrations.RunSQL(rebuild_totals_sql, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0009_orderarticle_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('line', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='reservation', serialize=False, to='sales.orderarticle')),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='purchaceorder',
+            name='checked_out_at',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
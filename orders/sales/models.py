@@ -1,9 +1,16 @@
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal
+
 from django.db import models
 from django.conf import settings
-from django.db import transaction
+from django.db import connection, transaction
 from django.db.models import F
+from django.utils import timezone
 
-from inventory.models import InventoryArticle, Category, Article
+from inventory.cache import article_cache
+from inventory.models import InventoryArticle, Category, Article, CurrentPrice, StockSlot
+from inventory.schemas import StockAction, StockAdjustmentStatus
 
 
 class Tax(models.Model):
@@ -27,16 +34,174 @@ class CategoryTax(models.Model):
         return f"Category tax: {self.category.pk}@{self.tax.pk}"
 
 
+# tax of the category of `article` in force at the time given as query parameter
+ORDER_TIME_TAX_SQL = """
+    SELECT `sales_tax`.`value`
+    FROM `sales_categorytax`
+    JOIN `sales_tax` ON (`sales_tax`.`reference` = `sales_categorytax`.`tax_id`)
+    WHERE `sales_categorytax`.`category_id` = `article`.`category_id` AND `sales_categorytax`.`valid_from` <= %s
+    ORDER BY `sales_categorytax`.`valid_from` DESC
+    LIMIT 1
+"""
+
+ORDER_TOTALS_FIELDS = ("article_quantities", "total_pre_tax", "total_taxed")
+
+
+def order_totals_sql(where: str = "") -> str:
+    """What the order totals should be, computed from the order_details view, of the orders matching `where`"""
+    return f"""
+    SELECT
+        `id`
+        , JSON_OBJECTAGG(`article_reference`, `quantity`) AS `articles`
+        , SUM(`price` * `quantity`) AS `total_pre_tax`
+        , SUM((`price` + `price` * `tax_value`) * `quantity`) AS `total_taxed`
+    FROM `order_details`
+    {f"WHERE {where}" if where else ""}
+    GROUP BY `id`
+"""
+
+
+ORDER_TOTALS_SQL = order_totals_sql()
+
+
 class PurchaceOrder(models.Model):
     reference = models.SlugField(unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # kept up to date by every line change, so reading an order does not aggregate its lines
+    article_quantities = models.JSONField(default=dict)  # {article reference: quantity}
+    total_pre_tax = models.DecimalField(max_digits=28, decimal_places=2, default=0)
+    total_taxed = models.DecimalField(max_digits=28, decimal_places=5, default=0)
+    # lines of orders not checked out yet hold their stock for a while only, see StockReservation
+    checked_out_at = models.DateTimeField(null=True)
 
     def __str__(self) -> str:
         return f"PurchaceOrder: {self.reference} ({self.created_by.pk})"
 
+    @classmethod
+    def details(cls, order_id: int) -> models.QuerySet:
+        return cls.objects.filter(pk=order_id).values(
+            "id",
+            "reference",
+            "created_at",
+            "created_by_id",
+            "total_pre_tax",
+            "total_taxed",
+            "checked_out_at",
+            articles=F("article_quantities"),
+        )
+
     def get_details(self) -> dict | None:
-        return DetailedPurchaceOrder.aggregate_order(self.pk)
+        return self.details(self.pk).first()
+
+    def _lock(self) -> None:
+        """Lock the order row and refresh its totals.
+        Line changes take this lock before touching the stock, so changes of an order are applied one at a time
+        """
+        locked = (
+            PurchaceOrder.objects.select_for_update()
+            .values("created_at", "checked_out_at", *ORDER_TOTALS_FIELDS)
+            .get(pk=self.pk)
+        )
+        for field, value in locked.items():
+            setattr(self, field, value)
+
+    def _account_line(
+        self, reference: str, unit_price: Decimal | None, tax_rate: Decimal | None, quantity: int
+    ) -> None:
+        """Apply a change of `quantity` (negative when removing) of an order line to the stored line map and totals.
+        Like in the order_details view, lines without a price or without a tax are left out
+        """
+        if unit_price is None or tax_rate is None:
+            return
+        quantities = dict(self.article_quantities)
+        if (article_quantity := quantities.get(reference, 0) + quantity) > 0:
+            quantities[reference] = article_quantity
+        else:
+            quantities.pop(reference, None)
+        self.article_quantities = quantities
+        self.total_pre_tax += unit_price * quantity
+        self.total_taxed += (unit_price + unit_price * tax_rate) * quantity
+        self.save(update_fields=ORDER_TOTALS_FIELDS)
+
+    @classmethod
+    def totals_drift(cls) -> list[int]:
+        """Ids of the orders whose stored totals do not match the order_details view"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT `o`.`id`
+                FROM `{cls._meta.db_table}` `o`
+                LEFT JOIN ({ORDER_TOTALS_SQL}) `expected` ON (`expected`.`id` = `o`.`id`)
+                WHERE NOT JSON_EQUALS(`o`.`article_quantities`, COALESCE(`expected`.`articles`, '{{}}'))
+                    OR `o`.`total_pre_tax` <> COALESCE(`expected`.`total_pre_tax`, 0)
+                    OR `o`.`total_taxed` <> COALESCE(`expected`.`total_taxed`, 0)
+                ORDER BY `o`.`id`
+                """
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    @classmethod
+    def rebuild_totals(cls, order_ids: list[int] | None = None) -> None:
+        """Recompute the stored totals of every order, or of `order_ids`, from the order_details view"""
+        where, params = "", []
+        if order_ids is not None:
+            where, params = f"`id` IN ({', '.join(['%s'] * len(order_ids))})", order_ids
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE `{cls._meta.db_table}` `o`
+                LEFT JOIN ({order_totals_sql(where)}) `expected` ON (`expected`.`id` = `o`.`id`)
+                SET
+                    `o`.`article_quantities` = COALESCE(`expected`.`articles`, '{{}}')
+                    , `o`.`total_pre_tax` = COALESCE(`expected`.`total_pre_tax`, 0)
+                    , `o`.`total_taxed` = COALESCE(`expected`.`total_taxed`, 0)
+                {f"WHERE `o`.{where}" if where else ""}
+                """,
+                params * 2,
+            )
+
+    @classmethod
+    def create_with_lines(cls, reference: str, created_by_id: int, lines: list[tuple[int, int]]) -> "PurchaceOrder":
+        """Create the order with its (article_id, quantity) lines, taking the stock of every line or of none.
+
+        The stock is locked and taken by Article.update_stock_batch, in article_id order so concurrent orders cannot
+        deadlock each other, and the lines are inserted by OrderArticle.insert_lines, priced and taxed in SQL like
+        lines added one at a time: the number of queries only grows by one per STOCK_BATCH_SIZE articles (and per
+        sharded article). Lines of the same article are merged
+        """
+        quantities: dict[int, int] = {}
+        for article_id, quantity in lines:
+            if quantity <= 0:
+                raise ValueError("Quantities should be positive")
+            quantities[article_id] = quantities.get(article_id, 0) + quantity
+        article_ids = sorted(quantities)
+        with transaction.atomic():
+            order = cls.objects.create(reference=reference, created_by_id=created_by_id)
+            statuses = Article.update_stock_batch(
+                [(article_id, StockAction.remove, quantities[article_id]) for article_id in article_ids]
+            )
+            for article_id, status in zip(article_ids, statuses):
+                if status == StockAdjustmentStatus.not_found:
+                    raise ValueError(f"Article {article_id} is not in the inventory")
+                if status == StockAdjustmentStatus.rejected:
+                    raise ValueError(f"Article {article_id} out of stock")
+
+            order_lines = OrderArticle.insert_lines(
+                purchace_order_id=order.pk, quantities=quantities, ordered_at=order.created_at
+            )
+            # like in the order_details view, lines without a price or without a tax are left out of the totals
+            accounted = [line for line in order_lines if line.unit_price is not None and line.tax_rate is not None]
+            references = dict(
+                Article.objects.filter(pk__in=[line.article_id for line in accounted]).values_list("pk", "reference")
+            )
+            for line in accounted:
+                order.article_quantities[references[line.article_id]] = line.quantity
+                order.total_pre_tax += line.unit_price * line.quantity
+                order.total_taxed += (line.unit_price + line.unit_price * line.tax_rate) * line.quantity
+            StockReservation.hold_lines(order_lines)
+            order.save(update_fields=ORDER_TOTALS_FIELDS)
+        return order
 
     def update_article(self, article_id: int, quantity: int) -> None:
         if quantity > 0:
@@ -47,61 +212,91 @@ class PurchaceOrder(models.Model):
 
     def _add_article(self, article_id: int, quantity: int) -> None:
         """
-        1- Check the stock
+        1- Take the quantity from the stock, if there is enough of it
         2- Add/Update order_article
-        3- update stock_article quantity
+        3- Reserve the stock of the line for a while, unless the order is checked out
+        4- Update the order totals
         """
         with transaction.atomic():
-            if inventory_article := InventoryArticle.objects.filter(
-                article_id=article_id, quantity__gte=quantity
-            ).first():
-                OrderArticle.objects.update_or_create(
-                    purchace_order=self,
-                    article_id=article_id,
-                    create_defaults={"quantity": quantity},
-                    defaults={"quantity": F("quantity") + quantity},
-                )
-                inventory_article.quantity -= quantity
-                inventory_article.save()
-            else:
+            self._lock()
+            if not InventoryArticle.reserve(article_id=article_id, quantity=quantity):
                 raise ValueError("Article out of stock")
+            OrderArticle.add_quantity(
+                purchace_order_id=self.pk, article_id=article_id, quantity=quantity, ordered_at=self.created_at
+            )
+            if self.checked_out_at is None:
+                StockReservation.hold(purchace_order_id=self.pk, article_id=article_id)
+            line = (
+                OrderArticle.objects.filter(purchace_order=self, article_id=article_id)
+                .values("unit_price", "tax_rate", reference=F("article__reference"))
+                .get()
+            )
+            self._account_line(quantity=quantity, **line)
 
     def _remove_article(self, article_id: int, quantity: int) -> None:
         """
         1- Check order articles
         2- Remove/Update order_article
         3- Update stock_article quantity
+        4- Update the order totals
         """
         with transaction.atomic():
-            if order_article := OrderArticle.objects.filter(
-                purchace_order=self, article_id=article_id, quantity=quantity
-            ).first():
+            self._lock()
+            lines = OrderArticle.objects.select_related("article").filter(purchace_order=self, article_id=article_id)
+            if order_article := lines.filter(quantity=quantity).first():
                 order_article.delete()
 
-            elif order_article := OrderArticle.objects.filter(
-                purchace_order=self, article_id=article_id, quantity__gt=quantity
-            ).first():
+            elif order_article := lines.filter(quantity__gt=quantity).first():
                 order_article.quantity -= quantity
                 order_article.save()
             else:
                 raise ValueError("Not enough articles in order to remove")
 
-            InventoryArticle.objects.filter(article_id=article_id).update(
-                quantity=F("quantity") + quantity
+            InventoryArticle.restock(article_id=article_id, quantity=quantity)
+            self._account_line(
+                reference=order_article.article.reference,
+                unit_price=order_article.unit_price,
+                tax_rate=order_article.tax_rate,
+                quantity=-quantity,
             )
 
+    def checkout(self) -> None:
+        """Confirm the order: the stock of its lines is no longer released when their reservations expire.
+        Lines added afterwards are not reserved, they are confirmed right away
+        """
+        with transaction.atomic():
+            self._lock()
+            if self.checked_out_at is not None:
+                raise ValueError("Order already checked out")
+            StockReservation.objects.filter(line__purchace_order=self).delete()
+            self.checked_out_at = timezone.now()
+            self.save(update_fields=["checked_out_at"])
+
     def cancel_order(self):
-        """for each OrderArticle in PurchaseOrder:
-            - return the quantity to inventory
-            - delete the OrderArticle
-        Then delete the order itself
+        """Return the quantity of every OrderArticle in PurchaseOrder to inventory,
+        then delete the OrderArticles and the order itself.
+        The number of queries does not depend on the number of articles in the order
         """
         with transaction.atomic():
-            for order_article in self.articles.all():  # type: ignore Djano does not make easy for pylance to get related items
-                InventoryArticle.objects.filter(article=order_article.article).update(
-                    quantity=F("quantity") + order_article.quantity
+            self._lock()  # same lock order as line changes: order, then stock
+            OrderArticle.restock("`purchace_order_id` = %s", [self.pk])
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    DELETE `reservation` FROM `{StockReservation._meta.db_table}` AS `reservation`
+                    JOIN `{OrderArticle._meta.db_table}` AS `line` ON (`line`.`id` = `reservation`.`line_id`)
+                    WHERE `line`.`purchace_order_id` = %s
+                    """,
+                    [self.pk],
                 )
-                order_article.delete()
+                cursor.execute(
+                    f"""
+                    DELETE FROM `{OrderArticle._meta.db_table}` WHERE `purchace_order_id` = %s
+                    RETURNING `article_id`
+                    """,
+                    [self.pk],
+                )
+                article_cache.invalidate(*(article_id for article_id, in cursor.fetchall()))
             self.delete()
 
 
@@ -114,6 +309,200 @@ class OrderArticle(models.Model):
     )
     article = models.ForeignKey(Article, on_delete=models.DO_NOTHING)
     quantity = models.PositiveIntegerField()
+    # price and tax when the article was first added to the order, None if the article had none
+    unit_price = models.DecimalField(max_digits=28, decimal_places=2, null=True)
+    tax_rate = models.DecimalField(max_digits=6, decimal_places=3, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["purchace_order", "article"], name="unique_order_article"),
+        ]
+
+    @classmethod
+    def add_quantity(cls, purchace_order_id: int, article_id: int, quantity: int, ordered_at: datetime) -> None:
+        """Create the order line or increase its quantity, in a single statement that is safe under concurrency.
+        A new line takes the current price of the article and the tax of its category at `ordered_at`
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO `{cls._meta.db_table}`
+                    (`purchace_order_id`, `article_id`, `quantity`, `unit_price`, `tax_rate`)
+                SELECT %s, `article`.`id`, %s, `current_price`.`price`, ({ORDER_TIME_TAX_SQL})
+                FROM `{Article._meta.db_table}` AS `article`
+                LEFT JOIN `{CurrentPrice._meta.db_table}` AS `current_price`
+                    ON (`current_price`.`article_id` = `article`.`id`)
+                WHERE `article`.`id` = %s
+                ON DUPLICATE KEY UPDATE `quantity` = `{cls._meta.db_table}`.`quantity` + VALUES(`quantity`)
+                """,
+                [purchace_order_id, quantity, connection.ops.adapt_datetimefield_value(ordered_at), article_id],
+            )
+
+    @classmethod
+    def insert_lines(
+        cls, purchace_order_id: int, quantities: dict[int, int], ordered_at: datetime
+    ) -> list["OrderArticle"]:
+        """Create the lines of a new order from `{article_id: quantity}`, in a single statement, and return them.
+        Lines are priced like in `add_quantity`: the current price of the article and the tax of its category at
+        `ordered_at`
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO `{cls._meta.db_table}`
+                    (`purchace_order_id`, `article_id`, `quantity`, `unit_price`, `tax_rate`)
+                SELECT %s, `article`.`id`, `line`.`quantity`, `current_price`.`price`, ({ORDER_TIME_TAX_SQL})
+                FROM JSON_TABLE(
+                    %s, '$[*]' COLUMNS (`article_id` INT PATH '$[0]', `quantity` INT PATH '$[1]')
+                ) AS `line`
+                JOIN `{Article._meta.db_table}` AS `article` ON (`article`.`id` = `line`.`article_id`)
+                LEFT JOIN `{CurrentPrice._meta.db_table}` AS `current_price`
+                    ON (`current_price`.`article_id` = `article`.`id`)
+                ORDER BY `article`.`id`
+                RETURNING `id`, `article_id`, `quantity`, `unit_price`, `tax_rate`
+                """,
+                [
+                    purchace_order_id,
+                    connection.ops.adapt_datetimefield_value(ordered_at),
+                    json.dumps(sorted(quantities.items())),
+                ],
+            )
+            return [
+                cls(
+                    id=line_id,
+                    purchace_order_id=purchace_order_id,
+                    article_id=article_id,
+                    quantity=quantity,
+                    unit_price=unit_price,
+                    tax_rate=tax_rate,
+                )
+                for line_id, article_id, quantity, unit_price, tax_rate in cursor.fetchall()
+            ]
+
+    @classmethod
+    def restock(cls, condition: str, params: list) -> None:
+        """Give the quantity of the lines matching the SQL `condition` back to the stock of their articles.
+        Two statements whatever the number of lines: one for the articles, one for the sharded ones, which get it
+        back in one of their slots
+        """
+        # several lines of an article would update its stock once in a multi-table UPDATE, they are summed first
+        lines = f"""
+            SELECT `article_id`, SUM(`quantity`) AS `quantity`, MIN(`id`) AS `id`
+            FROM `{cls._meta.db_table}`
+            WHERE {condition}
+            GROUP BY `article_id`
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE `{InventoryArticle._meta.db_table}` AS `inventory`
+                JOIN ({lines}) AS `line` ON (`line`.`article_id` = `inventory`.`article_id`)
+                SET `inventory`.`quantity` = `inventory`.`quantity` + `line`.`quantity`
+                WHERE `inventory`.`slots` = 0
+                """,
+                params,
+            )
+            cursor.execute(
+                f"""
+                UPDATE `{StockSlot._meta.db_table}` AS `slot`
+                JOIN `{InventoryArticle._meta.db_table}` AS `inventory`
+                    ON (`inventory`.`article_id` = `slot`.`article_id`)
+                JOIN ({lines}) AS `line` ON (`line`.`article_id` = `slot`.`article_id`)
+                SET `slot`.`quantity` = `slot`.`quantity` + `line`.`quantity`
+                WHERE `slot`.`slot` = MOD(`line`.`id`, `inventory`.`slots`)
+                """,
+                params,
+            )
+
+
+def reservation_seconds() -> int:
+    return getattr(settings, "SALES_RESERVATION_SECONDS", 15 * 60)
+
+
+class StockReservation(models.Model):
+    """The stock of an order line is held until `expires_at` (SALES_RESERVATION_SECONDS after the last addition to
+    the line), then `release_expired` gives it back and removes the line, unless the order was checked out.
+    Lines without a reservation are confirmed
+    """
+
+    line = models.OneToOneField(OrderArticle, on_delete=models.CASCADE, primary_key=True, related_name="reservation")
+    expires_at = models.DateTimeField(db_index=True)
+
+    @classmethod
+    def hold(cls, purchace_order_id: int, article_id: int) -> None:
+        """Reserve the stock of the order line from now on, for SALES_RESERVATION_SECONDS"""
+        expires_at = timezone.now() + timedelta(seconds=reservation_seconds())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO `{cls._meta.db_table}` (`line_id`, `expires_at`)
+                SELECT `id`, %s FROM `{OrderArticle._meta.db_table}`
+                WHERE `purchace_order_id` = %s AND `article_id` = %s
+                ON DUPLICATE KEY UPDATE `expires_at` = VALUES(`expires_at`)
+                """,
+                [connection.ops.adapt_datetimefield_value(expires_at), purchace_order_id, article_id],
+            )
+
+    @classmethod
+    def hold_lines(cls, lines: list[OrderArticle]) -> None:
+        """Reserve the stock of the new order lines from now on, for SALES_RESERVATION_SECONDS"""
+        expires_at = timezone.now() + timedelta(seconds=reservation_seconds())
+        cls.objects.bulk_create([cls(line=line, expires_at=expires_at) for line in lines])
+
+    @classmethod
+    def release_expired(
+        cls, batch_size: int = 1000, now: datetime | None = None, skipped: set[int] | None = None
+    ) -> int:
+        """Give the stock of the lines whose reservation expired back and remove them from their orders, for the
+        orders of the `batch_size` first expired reservations. Return the number of removed lines.
+
+        Expired reservations are found on the `expires_at` index, and each step handles the whole batch in a
+        statement, so a sweep costs the same number of queries whatever the number of orders. Orders locked by a
+        line change are skipped, a later sweep releases them (unless the change extended the reservation).
+        When given, the ids of the skipped orders are added to `skipped`, and the orders in it are not looked at:
+        a batch of locked orders releases nothing, but the next batch gets past them
+        """
+        now = now or timezone.now()
+        with transaction.atomic():
+            expired = cls.objects.filter(expires_at__lte=now)
+            if skipped:
+                expired = expired.exclude(line__purchace_order_id__in=skipped)
+            expired_orders = set(
+                expired.order_by("expires_at").values_list("line__purchace_order_id", flat=True)[:batch_size]
+            )
+            # same lock order as line changes: orders, then stock
+            order_ids = list(
+                PurchaceOrder.objects.select_for_update(skip_locked=True)
+                .filter(pk__in=sorted(expired_orders))
+                .order_by("pk")
+                .values_list("pk", flat=True)
+            )
+            if skipped is not None:
+                skipped.update(expired_orders.difference(order_ids))
+            lines = list(
+                OrderArticle.objects.filter(purchace_order_id__in=order_ids, reservation__expires_at__lte=now)
+                .order_by("pk")
+                .values_list("pk", "article_id")
+            )
+            if not lines:
+                return 0
+            line_ids = [line_id for line_id, _ in lines]
+            article_ids = sorted({article_id for _, article_id in lines})
+            # lock in article_id order so concurrent sweeps cannot deadlock each other
+            list(
+                InventoryArticle.objects.select_for_update()
+                .filter(article_id__in=article_ids)
+                .order_by("article_id")
+                .values_list("pk", flat=True)
+            )
+            placeholders = ", ".join(["%s"] * len(line_ids))
+            OrderArticle.restock(f"`id` IN ({placeholders})", line_ids)
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM `{cls._meta.db_table}` WHERE `line_id` IN ({placeholders})", line_ids)
+                cursor.execute(f"DELETE FROM `{OrderArticle._meta.db_table}` WHERE `id` IN ({placeholders})", line_ids)
+            PurchaceOrder.rebuild_totals(order_ids)
+        article_cache.invalidate(*article_ids)
+        return len(line_ids)
 
 
 class JSON_ObjectAgg(models.aggregates.Aggregate):
@@ -150,6 +539,7 @@ class DetailedPurchaceOrder(models.Model):
 
     @classmethod
     def aggregate_order(cls, order_id: int) -> dict | None:
+        """Compute the order totals from its lines, PurchaceOrder keeps them precomputed"""
         return (
             cls.objects.filter(pk=order_id)
             .annotate(
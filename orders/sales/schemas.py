@@ -1,6 +1,8 @@
 from datetime import datetime, date
 from ninja import Schema
 
+from inventory.projection import RowSchema
+
 
 class TaxSchema(Schema):
     reference: str
@@ -13,13 +15,23 @@ class CategoryTaxScheme(Schema):
     valid_from: date
 
 
-class OrderBasicSchema(Schema):
+class OrderLineInput(Schema):
+    article_id: int
+    quantity: int
+
+
+class OrderCreateInput(Schema):
+    reference: str
+    lines: list[OrderLineInput]
+
+
+class OrderBasicSchema(RowSchema):
     id: int
     reference: str
     created_at: datetime
 
 
-class OrderSchema(Schema):
+class OrderSchema(RowSchema):
     id: int
     reference: str
     created_at: datetime
@@ -27,3 +39,4 @@ class OrderSchema(Schema):
     articles: dict[str, int]  # TODO: find a better way to display this in the api docs
     total_pre_tax: float
     total_taxed: float
+    checked_out_at: datetime | None
@@ -4,19 +4,42 @@
 - FullArticle inherits category tax
 - FullArticle inherits most recent category tax
 - FullArticle inherits most recent active category tax: not future ones
+- Assigning a tax invalidates the cached articles of the category
 - Purchace:
     - test add aricle: when amount in stock and not
     - test update article: increase ok and not
     - test remove article: when amount is valid and not
-    - test cancel purchace
+    - test cancel purchace: query count does not depend on the number of articles, sharded stock is returned to a slot
+    - test concurrent checkouts of a hot article: no oversell, no lost updates, with and without stock slots
+    - test create an order with its lines: all the stock or none, taxed like added lines, in constant queries
+    - test stock reservations: expired lines go back to the stock in constant queries, checked out orders keep theirs
+      and sweeps get past orders locked by line changes
     - test total order value
+    - test order totals are stored on the order: updated on line changes, read with a single query
+    - test order totals consistency check: no drift after line changes, drift is reported and rebuilt
     - test tax: for recent and old
-    - TODO: order price should account for article price upon order creation
+    - test order lines keep the price and tax of when they were added: later price changes do not count, removals too
 """
 
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
 import pytest
-from sales.models import Tax, CategoryTax, OrderArticle, PurchaceOrder
-from inventory.models import FullArticle
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils.timezone import now
+from sales.models import Tax, CategoryTax, OrderArticle, PurchaceOrder, DetailedPurchaceOrder, StockReservation
+from inventory.models import FullArticle, InventoryArticle, StockSlot
+
+
+def total_stock(article_id: int) -> int:
+    """Stock of the article, slots included"""
+    slots = StockSlot.objects.filter(article_id=article_id).aggregate(total=Sum("quantity"))["total"] or 0
+    return InventoryArticle.objects.get(article_id=article_id).quantity + slots
 
 
 def test_tax(tax_0_21: Tax, tax_0_12: Tax, tax_0_0: Tax):
@@ -61,6 +84,19 @@ def test_fullarticle_cat_recent_active_tax(
     assert float(fl.tax) == taxed_category_active.tax.value
 
 
+def test_assign_tax_invalidates_cached_articles(
+    client, article1, priced_article_recent, tax_0_21, django_capture_on_commit_callbacks
+):
+    assert client.get(f"/api/inventory/article/{article1.pk}").json()["tax"] is None
+    with django_capture_on_commit_callbacks(execute=True):
+        response = client.post(
+            "/api/sales/taxes/assign",
+            {"tax": tax_0_21.reference, "category": article1.category_id, "valid_from": "2010-01-01"},
+        )
+    assert response.status_code == 200
+    assert client.get(f"/api/inventory/article/{article1.pk}").json()["tax"] == float(tax_0_21.value)
+
+
 ############# Edit Order
 def test_purchace_order_add_article_ok(db, purchace_order_recent, inventory_article_10):
     """Article removed from stock and added to order"""
@@ -176,19 +212,233 @@ def test_purchace_order_remove_article_not_enough_in_order(db, purchace_order_re
         )
 
 
-def test_cancel_order(db, purchace_order_recent, inventory_article_10):
+@pytest.mark.parametrize("slots", [0, 3])
+def test_cancel_order(db, purchace_order_recent, inventory_article_10, slots):
     old_stock = inventory_article_10.quantity
+    InventoryArticle.shard(article_id=inventory_article_10.article_id, slots=slots)
     purchace_order_recent.update_article(
         article_id=inventory_article_10.article_id,
         quantity=1,
     )
     purchace_order_recent.cancel_order()
-    inventory_article_10.refresh_from_db()
-    assert inventory_article_10.quantity == old_stock
+    assert total_stock(inventory_article_10.article_id) == old_stock
     assert OrderArticle.objects.count() == 0
     assert PurchaceOrder.objects.count() == 0
 
 
+def test_cancel_order_constant_queries(
+    db, user, article_factory, inventory_article_factory, django_assert_max_num_queries
+):
+    queries = []
+    for size in (1, 20):
+        order = PurchaceOrder.objects.create(reference=f"cancel-{size}", created_by=user)
+        inventory = [
+            inventory_article_factory.create(article=article_factory.create(reference=f"cancel-{size}-{i}"))
+            for i in range(size)
+        ]
+        for inventory_article in inventory:
+            order.update_article(article_id=inventory_article.article_id, quantity=2)
+
+        # savepoint, lock order, restock (articles, then slots), delete reservations, delete lines,
+        # collect the already deleted lines, delete order, release savepoint
+        with django_assert_max_num_queries(9) as captured:
+            order.cancel_order()
+        queries.append(len(captured))
+
+        for inventory_article in inventory:
+            inventory_article.refresh_from_db()
+            assert inventory_article.quantity == 10
+    assert queries[0] == queries[1]
+    assert OrderArticle.objects.count() == 0
+    assert PurchaceOrder.objects.count() == 0
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize("slots", [0, 4])
+def test_purchace_order_concurrent_add_article(user, inventory_article_10, slots):
+    """Twice as many single unit checkouts as there is stock, spread over two orders"""
+    workers = inventory_article_10.quantity * 2
+    InventoryArticle.shard(article_id=inventory_article_10.article_id, slots=slots)
+    orders = [PurchaceOrder.objects.create(reference=f"concurrent-{i}", created_by=user) for i in range(2)]
+    barrier = threading.Barrier(workers)
+
+    def checkout(order: PurchaceOrder) -> bool:
+        try:
+            barrier.wait()
+            order.update_article(article_id=inventory_article_10.article_id, quantity=1)
+            return True
+        except ValueError:
+            return False
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        outcomes = list(pool.map(checkout, [orders[i % 2] for i in range(workers)]))
+
+    sold = OrderArticle.objects.aggregate(total=Sum("quantity"))["total"]
+    assert outcomes.count(True) == 10
+    assert sold == 10
+    assert total_stock(inventory_article_10.article_id) == 0
+    assert OrderArticle.objects.count() == 2
+
+
+def test_create_order_with_lines(
+    user,
+    inventory_article_10,
+    priced_article_recent,
+    taxed_category_active,
+    tax_0_12,
+    article_factory,
+    inventory_article_factory,
+    priced_article_factory,
+    django_assert_max_num_queries,
+):
+    # savepoint, create order, stock batch (savepoint, lock, update, release), insert lines, article references,
+    # insert reservations, update totals, release savepoint: the same for 1 and 20 lines
+    queries = []
+    for size in (1, 20):
+        articles = [article_factory.create(reference=f"sized-{size}-{i}") for i in range(size)]
+        for article in articles:
+            priced_article_factory.create(article=article)
+            inventory_article_factory.create(article=article)
+        with django_assert_max_num_queries(11) as captured:
+            PurchaceOrder.create_with_lines(
+                reference=f"sized-{size}", created_by_id=user.pk, lines=[(article.pk, 1) for article in articles]
+            )
+        queries.append(len(captured))
+    assert queries[0] == queries[1]
+    assert PurchaceOrder.totals_drift() == []
+
+    others = [
+        inventory_article_factory.create(article=article_factory.create(reference=f"bulk-{i}")) for i in range(8)
+    ]
+    lines = [(inventory_article.article_id, 1) for inventory_article in others]
+    lines += [(inventory_article_10.article_id, 2), (inventory_article_10.article_id, 1)]
+    # lines are taxed with the tax in force when the order is created, the most recent one
+    CategoryTax.objects.create(
+        category_id=taxed_category_active.category_id, tax=tax_0_12, valid_from=now() - timedelta(days=1)
+    )
+    order = PurchaceOrder.create_with_lines(reference="bulk", created_by_id=user.pk, lines=lines)
+
+    price = Decimal(str(priced_article_recent.price))
+    tax = Decimal(str(tax_0_12.value))
+    assert OrderArticle.objects.filter(purchace_order=order).count() == 9
+    assert StockReservation.objects.filter(line__purchace_order=order).count() == 9
+    assert total_stock(inventory_article_10.article_id) == 7
+    assert order.get_details()["articles"] == {inventory_article_10.article.reference: 3}
+    assert order.get_details()["total_taxed"] == (price + price * tax) * 3
+    assert PurchaceOrder.totals_drift() == []
+
+    with pytest.raises(ValueError, match=f"Article {inventory_article_10.article_id} out of stock"):
+        PurchaceOrder.create_with_lines(
+            reference="too-much",
+            created_by_id=user.pk,
+            lines=[(others[0].article_id, 1), (inventory_article_10.article_id, 8)],
+        )
+    assert total_stock(others[0].article_id) == 9
+    assert not PurchaceOrder.objects.filter(reference="too-much").exists()
+
+
+def test_create_order_with_lines_api(client, user_factory, inventory_article_10):
+    user_factory.create(id=1)  # the API creates orders as the super user
+    lines = [{"article_id": inventory_article_10.article_id, "quantity": 4}]
+    response = client.post(
+        "/api/sales/order/createwithlines", {"reference": "bulk", "lines": lines}, content_type="application/json"
+    )
+    assert response.status_code == 201
+    assert response.json()["reference"] == "bulk"
+    assert total_stock(inventory_article_10.article_id) == 6
+    response = client.post(
+        "/api/sales/order/createwithlines", {"reference": "bulk", "lines": lines}, content_type="application/json"
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Duplicate"
+
+
+def test_stock_reservation_expiry(
+    user,
+    inventory_article_10,
+    priced_article_recent,
+    taxed_category_active,
+    article_factory,
+    inventory_article_factory,
+    django_assert_max_num_queries,
+):
+    other = inventory_article_factory.create(article=article_factory.create(reference="reserved-other"))
+    abandoned = [PurchaceOrder.objects.create(reference=f"abandoned-{i}", created_by=user) for i in range(3)]
+    for order in abandoned:
+        order.update_article(article_id=inventory_article_10.article_id, quantity=2)
+        order.update_article(article_id=other.article_id, quantity=1)
+    confirmed = PurchaceOrder.objects.create(reference="confirmed", created_by=user)
+    confirmed.update_article(article_id=inventory_article_10.article_id, quantity=3)
+    confirmed.checkout()
+    with pytest.raises(ValueError, match="Order already checked out"):
+        confirmed.checkout()
+    assert StockReservation.objects.count() == 6
+    assert total_stock(inventory_article_10.article_id) == 1
+
+    assert StockReservation.release_expired(now=now()) == 0
+    # select expired orders, lock them, their expired lines, lock the stock, restock (articles, then slots),
+    # delete reservations, delete lines, rebuild totals (plus the savepoint)
+    with django_assert_max_num_queries(11):
+        released = StockReservation.release_expired(now=now() + timedelta(days=1))
+    assert released == 6
+    assert total_stock(inventory_article_10.article_id) == 7
+    assert total_stock(other.article_id) == 10
+    assert list(OrderArticle.objects.values_list("purchace_order_id", "quantity")) == [(confirmed.pk, 3)]
+    assert PurchaceOrder.objects.get(pk=abandoned[0].pk).article_quantities == {}
+    assert PurchaceOrder.totals_drift() == []
+    assert StockReservation.release_expired(now=now() + timedelta(days=1)) == 0
+
+
+def test_release_expired_reservations_command(settings, purchace_order_recent, inventory_article_10):
+    settings.SALES_RESERVATION_SECONDS = 0
+    purchace_order_recent.update_article(article_id=inventory_article_10.article_id, quantity=4)
+    call_command("release_expired_reservations", "--batch-size", "1")
+    assert total_stock(inventory_article_10.article_id) == 10
+    assert OrderArticle.objects.count() == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_release_expired_reservations_past_locked_orders(settings, user, inventory_article_10):
+    """The first batch only has an order locked by a line change, the sweep goes on with the next ones"""
+    settings.SALES_RESERVATION_SECONDS = 0
+    orders = [PurchaceOrder.objects.create(reference=f"expired-{i}", created_by=user) for i in range(3)]
+    for order in orders:
+        order.update_article(article_id=inventory_article_10.article_id, quantity=1)
+    locked, done = threading.Event(), threading.Event()
+
+    def change_lines():
+        try:
+            with transaction.atomic():
+                PurchaceOrder.objects.select_for_update().get(pk=orders[0].pk)
+                locked.set()
+                done.wait(timeout=10)
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=change_lines)
+    thread.start()
+    try:
+        locked.wait(timeout=10)
+        call_command("release_expired_reservations", "--batch-size", "1")
+    finally:
+        done.set()
+        thread.join()
+    assert list(OrderArticle.objects.values_list("purchace_order_id", flat=True)) == [orders[0].pk]
+    assert total_stock(inventory_article_10.article_id) == 9
+
+
+def test_checkout_api(client, purchace_order_recent, inventory_article_10):
+    purchace_order_recent.update_article(article_id=inventory_article_10.article_id, quantity=2)
+    response = client.post(f"/api/sales/order/checkout/{purchace_order_recent.reference}")
+    assert response.status_code == 200
+    assert response.json()["checked_out_at"] is not None
+    assert StockReservation.objects.count() == 0
+    assert client.post(f"/api/sales/order/checkout/{purchace_order_recent.reference}").status_code == 400
+    assert client.post("/api/sales/order/checkout/missing").status_code == 404
+
+
 ############# Calculate Total and Taxes
 def test_purchace_order_total_value(
     purchace_order_recent, inventory_article_10, priced_article_recent, taxed_category_active
@@ -225,3 +475,80 @@ def test_purchace_order_total_value_taxed_old(
     total = priced_article_recent.price * add_amount
     tax = total * taxed_category_obsolete.tax.value
     assert float(purchace_order_old.get_details()["total_taxed"]) == tax + total
+
+
+def test_purchace_order_price_at_order_time(
+    purchace_order_recent, inventory_article_10, priced_article_recent, priced_article_factory, taxed_category_active
+):
+    purchace_order_recent.update_article(article_id=inventory_article_10.article_id, quantity=2)
+    priced_article_factory.create(article=inventory_article_10.article, price=20)
+    purchace_order_recent.update_article(article_id=inventory_article_10.article_id, quantity=1)
+
+    price = Decimal(str(priced_article_recent.price))
+    line = OrderArticle.objects.get()
+    assert line.unit_price == price
+    assert line.tax_rate == Decimal(str(taxed_category_active.tax.value))
+    assert DetailedPurchaceOrder.aggregate_order(purchace_order_recent.pk)["total_pre_tax"] == price * 3
+    assert purchace_order_recent.get_details()["total_pre_tax"] == price * 3
+    assert PurchaceOrder.totals_drift() == []
+
+    # removed units are taken off at the price of the line too, not at the current one
+    purchace_order_recent.update_article(article_id=inventory_article_10.article_id, quantity=-1)
+    assert purchace_order_recent.get_details()["total_pre_tax"] == price * 2
+    assert PurchaceOrder.totals_drift() == []
+
+
+def test_purchace_order_stored_totals(
+    purchace_order_recent,
+    inventory_article_10,
+    priced_article_recent,
+    taxed_category_active,
+    django_assert_num_queries,
+):
+    purchace_order_recent.update_article(article_id=inventory_article_10.article_id, quantity=3)
+    purchace_order_recent.update_article(article_id=inventory_article_10.article_id, quantity=-1)
+    purchace_order_recent.refresh_from_db()
+    price = Decimal(str(priced_article_recent.price))
+    tax = Decimal(str(taxed_category_active.tax.value))
+    assert purchace_order_recent.article_quantities == {inventory_article_10.article.reference: 2}
+    assert purchace_order_recent.total_pre_tax == price * 2
+    assert purchace_order_recent.total_taxed == (price + price * tax) * 2
+    with django_assert_num_queries(1):
+        details = purchace_order_recent.get_details()
+    assert details["articles"] == purchace_order_recent.article_quantities
+
+    purchace_order_recent.update_article(article_id=inventory_article_10.article_id, quantity=-2)
+    purchace_order_recent.refresh_from_db()
+    assert purchace_order_recent.article_quantities == {}
+    assert purchace_order_recent.total_pre_tax == 0
+    assert purchace_order_recent.total_taxed == 0
+
+
+def test_purchace_order_totals_check(
+    purchace_order_recent, inventory_article_10, priced_article_recent, taxed_category_active
+):
+    purchace_order_recent.update_article(article_id=inventory_article_10.article_id, quantity=3)
+    call_command("rebuild_order_totals", "--check")
+
+    PurchaceOrder.objects.filter(pk=purchace_order_recent.pk).update(total_pre_tax=0)
+    with pytest.raises(CommandError, match=f"1 orders drifted: {purchace_order_recent.pk}"):
+        call_command("rebuild_order_totals", "--check")
+    call_command("rebuild_order_totals")
+    assert PurchaceOrder.totals_drift() == []
+
+
+def test_order_details_api(
+    client, purchace_order_recent, inventory_article_10, priced_article_recent, taxed_category_active
+):
+    purchace_order_recent.update_article(article_id=inventory_article_10.article_id, quantity=2)
+    response = client.get("/api/sales/order/view/ignored", {"order_id": purchace_order_recent.pk})
+    assert response.status_code == 200
+    assert response.json()["articles"] == {inventory_article_10.article.reference: 2}
+    assert response.json()["total_pre_tax"] == priced_article_recent.price * 2
+
+
+def test_list_orders_api(client, user, purchace_order_recent):
+    PurchaceOrder.objects.create(reference="another-order", created_by=user)
+    page = client.get("/api/sales/orders", {"limit": 1}).json()
+    assert page["count"] == 2
+    assert [item["reference"] for item in page["items"]] == [purchace_order_recent.reference]